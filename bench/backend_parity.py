@@ -0,0 +1,139 @@
+"""
+Check that an exported YOLO backend matches eager PyTorch, and time both.
+
+    python bench/backend_parity.py --weights yolo-inference/models/text/best.pt --backend onnx --threads 4
+    python bench/backend_parity.py --weights yolo-inference/models/interactive/best.pt --backend torchscript \
+        --images shots/*.png
+
+Runs on CPU. Without --images it uses synthetic 1080p screenshots, which only
+exercise the plumbing; pass real screenshots for a meaningful comparison.
+Detections are matched greedily by IoU within each class; the script exits
+non-zero when counts differ or a matched box/confidence is outside tolerance.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "yolo-inference", "src"))
+
+from backends import BACKENDS, load_model, registry_entry, tune_threads  # noqa: E402
+from screens import RESOLUTIONS, synthetic_screenshot  # noqa: E402
+
+
+def _detections(model: Any, img: Image.Image, imgsz: int, conf: float, iou: float) -> Tuple[np.ndarray, float]:
+    t0 = time.perf_counter()
+    r = model.predict(source=img, imgsz=imgsz, conf=conf, iou=iou, device="cpu", verbose=False)[0]
+    elapsed = time.perf_counter() - t0
+    if r.boxes is None or len(r.boxes) == 0:
+        return np.zeros((0, 6), dtype=np.float32), elapsed
+    # x1, y1, x2, y2, conf, cls
+    return r.boxes.data.cpu().numpy().astype(np.float32), elapsed
+
+
+def _iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def _compare(ref: np.ndarray, out: np.ndarray) -> Dict[str, Any]:
+    """Greedy same-class IoU matching of `out` against `ref`, highest confidence first."""
+    used = np.zeros(len(out), dtype=bool)
+    box_err: List[float] = []
+    conf_err: List[float] = []
+    unmatched = 0
+    for det in ref[np.argsort(-ref[:, 4])]:
+        candidates = np.flatnonzero(~used & (out[:, 5] == det[5])) if len(out) else np.array([], dtype=int)
+        if len(candidates) == 0:
+            unmatched += 1
+            continue
+        ious = _iou(det, out[candidates])
+        best = candidates[int(np.argmax(ious))]
+        if ious.max() < 0.5:
+            unmatched += 1
+            continue
+        used[best] = True
+        box_err.append(float(np.abs(out[best, :4] - det[:4]).max()))
+        conf_err.append(float(abs(out[best, 4] - det[4])))
+    return {
+        "ref_count": int(len(ref)),
+        "count": int(len(out)),
+        "unmatched": unmatched + int((~used).sum()),
+        "max_box_err_px": max(box_err, default=0.0),
+        "max_conf_err": max(conf_err, default=0.0),
+    }
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--weights", required=True, help="the .pt registry path")
+    ap.add_argument("--backend", choices=[b for b in BACKENDS if b != "torch"], default="onnx")
+    ap.add_argument("--threads", type=int, default=0)
+    ap.add_argument("--imgsz", type=int, default=640)
+    ap.add_argument("--conf", type=float, default=0.25)
+    ap.add_argument("--iou", type=float, default=0.45)
+    ap.add_argument("--images", nargs="*", default=[])
+    ap.add_argument("--synthetic", type=int, default=4, help="synthetic screenshots when no --images")
+    ap.add_argument("--box-tol", type=float, default=2.0, help="max box coordinate difference in pixels")
+    ap.add_argument("--conf-tol", type=float, default=0.02)
+    args = ap.parse_args()
+
+    if args.images:
+        images = [Image.open(p).convert("RGB") for p in args.images]
+    else:
+        w, h = RESOLUTIONS["1080p"]
+        images = [synthetic_screenshot(w, h, seed=i) for i in range(args.synthetic)]
+
+    ref_entry = registry_entry("ref", {"path": args.weights, "threads": args.threads, "imgsz": args.imgsz})
+    entry = registry_entry("candidate", {
+        "path": args.weights, "backend": args.backend, "threads": args.threads, "imgsz": args.imgsz,
+    })
+    ref_model = load_model(ref_entry)
+    model = load_model(entry)
+
+    # warm both, then apply thread settings the way the server does
+    for m, e in ((ref_model, ref_entry), (model, entry)):
+        _detections(m, images[0], args.imgsz, args.conf, args.iou)
+        tune_threads(m, e)
+
+    per_image = []
+    ref_times: List[float] = []
+    times: List[float] = []
+    for i, img in enumerate(images):
+        ref, ref_s = _detections(ref_model, img, args.imgsz, args.conf, args.iou)
+        out, out_s = _detections(model, img, args.imgsz, args.conf, args.iou)
+        ref_times.append(ref_s)
+        times.append(out_s)
+        per_image.append({"image": args.images[i] if args.images else f"synthetic-{i}", **_compare(ref, out)})
+
+    failed = [
+        r for r in per_image
+        if r["unmatched"] or r["max_box_err_px"] > args.box_tol or r["max_conf_err"] > args.conf_tol
+    ]
+    print(json.dumps({
+        "backend": args.backend,
+        "threads": args.threads,
+        "imgsz": args.imgsz,
+        "torch_ms": round(statistics.median(ref_times) * 1000, 2),
+        "backend_ms": round(statistics.median(times) * 1000, 2),
+        "speedup": round(statistics.median(ref_times) / max(statistics.median(times), 1e-9), 2),
+        "passed": not failed,
+        "images": per_image,
+    }, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
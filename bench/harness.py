@@ -0,0 +1,366 @@
+"""
+Load-test the inference services and report latency, throughput and memory as JSON.
+
+    # in-process, with tiny randomly initialized stand-in models (no weights needed)
+    python bench/harness.py --service yolo classifier pyservice --concurrency 1 4 16
+    # against a server already running on a local port
+    python bench/harness.py --service yolo --url http://127.0.0.1:4420 --pid 12345 --param model_name=textregions
+
+In-process, each service's FastAPI app is imported with its model registry
+pointed at stand-in weights written to a temp dir, the result cache turned off
+(RESULT_CACHE_MAX_MB=0) and served by uvicorn on a free local port in a
+background thread; several services run one after another in child processes.
+Requests are octet-stream uploads of synthetic screenshots (several distinct
+images per resolution), sent from `concurrency` client threads.
+
+For every (endpoint, resolution, concurrency) the report has p50/p95/p99 and
+mean latency, throughput, errors and the server's peak RSS during the run
+(sampled from /proc; in-process that includes the client threads).
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from screens import RESOLUTIONS, encode_png, synthetic_screenshot
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# src dirs (first one holds the app module), app module, readiness route, default endpoints
+SERVICES: Dict[str, Dict[str, Any]] = {
+    "yolo": {
+        "src": ["yolo-inference/src"],
+        "module": "server",
+        "ready": "/health",
+        "endpoints": ["/yolo_predictions"],
+    },
+    "classifier": {
+        "src": ["classifier-inference/src"],
+        "module": "server",
+        "ready": "/health",
+        "endpoints": ["/classifier_predictions"],
+    },
+    "pyservice": {
+        "src": ["pyservice/src", "yolo-inference/src"],
+        "module": "serve",
+        "ready": "/ready",
+        # Detectron2 and PaddleOCR have no stand-ins; point --url at a real server for those
+        "endpoints": ["/predict_textregions", "/predict_interactive"],
+    },
+}
+
+STANDIN_MODEL = "standin"
+STANDIN_CLASSES = ["button", "heading", "input", "link"]
+
+
+# -------------------------- stand-in models -------------------------- #
+
+
+def _standin_yolo(workdir: str, config: str) -> str:
+    """Randomly initialized ultralytics detector built from a bundled model yaml."""
+    from ultralytics import YOLO
+
+    path = os.path.join(workdir, "standin-yolo.pt")
+    YOLO(config).save(path)
+    return path
+
+
+def _standin_classifier(workdir: str, arch: str, image_size: int) -> str:
+    """Model dir in the layout classifier-inference expects, with random timm weights."""
+    import timm
+    import torch
+
+    model_dir = os.path.join(workdir, "standin-classifier")
+    os.makedirs(model_dir, exist_ok=True)
+    model = timm.create_model(arch, pretrained=False, num_classes=len(STANDIN_CLASSES))
+    torch.save(model.state_dict(), os.path.join(model_dir, "model_best.pth"))
+    with open(os.path.join(model_dir, "classes.json"), "w", encoding="utf-8") as f:
+        json.dump({str(i): name for i, name in enumerate(STANDIN_CLASSES)}, f)
+    with open(os.path.join(model_dir, "metrics.json"), "w", encoding="utf-8") as f:
+        json.dump({"model_name": arch, "image_size": image_size}, f)
+    return model_dir
+
+
+def _load_app(service: str, args: argparse.Namespace, workdir: str) -> Any:
+    spec = SERVICES[service]
+    for src in reversed(spec["src"]):
+        sys.path.insert(0, os.path.join(ROOT, src))
+    # every request should reach the model
+    os.environ.setdefault("RESULT_CACHE_MAX_MB", "0")
+    if service == "pyservice":
+        os.environ.setdefault("WARMUP_ENGINES", "textregions,interactive")
+
+    module = __import__(spec["module"])
+    if service == "yolo":
+        module.MODEL_REGISTRY.clear()
+        module.MODEL_REGISTRY[STANDIN_MODEL] = _standin_yolo(workdir, args.yolo_config)
+    elif service == "classifier":
+        module.MODEL_REGISTRY.clear()
+        module.MODEL_REGISTRY[STANDIN_MODEL] = {"dir": _standin_classifier(workdir, args.classifier_arch, args.classifier_imgsz)}
+    else:
+        # both engines on one file: the shared YOLO engine loads it once
+        path = _standin_yolo(workdir, args.yolo_config)
+        for name in module.YOLO_MODEL_PATHS:
+            module.YOLO_MODEL_PATHS[name] = path
+    return module.app
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _serve_in_process(app: Any) -> Tuple[str, Any]:
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-uvicorn", daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("in-process server failed to start")
+        time.sleep(0.05)
+    return f"http://127.0.0.1:{port}", server
+
+
+# -------------------------- measuring -------------------------- #
+
+
+class RssSampler(threading.Thread):
+    """Peak resident set size of `pid`, sampled from /proc every `interval` seconds."""
+
+    def __init__(self, pid: int, interval: float = 0.05) -> None:
+        super().__init__(name="bench-rss", daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak: Optional[int] = None
+        self._stop_event = threading.Event()
+
+    def _rss(self) -> Optional[int]:
+        try:
+            with open(f"/proc/{self.pid}/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def run(self) -> None:
+        while not self._stop_event.is_set():
+            rss = self._rss()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self._stop_event.wait(self.interval)
+
+    def stop(self) -> Optional[int]:
+        self._stop_event.set()
+        self.join()
+        return self.peak
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def _wait_ready(base_url: str, route: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if requests.get(base_url + route, timeout=5).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{base_url}{route} not ready after {timeout:.0f}s")
+        time.sleep(0.5)
+
+
+def _drive(
+    url: str,
+    images: List[bytes],
+    params: Dict[str, str],
+    concurrency: int,
+    total: int,
+) -> Tuple[List[float], int, float]:
+    """(latencies in ms of successful requests, error count, wall seconds)."""
+    local = threading.local()
+
+    def one(i: int) -> Tuple[float, bool]:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            r = session.post(
+                url,
+                data=images[i % len(images)],
+                params=params,
+                headers={"Content-Type": "application/octet-stream"},
+            )
+            ok = r.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return (time.perf_counter() - start) * 1000.0, ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+    return [ms for ms, ok in outcomes if ok], sum(1 for _, ok in outcomes if not ok), wall
+
+
+def run_service(service: str, args: argparse.Namespace) -> Dict[str, Any]:
+    spec = SERVICES[service]
+    params = dict(p.split("=", 1) for p in args.param)
+    workdir = None
+    server = None
+    if args.url:
+        base_url, pid = args.url.rstrip("/"), args.pid
+    else:
+        workdir = tempfile.mkdtemp(prefix=f"bench-{service}-")
+        base_url, server = _serve_in_process(_load_app(service, args, workdir))
+        pid = os.getpid()
+        if service in ("yolo", "classifier"):
+            params.setdefault("model_name", STANDIN_MODEL)
+
+    try:
+        _wait_ready(base_url, spec["ready"], args.ready_timeout)
+        images = {
+            res: [encode_png(synthetic_screenshot(*RESOLUTIONS[res], seed=seed)) for seed in range(args.images)]
+            for res in args.resolutions
+        }
+        results: List[Dict[str, Any]] = []
+        for endpoint in args.endpoint or spec["endpoints"]:
+            url = base_url + endpoint
+            for res in args.resolutions:
+                # loads the model and fills caches outside the measured window
+                _drive(url, images[res], params, 1, args.warmup)
+                for concurrency in args.concurrency:
+                    sampler = RssSampler(pid) if pid else None
+                    if sampler is not None:
+                        sampler.start()
+                    latencies, errors, wall = _drive(url, images[res], params, concurrency, args.requests)
+                    peak = sampler.stop() if sampler is not None else None
+                    results.append(
+                        {
+                            "endpoint": endpoint,
+                            "resolution": res,
+                            "concurrency": concurrency,
+                            "requests": args.requests,
+                            "errors": errors,
+                            "p50_ms": round(_percentile(latencies, 0.50), 2) if latencies else None,
+                            "p95_ms": round(_percentile(latencies, 0.95), 2) if latencies else None,
+                            "p99_ms": round(_percentile(latencies, 0.99), 2) if latencies else None,
+                            "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                            "throughput_rps": round(len(latencies) / wall, 2) if wall > 0 else None,
+                            "peak_rss_mb": round(peak / (1024 * 1024), 1) if peak else None,
+                        }
+                    )
+                    print(json.dumps({"service": service, **results[-1]}), file=sys.stderr)
+    finally:
+        if server is not None:
+            server.should_exit = True
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "service": service,
+        "mode": "url" if args.url else "in_process",
+        "url": base_url,
+        "params": params,
+        "results": results,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _run_child(service: str, argv: List[str]) -> Dict[str, Any]:
+    """One in-process service per child process, so module names and memory don't mix."""
+    fd, out = tempfile.mkstemp(prefix=f"bench-{service}-", suffix=".json")
+    os.close(fd)
+    try:
+        subprocess.run([sys.executable, os.path.abspath(__file__), *argv, "--service", service, "--out", out], check=True)
+        with open(out, encoding="utf-8") as f:
+            return json.load(f)["services"][0]
+    finally:
+        os.remove(out)
+
+
+def _strip_args(argv: List[str], flags: Tuple[str, ...]) -> List[str]:
+    """argv without `flags` and their values."""
+    kept: List[str] = []
+    skipping = False
+    for arg in argv:
+        if arg.startswith("--"):
+            skipping = arg.split("=", 1)[0] in flags
+            if skipping:
+                continue
+        elif skipping:
+            continue
+        kept.append(arg)
+    return kept
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--service", nargs="+", default=["yolo"], choices=sorted(SERVICES))
+    parser.add_argument("--url", help="base URL of a running server instead of starting one in-process")
+    parser.add_argument("--pid", type=int, help="server pid to sample RSS from when using --url")
+    parser.add_argument("--endpoint", action="append", help="route to load-test (repeatable); defaults per service")
+    parser.add_argument("--param", action="append", default=[], help="extra key=value query params")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64, help="requests per (endpoint, resolution, concurrency)")
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--resolutions", nargs="+", default=["720p", "1080p", "4k"], choices=sorted(RESOLUTIONS))
+    parser.add_argument("--images", type=int, default=4, help="distinct screenshots per resolution")
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--yolo-config", default="yolo11n.yaml", help="ultralytics model yaml for the stand-in detector")
+    parser.add_argument("--classifier-arch", default="mobilenetv3_small_100", help="timm architecture for the stand-in classifier")
+    parser.add_argument("--classifier-imgsz", type=int, default=224)
+    parser.add_argument("--out", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.url and len(args.service) > 1:
+        parser.error("--url targets one service")
+
+    if len(args.service) > 1:
+        child_argv = _strip_args(sys.argv[1:], ("--service", "--out"))
+        services = [_run_child(service, child_argv) for service in args.service]
+    else:
+        services = [run_service(args.service[0], args)]
+
+    report = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "services": services,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Padding waste of OCR recognizer batches: arrival order vs aspect-ratio buckets.
+
+    python bench/ocr_padding.py
+    python bench/ocr_padding.py --clips 2000 --max-pixels 1966080
+
+Runs in-process (no server, no model): random text-line clip shapes, batched
+the old way (arrival order, 32 per batch) and with pyservice's
+`ocr_batching.plan_batches`. Reports the padded pixels the recognizer would
+see, the useful fraction of them and the largest single batch.
+"""
+import argparse
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+import numpy as np
+
+# pyservice/src, and yolo-inference/src for the modules it shares (as pyservice's run-server.sh does)
+for _src in (("yolo-inference", "src"), ("pyservice", "src")):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", *_src))
+
+from ocr_batching import OCR_BATCH_MAX_PIXELS, OCR_MAX_BATCH_SIZE, OCR_REC_HEIGHT, padded_width, plan_batches  # noqa: E402
+
+
+def random_clips(n: int, seed: int) -> List[np.ndarray]:
+    """Text-line crops: single words to full-width lines, 12-40px tall."""
+    rng = np.random.default_rng(seed)
+    heights = rng.integers(12, 41, size=n)
+    # log-uniform aspect ratios between 1:1 and 60:1
+    aspects = np.exp(rng.uniform(0, np.log(60), size=n))
+    # only the shapes matter; broadcast views keep this cheap
+    pixel = np.zeros((1, 1, 3), dtype=np.uint8)
+    return [np.broadcast_to(pixel, (int(h), max(1, int(h * a)), 3)) for h, a in zip(heights, aspects)]
+
+
+def measure(clips: List[np.ndarray], batches: List[List[int]]) -> Dict[str, Any]:
+    widths = [padded_width(c) for c in clips]
+    padded = [len(b) * OCR_REC_HEIGHT * max(widths[i] for i in b) for b in batches]
+    useful = sum(OCR_REC_HEIGHT * w for w in widths)
+    return {
+        "batches": len(batches),
+        "padded_mpx": round(sum(padded) / 1e6, 2),
+        "useful_fraction": round(useful / max(1, sum(padded)), 3),
+        "largest_batch_mpx": round(max(padded) / 1e6, 2) if padded else 0.0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clips", type=int, nargs="+", default=[50, 500, 2000])
+    parser.add_argument("--max-pixels", type=int, default=OCR_BATCH_MAX_PIXELS)
+    parser.add_argument("--max-batch", type=int, default=OCR_MAX_BATCH_SIZE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    for n in args.clips:
+        clips = random_clips(n, args.seed)
+        arrival = [list(range(i, min(i + 32, n))) for i in range(0, n, 32)]
+        results.append({
+            "clips": n,
+            "arrival": measure(clips, arrival),
+            "bucketed": measure(clips, plan_batches(clips, args.max_pixels, args.max_batch)),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
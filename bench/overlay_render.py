@@ -0,0 +1,116 @@
+"""
+Micro-benchmark of the detection overlay renderer against the old per-box PIL drawing.
+
+    python bench/overlay_render.py
+    python bench/overlay_render.py --boxes 10 100 1000 --resolution 4k --repeat 20
+
+Runs in-process (no server, no model): random boxes on a synthetic screenshot.
+Times the legacy `_draw_detections` loop, pyservice's `overlay.draw_detections`
+on a copy, and the same drawing in place on a preallocated array.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from PIL import ImageDraw, ImageFont
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyservice", "src"))
+
+from overlay import draw_detections  # noqa: E402
+from screens import RESOLUTIONS, synthetic_screenshot  # noqa: E402
+
+NAMES = ["button", "heading", "input", "link", "icon", "image", "text", "checkbox"]
+
+
+def legacy_draw_detections(pil_img, boxes, scores, classes, names, min_score=0.0, line_w=3):
+    """The renderer serve.py used before overlay.py, kept as the baseline."""
+    img = pil_img.copy()
+    draw = ImageDraw.Draw(img)
+    try:
+        font = ImageFont.load_default()
+    except Exception:
+        font = None
+
+    for (x1, y1, x2, y2), s, c in zip(boxes, scores, classes):
+        if s < min_score:
+            continue
+        label = str(c)
+        if names and 0 <= c < len(names):
+            label = f"{names[c]} {s:.2f}"
+        else:
+            label = f"{label} {s:.2f}"
+        draw.rectangle([x1, y1, x2, y2], outline=(0, 255, 0), width=line_w)
+        tw, th = draw.textbbox((0, 0), label, font=font)[2:]
+        bx, by = int(x1), int(max(0, y1 - th - 4))
+        draw.rectangle([bx, by, bx + tw + 6, by + th + 4], fill=(0, 0, 0))
+        draw.text((bx + 3, by + 2), label, fill=(255, 255, 255), font=font)
+    return img
+
+
+def random_detections(n: int, width: int, height: int, seed: int) -> Dict[str, Any]:
+    rng = np.random.default_rng(seed)
+    x1 = rng.uniform(0, width - 40, n)
+    y1 = rng.uniform(0, height - 20, n)
+    w = rng.uniform(20, 300, n)
+    h = rng.uniform(12, 80, n)
+    boxes = np.stack([x1, y1, np.minimum(x1 + w, width - 1), np.minimum(y1 + h, height - 1)], axis=1)
+    return {
+        "boxes": boxes.tolist(),
+        "scores": rng.uniform(0.5, 1.0, n).tolist(),
+        "classes": rng.integers(0, len(NAMES), n).tolist(),
+    }
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> List[float]:
+    fn()  # warm caches (fonts, glyphs)
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--boxes", type=int, nargs="+", default=[10, 100, 1000])
+    ap.add_argument("--resolution", choices=sorted(RESOLUTIONS), default="1080p")
+    ap.add_argument("--repeat", type=int, default=10)
+    args = ap.parse_args()
+
+    width, height = RESOLUTIONS[args.resolution]
+    page = synthetic_screenshot(width, height)
+    canvas = np.array(page)
+
+    results = []
+    for n in args.boxes:
+        det = random_detections(n, width, height, seed=n)
+        draw_args = (det["boxes"], det["scores"], det["classes"], NAMES)
+
+        timings = {
+            "legacy_pil": _time(lambda: legacy_draw_detections(page, *draw_args), args.repeat),
+            "vectorized": _time(lambda: draw_detections(page, *draw_args), args.repeat),
+            "vectorized_in_place": _time(lambda: draw_detections(canvas, *draw_args, in_place=True), args.repeat),
+        }
+        legacy_p50 = statistics.median(timings["legacy_pil"])
+        for name, samples in timings.items():
+            p50 = statistics.median(samples)
+            results.append({
+                "boxes": n,
+                "resolution": args.resolution,
+                "renderer": name,
+                "p50_ms": round(p50, 3),
+                "min_ms": round(min(samples), 3),
+                "speedup": round(legacy_p50 / p50, 2) if p50 else None,
+            })
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import io
+from typing import Dict, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+RESOLUTIONS: Dict[str, Tuple[int, int]] = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+
+def synthetic_screenshot(width: int, height: int, seed: int = 0) -> Image.Image:
+    """A UI-ish page: flat background, coloured blocks and short text runs."""
+    rng = np.random.default_rng(seed)
+    img = Image.new("RGB", (width, height), (245, 245, 245))
+    draw = ImageDraw.Draw(img)
+    for _ in range(max(1, width * height // 20000)):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        w, h = int(rng.integers(20, 400)), int(rng.integers(10, 80))
+        fill = tuple(int(c) for c in rng.integers(0, 256, 3))
+        draw.rectangle([x, y, x + w, y + h], fill=fill)
+        draw.text((x + 4, y + 2), "Lorem ipsum dolor", fill=(0, 0, 0))
+    return img
+
+
+def encode_png(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
@@ -0,0 +1,141 @@
+"""
+Data-parallel scaling of the classifier training job on CPU.
+
+    python bench/train_scaling.py
+    python bench/train_scaling.py --procs 1 2 4 8 --model-name vit_tiny_patch16_224 --images-per-class 256
+
+Writes a synthetic ImageFolder dataset (UI-element-like crops) to a temp dir
+and runs packages/classifier-prep/job/train.py under torchrun with 1, 2, 4...
+gloo ranks (CUDA hidden, randomly initialized weights, so no download). Each
+rank gets the node's cores divided by the rank count unless
+--threads-per-process is set.
+
+Times come from the job's JSON event lines as they arrive: the first epoch
+(warmup) is reported on its own, and steady-state images/sec is measured
+over the later epochs, validation included. Speedup and efficiency are
+relative to the 1-process run.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from screens import synthetic_screenshot
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+TRAIN_SCRIPT = os.path.join(ROOT, "packages", "classifier-prep", "job", "train.py")
+
+CLASSES = ["button", "heading", "input", "link"]
+
+
+def write_dataset(root: str, images_per_class: int, seed: int) -> None:
+    """train/ and val/ ImageFolder trees of crop-sized synthetic images (val gets a quarter as many)."""
+    for split, count in (("train", images_per_class), ("val", max(1, images_per_class // 4))):
+        for c, name in enumerate(CLASSES):
+            folder = os.path.join(root, split, name)
+            os.makedirs(folder, exist_ok=True)
+            for i in range(count):
+                img_seed = seed + c * 100_000 + i + (50_000 if split == "val" else 0)
+                # class-dependent shapes: wide buttons and headings, squarer inputs and links
+                width = 96 + (img_seed * 37) % (160 if c < 2 else 64)
+                height = 32 + (img_seed * 11) % 48
+                synthetic_screenshot(width, height, seed=img_seed).save(os.path.join(folder, f"{i:05d}.png"))
+
+
+def run(procs: int, data: str, args: argparse.Namespace) -> Dict[str, Any]:
+    model_dir = tempfile.mkdtemp(prefix=f"train-scaling-{procs}-")
+    cmd = [
+        sys.executable, "-m", "torch.distributed.run", "--standalone", f"--nproc_per_node={procs}",
+        TRAIN_SCRIPT,
+        "--train-dir", os.path.join(data, "train"),
+        "--val-dir", os.path.join(data, "val"),
+        "--model-dir", model_dir,
+        "--model-name", args.model_name,
+        "--image-size", str(args.image_size),
+        "--epochs", str(args.epochs),
+        "--batch-size", str(args.batch_size),
+        "--num-workers", str(args.num_workers),
+        "--threads-per-process", str(args.threads_per_process),
+        "--no-pretrained",
+    ]
+    env = {**os.environ, "CUDA_VISIBLE_DEVICES": "", "DIST_BACKEND": "gloo"}
+
+    t0 = time.perf_counter()
+    started: Optional[float] = None
+    epoch_ends: List[float] = []
+    info: Dict[str, Any] = {}
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.PIPE, text=True)
+    assert proc.stdout is not None
+    for line in proc.stdout:
+        if not line.startswith("{"):
+            continue
+        event = json.loads(line)
+        if event.get("event") == "dataset_info":
+            started = time.perf_counter()
+            info = event
+        elif event.get("event") == "epoch_end":
+            epoch_ends.append(time.perf_counter())
+    if proc.wait() != 0:
+        raise RuntimeError(f"training with {procs} processes failed (exit {proc.returncode})")
+    wall = time.perf_counter() - t0
+
+    if started is None or not epoch_ends:
+        raise RuntimeError(f"training with {procs} processes reported no epochs")
+    examples = info["train_examples"]
+    result: Dict[str, Any] = {
+        "procs": procs,
+        "threads_per_process": info.get("threads_per_process"),
+        "wall_s": round(wall, 2),
+        "first_epoch_s": round(epoch_ends[0] - started, 2),
+    }
+    if len(epoch_ends) > 1:
+        steady = (epoch_ends[-1] - epoch_ends[0]) / (len(epoch_ends) - 1)
+        result["epoch_s"] = round(steady, 3)
+        result["images_per_s"] = round(examples / steady, 1)
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--model-name", default="mobilenetv3_small_100")
+    parser.add_argument("--image-size", type=int, default=224)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32, help="per process")
+    parser.add_argument("--num-workers", type=int, default=2, help="DataLoader workers per process")
+    parser.add_argument("--threads-per-process", type=int, default=0)
+    parser.add_argument("--images-per-class", type=int, default=128)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="also write the report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="train-scaling-data-") as data:
+        write_dataset(data, args.images_per_class, args.seed)
+        results = [run(n, data, args) for n in args.procs]
+
+    base = next((r for r in results if r["procs"] == 1 and "images_per_s" in r), None)
+    for r in results:
+        if base is not None and "images_per_s" in r:
+            r["speedup"] = round(r["images_per_s"] / base["images_per_s"], 2)
+            r["efficiency"] = round(r["speedup"] / r["procs"], 2)
+
+    report = {
+        "cpu_count": os.cpu_count(),
+        "model_name": args.model_name,
+        "batch_size_per_process": args.batch_size,
+        "train_examples": args.images_per_class * len(CLASSES),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compare request latency of the image transports against a running server.
+
+    python bench/transport.py --url http://127.0.0.1:4420/yolo_predictions --param model_name=textregions
+    python bench/transport.py --url http://127.0.0.1:8000/predict_textregions --param imgsz=1024
+
+Each transport is timed end to end on the client, including base64 and JSON
+encoding for the JSON transport, on synthetic 1080p and 4K screenshots.
+"""
+import argparse
+import base64
+import json
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+import requests
+
+from screens import RESOLUTIONS, encode_png, synthetic_screenshot
+
+
+def _post_json(session: requests.Session, url: str, field: str, png: bytes, params: Dict[str, str]) -> int:
+    body = json.dumps({field: base64.b64encode(png).decode("ascii"), **params})
+    r = session.post(url, data=body, headers={"Content-Type": "application/json"})
+    r.raise_for_status()
+    return len(body)
+
+
+def _post_octet(session: requests.Session, url: str, field: str, png: bytes, params: Dict[str, str]) -> int:
+    r = session.post(url, data=png, params=params, headers={"Content-Type": "application/octet-stream"})
+    r.raise_for_status()
+    return len(png)
+
+
+def _post_multipart(session: requests.Session, url: str, field: str, png: bytes, params: Dict[str, str]) -> int:
+    r = session.post(url, files={field: ("screenshot.png", png, "image/png")}, data=params)
+    r.raise_for_status()
+    return len(png)
+
+
+TRANSPORTS: Dict[str, Callable[..., int]] = {
+    "json_base64": _post_json,
+    "octet_stream": _post_octet,
+    "multipart": _post_multipart,
+}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    params = dict(p.split("=", 1) for p in args.param)
+    session = requests.Session()
+    report: Dict[str, Any] = {"url": args.url, "params": params, "results": []}
+
+    for res_name in args.resolutions:
+        width, height = RESOLUTIONS[res_name]
+        png = encode_png(synthetic_screenshot(width, height))
+        for transport in args.transports:
+            send = TRANSPORTS[transport]
+            for _ in range(args.warmup):
+                send(session, args.url, args.field, png, params)
+
+            latencies_ms: List[float] = []
+            sent = 0
+            for _ in range(args.requests):
+                start = time.perf_counter()
+                sent = send(session, args.url, args.field, png, params)
+                latencies_ms.append((time.perf_counter() - start) * 1000.0)
+
+            report["results"].append(
+                {
+                    "resolution": res_name,
+                    "transport": transport,
+                    "png_bytes": len(png),
+                    "request_bytes": sent,
+                    "requests": len(latencies_ms),
+                    "mean_ms": statistics.fmean(latencies_ms),
+                    "p50_ms": _percentile(latencies_ms, 0.50),
+                    "p95_ms": _percentile(latencies_ms, 0.95),
+                }
+            )
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark image transports of an inference endpoint.")
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--field", default="image_base64", help="image field name of the endpoint")
+    parser.add_argument("--param", action="append", default=[], help="extra key=value tunables")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--resolutions", nargs="+", default=["1080p", "4k"], choices=sorted(RESOLUTIONS))
+    parser.add_argument("--transports", nargs="+", default=list(TRANSPORTS), choices=list(TRANSPORTS))
+    args = parser.parse_args()
+    print(json.dumps(run(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
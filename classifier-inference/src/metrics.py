@@ -0,0 +1,160 @@
+import os
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# -------------------------- config -------------------------- #
+
+# Set to 0 to skip the request middleware and stage timers
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+
+_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_LOAD_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+REQUEST_SECONDS = Histogram(
+    "inference_request_seconds",
+    "HTTP request latency, until the last body byte is sent",
+    ["service", "endpoint", "method", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "inference_stage_seconds",
+    "Time spent in one stage of handling a request",
+    ["service", "endpoint", "model", "stage"],
+    buckets=_LATENCY_BUCKETS,
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "inference_model_load_seconds",
+    "Model load duration, including warmup",
+    ["service", "pool", "model"],
+    buckets=_LOAD_BUCKETS,
+)
+
+# Stage names used across the services
+STAGES = ("base64_decode", "image_decode", "preprocess", "forward", "postprocess", "format", "serialize")
+
+_service = "inference"
+# ASGI scope of the request being handled; executors copy the context into their threads
+_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar("metrics_scope", default=None)
+
+
+def _endpoint() -> str:
+    scope = _scope.get()
+    if scope is None:
+        return "none"
+    # route template once routing has happened, so path params don't explode the label set
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "none")
+
+
+def observe(name: str, seconds: float, model: Optional[str] = None) -> None:
+    """Record `seconds` spent in stage `name` of the current request."""
+    if METRICS_ENABLED:
+        STAGE_SECONDS.labels(_service, _endpoint(), model or "none", name).observe(seconds)
+
+
+@contextmanager
+def stage(name: str, model: Optional[str] = None) -> Iterator[None]:
+    """Time the enclosed block as stage `name` of the current request."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - t0, model)
+
+
+def json_response(payload: Any, model: Optional[str] = None) -> JSONResponse:
+    """JSONResponse, with the encoding timed as the serialize stage."""
+    with stage("serialize", model):
+        return JSONResponse(payload)
+
+
+class MetricsMiddleware:
+    """Pure ASGI, so streaming responses are timed to their last chunk and request bodies pass untouched."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _scope.set(scope)
+        status = [500]
+
+        async def send_with_status(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            endpoint = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.labels(_service, endpoint, scope["method"], str(status[0])).observe(
+                time.perf_counter() - t0
+            )
+            _scope.reset(token)
+
+
+def _flatten(prefix: str, value: Any) -> Iterator[Tuple[str, float]]:
+    if isinstance(value, (bool, int, float)):
+        yield prefix, float(value)
+    elif isinstance(value, dict):
+        for key, sub in value.items():
+            yield from _flatten(f"{prefix}_{key}", sub)
+
+
+class _StatsCollector:
+    """Numeric fields of the /health stats dicts (cache, batching, pool...) as gauges."""
+
+    def __init__(self) -> None:
+        self.sources: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        for name, stats in list(self.sources.items()):
+            try:
+                values = list(_flatten(f"inference_{name}", stats()))
+            except Exception:
+                continue
+            for metric, value in values:
+                gauge = GaugeMetricFamily(re.sub(r"[^a-zA-Z0-9_]", "_", metric), f"{name} stats", labels=["service"])
+                gauge.add_metric([_service], value)
+                yield gauge
+
+
+_stats = _StatsCollector()
+REGISTRY.register(_stats)
+
+
+def track_pool(pool: Any, label: Optional[Callable[[str], str]] = None) -> None:
+    """Observe the load times of a ModelPool in MODEL_LOAD_SECONDS; `label` maps pool keys to model names."""
+
+    def on_load(key: str, seconds: float) -> None:
+        MODEL_LOAD_SECONDS.labels(_service, pool.name, label(key) if label else key).observe(seconds)
+
+    pool.on_load = on_load
+
+
+def install(app: FastAPI, service: str, stats: Optional[Dict[str, Callable[[], Dict[str, Any]]]] = None) -> None:
+    """Request timing middleware, stats gauges and GET /metrics on `app`."""
+    global _service
+    _service = service
+    _stats.sources.update(stats or {})
+    if METRICS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics() -> Response:
+        return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
@@ -0,0 +1,238 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Generic, List, Optional, TypeVar
+
+import torch
+
+# -------------------------- config -------------------------- #
+
+# RAM budget for loaded models; least recently used models are evicted past it.
+# 0 disables the budget (every model stays resident, the old behavior).
+MODEL_POOL_MAX_MB = float(os.environ.get("MODEL_POOL_MAX_MB", "0"))
+# Recent load/evict events kept for /health
+MODEL_POOL_EVENTS = int(os.environ.get("MODEL_POOL_EVENTS", "50"))
+
+T = TypeVar("T")
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def tensor_bytes(obj: Any) -> int:
+    """Bytes held by the parameters and buffers of `obj` (or of its `.model`)."""
+    seen = set()
+    total = 0
+    for candidate in (obj, getattr(obj, "model", None)):
+        if not isinstance(candidate, torch.nn.Module):
+            continue
+        for t in (*candidate.parameters(), *candidate.buffers()):
+            if id(t) not in seen:
+                seen.add(id(t))
+                total += t.numel() * t.element_size()
+    return total
+
+
+@dataclass
+class _Entry(Generic[T]):
+    value: T
+    signature: str
+    nbytes: int
+    loaded_at: float
+    load_s: float
+    last_used: float = field(default_factory=time.time)
+    hits: int = 0
+
+
+class ModelPool(Generic[T]):
+    """
+    Loaded models keyed by name, bounded by an estimated RAM footprint.
+
+    A model's footprint is the larger of its tensor bytes and the process RSS
+    growth while it loaded (tensor bytes alone when other loads overlapped
+    it). Past the budget the least recently used models are
+    dropped (the one just loaded always stays). Loads are single-flight:
+    concurrent first requests for a model wait on the same load. A model whose
+    signature changed (e.g. its weights file was replaced) is reloaded.
+
+    Evicting only drops the pool's reference; requests already holding the
+    model finish with it.
+    """
+
+    def __init__(self, name: str, max_bytes: int = int(MODEL_POOL_MAX_MB * 1024 * 1024)) -> None:
+        self.name = name
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, _Entry[T]]" = OrderedDict()
+        # key -> (signature, future) of loads in progress
+        self._loading: Dict[str, "tuple[str, Future]"] = {}
+        # loads running now / ever started; an RSS delta is only meaningful for a load that ran alone
+        self._active_loads = 0
+        self._started_loads = 0
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=MODEL_POOL_EVENTS)
+        self._counters = {"loads": 0, "load_failures": 0, "evictions": 0, "hits": 0, "waits": 0}
+        # called with (key, load seconds) after each successful load, e.g. by metrics.track_pool
+        self.on_load: Optional[Callable[[str, float], None]] = None
+
+    def get(
+        self,
+        key: str,
+        loader: Callable[[], T],
+        signature: str = "",
+        footprint: Callable[[T], int] = tensor_bytes,
+    ) -> T:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.signature == signature:
+                self._entries.move_to_end(key)
+                entry.last_used = time.time()
+                entry.hits += 1
+                self._counters["hits"] += 1
+                return entry.value
+
+            inflight = self._loading.get(key)
+            if inflight is not None and inflight[0] == signature:
+                self._counters["waits"] += 1
+                future = inflight[1]
+                owner = False
+            else:
+                future = Future()
+                self._loading[key] = (signature, future)
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = self._load(key, loader, signature, footprint, future)
+        except BaseException as e:
+            with self._lock:
+                self._finish_loading(key, future)
+                self._counters["load_failures"] += 1
+                self._record("load_failed", key, error=str(e))
+            future.set_exception(e)
+            raise
+        future.set_result(value)
+        return value
+
+    def peek(self, key: str) -> Optional[T]:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None else None
+
+    def evict(self, key: str, reason: str = "manual") -> bool:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return False
+            self._counters["evictions"] += 1
+            self._record("evict", key, bytes=entry.nbytes, reason=reason)
+        self._release_memory()
+        return True
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries.keys())
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {
+                "max_bytes": self.max_bytes,
+                "bytes": sum(e.nbytes for e in self._entries.values()),
+                "loading": sorted(self._loading.keys()),
+                **self._counters,
+                # least recently used first
+                "resident": [
+                    {
+                        "name": key,
+                        "bytes": e.nbytes,
+                        "hits": e.hits,
+                        "load_s": round(e.load_s, 3),
+                        "idle_s": round(now - e.last_used, 3),
+                    }
+                    for key, e in self._entries.items()
+                ],
+                "events": list(self._events),
+            }
+
+    # ---- internals ---- #
+
+    def _finish_loading(self, key: str, future: Future) -> bool:
+        """
+        Drop `future` from the in-flight loads; False when a load for a newer
+        signature has replaced it meanwhile. Caller holds the lock.
+        """
+        inflight = self._loading.get(key)
+        if inflight is None or inflight[1] is not future:
+            return False
+        del self._loading[key]
+        return True
+
+    def _load(
+        self,
+        key: str,
+        loader: Callable[[], T],
+        signature: str,
+        footprint: Callable[[T], int],
+        future: Future,
+    ) -> T:
+        # a stale copy (old signature) goes first so both never sit in RAM together
+        self.evict(key, reason="stale")
+
+        with self._lock:
+            self._active_loads += 1
+            concurrent = self._active_loads > 1
+            started = self._started_loads
+            self._started_loads += 1
+        rss_before = _rss_bytes()
+        t0 = time.perf_counter()
+        try:
+            value = loader()
+        finally:
+            load_s = time.perf_counter() - t0
+            rss_after = _rss_bytes()
+            with self._lock:
+                concurrent = concurrent or self._started_loads != started + 1
+                self._active_loads -= 1
+        # with other loads running, the RSS growth is partly theirs
+        nbytes = footprint(value) if concurrent else max(footprint(value), rss_after - rss_before, 0)
+
+        evicted = []
+        with self._lock:
+            if not self._finish_loading(key, future):
+                # superseded by a load for a newer signature: serve this caller, don't cache
+                return value
+            self._entries[key] = _Entry(value, signature, nbytes, time.time(), load_s)
+            self._counters["loads"] += 1
+            self._record("load", key, bytes=nbytes, load_s=round(load_s, 3))
+            total = sum(e.nbytes for e in self._entries.values())
+            while self.max_bytes and total > self.max_bytes and len(self._entries) > 1:
+                old_key, old = next(iter(self._entries.items()))
+                del self._entries[old_key]
+                total -= old.nbytes
+                evicted.append(old_key)
+                self._counters["evictions"] += 1
+                self._record("evict", old_key, bytes=old.nbytes, reason="budget")
+        if evicted:
+            self._release_memory()
+        if self.on_load is not None:
+            self.on_load(key, load_s)
+        return value
+
+    def _record(self, event: str, key: str, **fields: Any) -> None:
+        # caller holds the lock
+        self._events.append({"event": event, "pool": self.name, "name": key, "at": time.time(), **fields})
+
+    @staticmethod
+    def _release_memory() -> None:
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
@@ -0,0 +1,186 @@
+"""
+Dynamic INT8 quantization of a trained classifier.
+
+The server only serves the quantized variant of a registry entry with
+`"quantize": "int8"` once this check has run against the validation set and
+approved it for the exact weights file in the model directory:
+
+    python src/quantize.py --model-dir models/interactive --val-dir /data/validation
+
+The check quantizes every Linear layer (the bulk of a ViT's weights and
+FLOPs), compares top-1 accuracy, latency and weight size of both variants on
+CPU, and writes next to model_best.pth:
+
+- model_best.int8.pt: the quantized state dict
+- quantization.json: the report, tied to the fp32 weights signature
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import timm
+import torch
+from torch import nn
+from torch.utils.data import DataLoader
+from torchvision import datasets, transforms
+
+from result_cache import weights_signature
+
+# Largest top-1 accuracy drop (absolute) that still approves the int8 variant
+QUANTIZE_MAX_TOP1_DROP = float(os.environ.get("QUANTIZE_MAX_TOP1_DROP", "0.01"))
+
+REPORT_NAME = "quantization.json"
+
+
+def quantized_path(weights_path: str) -> str:
+    return os.path.splitext(weights_path)[0] + ".int8.pt"
+
+
+def report_path(weights_path: str) -> str:
+    return os.path.join(os.path.dirname(weights_path), REPORT_NAME)
+
+
+def quantize_dynamic(model: nn.Module) -> nn.Module:
+    return torch.ao.quantization.quantize_dynamic(model.cpu().eval(), {nn.Linear}, dtype=torch.qint8)
+
+
+def approved_report(weights_path: str) -> Optional[Dict[str, Any]]:
+    """The check report if it approved these exact weights, else None."""
+    try:
+        with open(report_path(weights_path), "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not report.get("approved") or report.get("weights_signature") != weights_signature(weights_path):
+        return None
+    if not os.path.exists(quantized_path(weights_path)):
+        return None
+    return report
+
+
+def load_quantized(skeleton: nn.Module, weights_path: str) -> nn.Module:
+    """
+    Quantize an (untrained) skeleton of the right architecture and load the
+    cached int8 state dict into it. Runs on CPU only.
+    """
+    model = quantize_dynamic(skeleton)
+    model.load_state_dict(torch.load(quantized_path(weights_path), map_location="cpu"))
+    return model.eval()
+
+
+# -------------------------- check -------------------------- #
+
+
+def _state_dict_mb(model: nn.Module) -> float:
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell() / (1024 * 1024)
+
+
+@torch.no_grad()
+def _evaluate(model: nn.Module, loader: DataLoader, limit: int) -> Tuple[float, float]:
+    """(top-1 accuracy, median per-batch latency in ms)"""
+    correct = 0
+    total = 0
+    latencies = []
+    for images, labels in loader:
+        t0 = time.perf_counter()
+        logits = model(images)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        correct += (logits.argmax(dim=1) == labels).sum().item()
+        total += labels.size(0)
+        if limit and total >= limit:
+            break
+    return correct / max(total, 1), statistics.median(latencies) if latencies else 0.0
+
+
+def _load_fp32(model_dir: str, weights_path: str, model_name: str) -> Tuple[nn.Module, Dict[int, str], int]:
+    with open(os.path.join(model_dir, "classes.json"), "r", encoding="utf-8") as f:
+        idx_to_class = {int(k): str(v) for k, v in json.load(f).items()}
+    metrics: Dict[str, Any] = {}
+    metrics_path = os.path.join(model_dir, "metrics.json")
+    if os.path.exists(metrics_path):
+        with open(metrics_path, "r", encoding="utf-8") as f:
+            metrics = json.load(f)
+
+    architecture = metrics.get("model_name") or model_name
+    image_size = int(metrics.get("image_size") or 224)
+    model = timm.create_model(architecture, pretrained=False, num_classes=len(idx_to_class))
+    state_dict = torch.load(weights_path, map_location="cpu")
+    if isinstance(state_dict, dict) and isinstance(state_dict.get("state_dict"), dict):
+        state_dict = state_dict["state_dict"]
+    model.load_state_dict(state_dict, strict=True)
+    return model.eval(), idx_to_class, image_size
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Quantize a classifier to INT8 and approve it for serving.")
+    parser.add_argument("--model-dir", required=True)
+    parser.add_argument("--val-dir", required=True, help="validation ImageFolder, as used by classifier-prep training")
+    parser.add_argument("--model-name", default="vit_base_patch16_224", help="fallback if metrics.json lacks it")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=0, help="evaluate at most this many images (0 = all)")
+    parser.add_argument("--max-top1-drop", type=float, default=QUANTIZE_MAX_TOP1_DROP)
+    args = parser.parse_args()
+
+    weights_path = os.path.join(args.model_dir, "model_best.pth")
+    if not os.path.exists(weights_path):
+        weights_path = os.path.join(args.model_dir, "model_last.pth")
+
+    fp32, idx_to_class, image_size = _load_fp32(args.model_dir, weights_path, args.model_name)
+
+    # same eval transform as classifier-prep training and the server
+    eval_tfms = transforms.Compose(
+        [
+            transforms.Resize(int(image_size * 1.14)),
+            transforms.CenterCrop(image_size),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)),
+        ]
+    )
+    val_ds = datasets.ImageFolder(args.val_dir, transform=eval_tfms)
+    expected = {cls: idx for idx, cls in idx_to_class.items()}
+    if val_ds.class_to_idx != expected:
+        raise ValueError("Validation class mapping does not match classes.json.")
+    loader = DataLoader(val_ds, batch_size=args.batch_size, shuffle=False, num_workers=args.num_workers)
+
+    signature = weights_signature(weights_path)
+    # quantize_dynamic returns a copy; fp32 stays the baseline
+    int8 = quantize_dynamic(fp32)
+
+    fp32_top1, fp32_ms = _evaluate(fp32, loader, args.limit)
+    int8_top1, int8_ms = _evaluate(int8, loader, args.limit)
+    fp32_mb, int8_mb = _state_dict_mb(fp32), _state_dict_mb(int8)
+
+    report = {
+        "weights_path": os.path.basename(weights_path),
+        "weights_signature": signature,
+        "dtype": "int8",
+        "val_dir": args.val_dir,
+        "val_examples": min(len(val_ds), args.limit) if args.limit else len(val_ds),
+        "batch_size": args.batch_size,
+        "top1_fp32": fp32_top1,
+        "top1_int8": int8_top1,
+        "top1_delta": int8_top1 - fp32_top1,
+        "latency_ms_fp32": fp32_ms,
+        "latency_ms_int8": int8_ms,
+        "speedup": fp32_ms / int8_ms if int8_ms else None,
+        "weights_mb_fp32": fp32_mb,
+        "weights_mb_int8": int8_mb,
+        "max_top1_drop": args.max_top1_drop,
+        "approved": fp32_top1 - int8_top1 <= args.max_top1_drop,
+    }
+
+    torch.save(int8.state_dict(), quantized_path(weights_path))
+    with open(report_path(weights_path), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps({"event": "quantization_report", **report}))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,23 @@
-import base64
-import io
 import json
 import os
 from dataclasses import dataclass
-from typing import Any, Dict, List
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
 
 import timm
 import torch
 from PIL import Image
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel, Field, field_validator
 from torchvision import transforms
 
+from executor import executor_stats, get_executor
+from metrics import install, json_response, stage, track_pool
+from model_pool import ModelPool
+from quantize import approved_report, load_quantized, report_path
+from result_cache import ResultCache, image_digest, weights_signature
+from transport import EncodedImage, image_request_body, parse_params, read_image_request
+
 # -------------------------- config -------------------------- #
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -21,6 +27,8 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 # - model_best.pth (or model_last.pth)
 # - classes.json
 # - metrics.json (optional, but preferred)
+# Set "quantize": "int8" on an entry to serve the dynamic INT8 variant on CPU
+# once `src/quantize.py` has approved it (see readme).
 MODEL_REGISTRY: Dict[str, Dict[str, Any]] = {
     "interactive": {
         "dir": os.path.join(SCRIPT_DIR, "../models/interactive"),
@@ -30,6 +38,9 @@ MODEL_REGISTRY: Dict[str, Dict[str, Any]] = {
     },
 }
 
+# Largest number of crops sent through the model in one forward pass
+MAX_BATCH_SIZE = int(os.environ.get("CLASSIFIER_MAX_BATCH_SIZE", "32"))
+
 
 @dataclass
 class LoadedClassifier:
@@ -38,9 +49,23 @@ class LoadedClassifier:
     model_name: str
     image_size: int
     transform: transforms.Compose
+    weights_path: str
+    # weights_signature() of weights_path at load time
+    signature: str
+    device: str
+    # "fp32" or "int8"
+    variant: str
+
+    @property
+    def cache_signature(self) -> str:
+        return f"{self.variant}:{self.signature}"
+
 
+# Loaded classifiers, bounded by MODEL_POOL_MAX_MB
+_model_pool: ModelPool[LoadedClassifier] = ModelPool("classifier")
 
-_model_cache: Dict[str, LoadedClassifier] = {}
+# Responses keyed by image bytes + model weights + params
+_result_cache = ResultCache()
 
 
 def _device() -> str:
@@ -102,11 +127,17 @@ def _load_idx_to_class(path: str) -> Dict[int, str]:
 
 def _warmup(loaded: LoadedClassifier) -> None:
     dummy = torch.zeros((1, 3, loaded.image_size, loaded.image_size), dtype=torch.float32)
-    dummy = dummy.to(_device())
+    dummy = dummy.to(loaded.device)
     with torch.no_grad():
         loaded.model(dummy)
 
 
+@lru_cache(maxsize=256)
+def _int8_approved(weights_path: str, weights_sig: str, report_sig: str) -> bool:
+    # keyed by both files' signatures, so the report is parsed once per weights/report version
+    return approved_report(weights_path) is not None
+
+
 def _get_classifier(model_name: str) -> LoadedClassifier:
     if model_name not in MODEL_REGISTRY:
         raise HTTPException(
@@ -118,12 +149,29 @@ def _get_classifier(model_name: str) -> LoadedClassifier:
             },
         )
 
-    if model_name in _model_cache:
-        return _model_cache[model_name]
-
     config = MODEL_REGISTRY[model_name]
     artifacts = _resolve_artifacts(model_name, config)
 
+    weights_path = artifacts["weights_path"]
+    weights_sig = weights_signature(weights_path)
+    # int8 only once the accuracy check approved these exact weights
+    quantized = config.get("quantize") == "int8" and _int8_approved(
+        weights_path, weights_sig, weights_signature(report_path(weights_path))
+    )
+    variant = "int8" if quantized else "fp32"
+
+    # reuse the pooled model unless its weights file (or approved variant) changed
+    signature = f"{variant}:{weights_path}:{weights_sig}"
+    return _model_pool.get(
+        model_name,
+        lambda: _load_classifier(model_name, config, artifacts, variant),
+        signature=signature,
+    )
+
+
+def _load_classifier(
+    model_name: str, config: Dict[str, Any], artifacts: Dict[str, str], variant: str
+) -> LoadedClassifier:
     weights_path = artifacts["weights_path"]
     classes_path = artifacts["classes_path"]
     metrics_path = artifacts["metrics_path"]
@@ -156,12 +204,18 @@ def _get_classifier(model_name: str) -> LoadedClassifier:
             pretrained=False,
             num_classes=len(idx_to_class),
         )
-        state_dict = torch.load(weights_path, map_location="cpu")
-        if isinstance(state_dict, dict) and "state_dict" in state_dict and isinstance(state_dict["state_dict"], dict):
-            state_dict = state_dict["state_dict"]
-        classifier.load_state_dict(state_dict, strict=True)
-        classifier.to(_device())
-        classifier.eval()
+        if variant == "int8":
+            # quantized kernels are CPU-only
+            device = "cpu"
+            classifier = load_quantized(classifier, weights_path)
+        else:
+            device = _device()
+            state_dict = torch.load(weights_path, map_location="cpu")
+            if isinstance(state_dict, dict) and "state_dict" in state_dict and isinstance(state_dict["state_dict"], dict):
+                state_dict = state_dict["state_dict"]
+            classifier.load_state_dict(state_dict, strict=True)
+            classifier.to(device)
+            classifier.eval()
 
         loaded = LoadedClassifier(
             model=classifier,
@@ -169,9 +223,12 @@ def _get_classifier(model_name: str) -> LoadedClassifier:
             model_name=architecture,
             image_size=image_size,
             transform=_build_eval_transform(image_size),
+            weights_path=weights_path,
+            signature=weights_signature(weights_path),
+            device=device,
+            variant=variant,
         )
         _warmup(loaded)
-        _model_cache[model_name] = loaded
         return loaded
     except HTTPException:
         raise
@@ -186,68 +243,213 @@ def _get_classifier(model_name: str) -> LoadedClassifier:
         )
 
 
-def _decode_rgb_image(image_base64: str) -> Image.Image:
-    img_bytes = base64.b64decode(image_base64, validate=True)
-    return Image.open(io.BytesIO(img_bytes)).convert("RGB")
+def _decode_rgb_image(image: EncodedImage) -> Image.Image:
+    try:
+        return image.to_pil()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
 
 
 # -------------------------- api -------------------------- #
 
 app = FastAPI(title="Classifier Inference Server")
 
+track_pool(_model_pool)
+install(
+    app,
+    "classifier-inference",
+    {"model_pool": _model_pool.stats, "executors": executor_stats, "result_cache": _result_cache.stats},
+)
 
-class ClassifierPayload(BaseModel):
-    image_base64: str
+
+class ClassifierParams(BaseModel):
     model_name: str = Field(..., min_length=1)
     top_k: int = Field(1, ge=1, le=20)
 
 
+class ClassifierPayload(ClassifierParams):
+    image_base64: str
+
+
+class ClassifierBatchParams(ClassifierParams):
+    # [x1, y1, x2, y2] boxes to crop server-side from a full screenshot
+    boxes: Optional[List[List[float]]] = None
+
+    @field_validator("boxes", mode="before")
+    @classmethod
+    def _boxes_from_json(cls, v: Any) -> Any:
+        # form fields and query params carry the boxes as a JSON string
+        return json.loads(v) if isinstance(v, str) else v
+
+
+class ClassifierBatchPayload(ClassifierBatchParams):
+    # either a list of pre-cropped images...
+    crops: Optional[List[str]] = None
+    # ...or one full screenshot plus boxes
+    image_base64: Optional[str] = None
+
+
 @app.get("/health")
 def health() -> Dict[str, Any]:
+    loaded = {name: _model_pool.peek(name) for name in _model_pool.keys()}
     return {
         "status": "ok",
         "device": _device(),
         "available_models": sorted(MODEL_REGISTRY.keys()),
-        "loaded_models": sorted(_model_cache.keys()),
+        "loaded_models": sorted(loaded.keys()),
+        "variants": {name: m.variant for name, m in sorted(loaded.items()) if m is not None},
+        "model_pool": _model_pool.stats(),
+        "executors": executor_stats(),
+        "result_cache": _result_cache.stats(),
     }
 
 
-@app.post("/classifier_predictions")
-async def classifier_predictions(payload: ClassifierPayload) -> Dict[str, Any]:
+def _format_predictions(loaded: LoadedClassifier, confs: List[float], classes: List[int]) -> List[Dict[str, Any]]:
+    predictions: List[Dict[str, Any]] = []
+    for conf, cls_idx in zip(confs, classes):
+        idx = int(cls_idx)
+        predictions.append(
+            {
+                "class_index": idx,
+                "label": loaded.idx_to_class.get(idx, str(idx)),
+                "conf": float(conf),
+            }
+        )
+    return predictions
+
+
+def _classify(image: EncodedImage, params: ClassifierParams) -> Dict[str, Any]:
+    loaded = _get_classifier(params.model_name)
+
     try:
-        img = _decode_rgb_image(payload.image_base64)
+        with stage("base64_decode", params.model_name):
+            img_bytes = image.to_bytes()
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid base64 image: {e}")
-
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+    digest = image_digest(img_bytes)
+    cache_params = {"top_k": params.top_k}
+    cached = _result_cache.get(params.model_name, loaded.cache_signature, digest, cache_params)
+    if cached is not None:
+        return cached
+
+    with stage("image_decode", params.model_name):
+        img = _decode_rgb_image(EncodedImage(img_bytes))
     width, height = img.size
-    loaded = _get_classifier(payload.model_name)
 
     try:
-        x = loaded.transform(img).unsqueeze(0).to(_device())
-        with torch.no_grad():
+        with stage("preprocess", params.model_name):
+            x = loaded.transform(img).unsqueeze(0).to(loaded.device)
+        with stage("forward", params.model_name), torch.no_grad():
             logits = loaded.model(x)
             probs = torch.softmax(logits, dim=1)[0]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Classifier predict error: {e}")
 
-    k = min(int(payload.top_k), int(probs.shape[0]))
-    confs, classes = torch.topk(probs, k=k)
+    with stage("postprocess", params.model_name):
+        k = min(int(params.top_k), int(probs.shape[0]))
+        confs, classes = torch.topk(probs, k=k)
+        predictions = _format_predictions(loaded, confs.tolist(), classes.tolist())
 
-    predictions: List[Dict[str, Any]] = []
-    for conf, cls_idx in zip(confs.tolist(), classes.tolist()):
-        idx = int(cls_idx)
-        predictions.append(
-            {
-                "class_index": idx,
-                "label": loaded.idx_to_class.get(idx, str(idx)),
-                "conf": float(conf),
-            }
-        )
-
-    return {
+    response = {
         "imgWidth": width,
         "imgHeight": height,
         "modelName": loaded.model_name,
         "predictions": predictions,
         "topPrediction": predictions[0] if predictions else None,
     }
+    _result_cache.put(params.model_name, loaded.cache_signature, digest, cache_params, response)
+    return response
+
+
+@app.post("/classifier_predictions", openapi_extra=image_request_body(ClassifierPayload, "image_base64"))
+async def classifier_predictions(request: Request) -> Dict[str, Any]:
+    images, raw_params = await read_image_request(request, "image_base64")
+    params = parse_params(ClassifierParams, raw_params)
+    # decoding and the forward pass both block; keep them off the event loop
+    response = await get_executor(_device()).run_async(_classify, images[0], params)
+    return json_response(response, params.model_name)
+
+
+def _crop_boxes(img: Image.Image, boxes: List[List[float]]) -> List[Image.Image]:
+    width, height = img.size
+    crops: List[Image.Image] = []
+    for i, box in enumerate(boxes):
+        if len(box) != 4:
+            raise HTTPException(status_code=400, detail=f"box {i} must be [x1, y1, x2, y2]")
+        x1, y1, x2, y2 = box
+        x1, x2 = max(0, int(round(x1))), min(width, int(round(x2)))
+        y1, y2 = max(0, int(round(y1))), min(height, int(round(y2)))
+        if x2 <= x1 or y2 <= y1:
+            raise HTTPException(status_code=400, detail=f"box {i} is empty after clipping to the image")
+        crops.append(img.crop((x1, y1, x2, y2)))
+    return crops
+
+
+def _classify_batch(
+    crops: List[EncodedImage],
+    screenshot: Optional[EncodedImage],
+    params: ClassifierBatchParams,
+) -> Dict[str, Any]:
+    response: Dict[str, Any] = {}
+    with stage("image_decode", params.model_name):
+        if screenshot is None:
+            images = [_decode_rgb_image(crop) for crop in crops]
+        else:
+            full = _decode_rgb_image(screenshot)
+            response["imgWidth"], response["imgHeight"] = full.size
+            images = _crop_boxes(full, params.boxes)
+
+    loaded = _get_classifier(params.model_name)
+    device = loaded.device
+
+    results: List[Dict[str, Any]] = []
+    try:
+        with torch.no_grad():
+            for start in range(0, len(images), MAX_BATCH_SIZE):
+                chunk = images[start:start + MAX_BATCH_SIZE]
+                with stage("preprocess", params.model_name):
+                    x = torch.stack([loaded.transform(img) for img in chunk]).to(device)
+                with stage("forward", params.model_name):
+                    probs = torch.softmax(loaded.model(x), dim=1)
+                with stage("postprocess", params.model_name):
+                    k = min(int(params.top_k), int(probs.shape[1]))
+                    confs, classes = torch.topk(probs, k=k, dim=1)
+                    for offset, (row_confs, row_classes) in enumerate(zip(confs.tolist(), classes.tolist())):
+                        predictions = _format_predictions(loaded, row_confs, row_classes)
+                        index = start + offset
+                        results.append(
+                            {
+                                "index": index,
+                                "box": params.boxes[index] if screenshot is not None else None,
+                                "predictions": predictions,
+                                "topPrediction": predictions[0] if predictions else None,
+                            }
+                        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Classifier predict error: {e}")
+
+    response.update({"modelName": loaded.model_name, "results": results})
+    return response
+
+
+@app.post("/classifier_predictions/batch", openapi_extra=image_request_body(ClassifierBatchPayload, "crops", many=True))
+async def classifier_predictions_batch(request: Request) -> Dict[str, Any]:
+    # a full screenshot (image_base64, a "file" upload or a raw body) plus boxes...
+    screenshots, raw_params = await read_image_request(request, "image_base64", required=False)
+    crops: List[EncodedImage] = []
+    if not screenshots:
+        # ...or a list of crops
+        crops, raw_params = await read_image_request(request, "crops", many=True, aliases=())
+    if screenshots and raw_params.get("crops") is not None:
+        # read_image_request("image_base64") leaves crops among the params, where nothing reads them
+        raise HTTPException(status_code=400, detail="send either crops, or image_base64 with boxes")
+    params = parse_params(ClassifierBatchParams, raw_params)
+
+    if screenshots and params.boxes is None:
+        raise HTTPException(status_code=400, detail="image_base64 and boxes must be sent together")
+    if crops and params.boxes is not None:
+        raise HTTPException(status_code=400, detail="send either crops, or image_base64 with boxes")
+
+    screenshot = screenshots[0] if screenshots else None
+    response = await get_executor(_device()).run_async(_classify_batch, crops, screenshot, params)
+    return json_response(response, params.model_name)
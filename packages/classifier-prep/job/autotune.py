@@ -0,0 +1,315 @@
+import hashlib
+import json
+import math
+import os
+import platform
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Dataset
+
+import distributed
+from telemetry import current_rss_mb
+
+# Batches run before timing a worker count, so worker start-up is not measured
+WARMUP_BATCHES = 2
+# A larger worker count has to beat the best so far by this much to be chosen
+MIN_WORKER_GAIN = 1.05
+MAX_WORKERS = 16
+
+
+def _total_memory_mb() -> float:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 * 1024)
+
+
+def _available_memory_mb() -> float:
+    try:
+        with open("/proc/meminfo", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return _total_memory_mb()
+
+
+def memory_budget_mb(device: torch.device, requested: float) -> float:
+    """`requested`, or 90% of the GPU / this rank's share of 80% of the RAM still available."""
+    if requested:
+        return requested
+    if device.type == "cuda":
+        return 0.9 * torch.cuda.get_device_properties(device).total_memory / (1024 * 1024)
+    return current_rss_mb() + 0.8 * _available_memory_mb() / distributed.LOCAL_WORLD_SIZE
+
+
+def hardware_fingerprint(device: torch.device, args: Any) -> Dict[str, Any]:
+    """What a tuning result depends on; a stored result is reused only when this matches."""
+    fingerprint = {
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "memory_gb": round(_total_memory_mb() / 1024),
+        "torch": torch.__version__,
+        "device": device.type,
+        "world_size": distributed.WORLD_SIZE,
+        "model_name": args.model_name,
+        "image_size": args.image_size,
+        "mode": args.mode,
+        "trainable_blocks": args.trainable_blocks,
+        "effective_batch_size": args.batch_size,
+        "memory_budget_mb": args.memory_budget_mb,
+    }
+    if device.type == "cuda":
+        props = torch.cuda.get_device_properties(device)
+        fingerprint["cuda_device"] = props.name
+        fingerprint["cuda_memory_gb"] = round(props.total_memory / 1024**3)
+    return fingerprint
+
+
+def fingerprint_id(fingerprint: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def previous_result(path: Path, hardware_id: str) -> Optional[Dict[str, Any]]:
+    """The auto_tune record of an earlier metrics.json, if it was tuned for the same hardware id."""
+    if not path.is_file():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            tuned = json.load(f).get("auto_tune")
+    except (OSError, ValueError):
+        return None
+    if not tuned or tuned.get("hardware_id") != hardware_id:
+        return None
+    return tuned
+
+
+@contextmanager
+def _scratch(model: nn.Module) -> Iterator[None]:
+    """Trial steps leave no trace: buffers (BatchNorm statistics) are restored and gradients dropped."""
+    buffers = {name: b.detach().clone() for name, b in model.named_buffers()}
+    was_training = model.training
+    model.train()
+    try:
+        yield
+    finally:
+        model.zero_grad(set_to_none=True)
+        with torch.no_grad():
+            for name, b in model.named_buffers():
+                b.copy_(buffers[name])
+        model.train(was_training)
+
+
+def _step(model: nn.Module, criterion: nn.Module, inputs: torch.Tensor, labels: torch.Tensor) -> None:
+    # forward and backward only; the optimizer step would change the weights
+    criterion(model(inputs), labels).backward()
+    model.zero_grad(set_to_none=True)
+
+
+class _RssWatch:
+    """
+    Highest current RSS sampled while the block runs. ru_maxrss is the whole
+    process's high-water mark, which earlier work (model load, cache builds)
+    has usually set above anything a small trial reaches.
+    """
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.before = 0.0
+        self.peak = 0.0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="autotune-rss", daemon=True)
+
+    def _sample(self) -> None:
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __enter__(self) -> "_RssWatch":
+        self.before = self.peak = current_rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+    @property
+    def growth(self) -> float:
+        return max(0.0, self.peak - self.before)
+
+
+def _is_oom(exc: BaseException) -> bool:
+    return isinstance(exc, torch.cuda.OutOfMemoryError) or "out of memory" in str(exc).lower()
+
+
+def find_batch_size(
+    model: nn.Module,
+    criterion: nn.Module,
+    sample_shape: Tuple[int, ...],
+    num_classes: int,
+    largest: int,
+    budget_mb: float,
+    device: torch.device,
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    Largest micro-batch, up to `largest`, whose training step fits in
+    `budget_mb`: powers of two and then `largest`, in ascending order, each
+    measured as peak memory plus AdamW's two state tensors per trainable
+    parameter. On CUDA the peak is the allocator's; on CPU it is the RSS
+    before the trial plus the trial's own growth, sampled from
+    /proc/self/statm while it runs. On CPU, where running out of memory means
+    being killed rather than an exception, a size whose growth extrapolated
+    from the previous trial would not fit is not run.
+    """
+    candidates = sorted({2**k for k in range(largest.bit_length()) if 2**k < largest} | {largest})
+    state_mb = 2 * sum(p.numel() * p.element_size() for p in model.parameters() if p.requires_grad) / (1024 * 1024)
+
+    trials: List[Dict[str, Any]] = []
+    best = 0
+    # (batch size, memory growth) of the last trial that fit
+    last: Optional[Tuple[int, float]] = None
+    with _scratch(model):
+        for size in candidates:
+            if last is not None and device.type != "cuda":
+                predicted = current_rss_mb() + last[1] * size / last[0] + state_mb
+                if predicted > budget_mb:
+                    trials.append({"batch_size": size, "predicted_mb": round(predicted, 1), "fits": False})
+                    break
+            inputs = torch.randn(size, *sample_shape, device=device)
+            labels = torch.randint(num_classes, (size,), device=device)
+            if device.type == "cuda":
+                torch.cuda.reset_peak_memory_stats(device)
+            try:
+                with _RssWatch() as watch:
+                    _step(model, criterion, inputs, labels)
+            except RuntimeError as exc:
+                if not _is_oom(exc):
+                    raise
+                del inputs, labels
+                torch.cuda.empty_cache()
+                trials.append({"batch_size": size, "oom": True, "fits": False})
+                break
+            del inputs, labels
+            if device.type == "cuda":
+                peak = torch.cuda.max_memory_allocated(device) / (1024 * 1024)
+                growth = peak - torch.cuda.memory_allocated(device) / (1024 * 1024)
+            else:
+                peak, growth = watch.peak, watch.growth
+            fits = peak + state_mb <= budget_mb
+            trials.append({"batch_size": size, "peak_mb": round(peak + state_mb, 1), "growth_mb": round(growth, 1), "fits": fits})
+            if not fits:
+                break
+            best, last = size, (size, growth)
+    return max(1, best), trials
+
+
+def _rate(model: nn.Module, criterion: nn.Module, loader: DataLoader, device: torch.device, steps: int) -> float:
+    """Images/sec of data loading plus forward/backward over `steps` batches after the warmup ones."""
+    images = 0
+    t0 = time.perf_counter()
+    for i, (inputs, labels) in enumerate(loader):
+        if i == WARMUP_BATCHES:
+            if device.type == "cuda":
+                torch.cuda.synchronize(device)
+            images, t0 = 0, time.perf_counter()
+        if i >= WARMUP_BATCHES + steps:
+            break
+        _step(model, criterion, inputs.to(device, non_blocking=True), labels.to(device, non_blocking=True))
+        images += labels.size(0)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elapsed = time.perf_counter() - t0
+    return images / elapsed if elapsed > 0 else 0.0
+
+
+def find_num_workers(
+    model: nn.Module,
+    criterion: nn.Module,
+    dataset: Dataset,
+    batch_size: int,
+    device: torch.device,
+    steps: int,
+) -> Tuple[int, List[Dict[str, Any]]]:
+    """
+    DataLoader worker count with the best images/sec over a few training steps:
+    0, 1, 2, 4... up to this rank's share of the cores, stopping once the rate
+    falls below the best seen.
+    """
+    most = min(MAX_WORKERS, max(0, (os.cpu_count() or 1) // distributed.LOCAL_WORLD_SIZE - 1))
+    candidates = [0, *sorted({2**k for k in range(most.bit_length()) if 2**k <= most})]
+    trials: List[Dict[str, Any]] = []
+    best, best_rate = 0, 0.0
+    with _scratch(model):
+        for workers in candidates:
+            loader = DataLoader(
+                dataset,
+                batch_size=batch_size,
+                shuffle=True,
+                num_workers=workers,
+                pin_memory=True,
+                drop_last=True,
+            )
+            rate = _rate(model, criterion, loader, device, steps)
+            trials.append({"num_workers": workers, "images_per_s": round(rate, 2)})
+            if rate > best_rate * MIN_WORKER_GAIN:
+                best, best_rate = workers, rate
+            elif rate < best_rate:
+                break
+    return best, trials
+
+
+def tune(
+    model: nn.Module,
+    criterion: nn.Module,
+    dataset: Dataset,
+    num_classes: int,
+    device: torch.device,
+    args: Any,
+    previous: Path,
+) -> Dict[str, Any]:
+    """
+    Micro-batch size, gradient accumulation steps and DataLoader workers for
+    this hardware, keeping micro-batch x accumulation at the requested
+    --batch-size. A result stored in `previous` (a metrics.json) for the same
+    hardware fingerprint is reused without running any trials. Ranks agree on
+    the smallest batch and worker count any of them found.
+    """
+    fingerprint = hardware_fingerprint(device, args)
+    hardware_id = fingerprint_id(fingerprint)
+    stored = previous_result(previous, hardware_id)
+    if stored is not None:
+        return {**stored, "reused": True, "reused_from": str(previous), "tune_s": 0.0}
+
+    t0 = time.perf_counter()
+    budget = memory_budget_mb(device, args.memory_budget_mb)
+    sample_shape = tuple(dataset[0][0].shape)
+    micro, batch_trials = find_batch_size(model, criterion, sample_shape, num_classes, args.batch_size, budget, device)
+    micro = int(distributed.all_reduce_min(micro))
+
+    # cached features are memory-map slices; the loaders over them stay in-process
+    workers, worker_trials = 0, []
+    if args.mode == "full":
+        workers, worker_trials = find_num_workers(model, criterion, dataset, micro, device, args.auto_tune_steps)
+        workers = int(distributed.all_reduce_min(workers))
+
+    accumulation = math.ceil(args.batch_size / micro)
+    # spread the requested batch evenly over the accumulated micro-batches
+    micro = math.ceil(args.batch_size / accumulation)
+    return {
+        "hardware_id": hardware_id,
+        "hardware": fingerprint,
+        "memory_budget_mb": round(budget, 1),
+        "micro_batch_size": micro,
+        "accumulation_steps": accumulation,
+        "effective_batch_size": micro * accumulation,
+        "num_workers": workers,
+        "batch_trials": batch_trials,
+        "worker_trials": worker_trials,
+        "reused": False,
+        "tune_s": round(time.perf_counter() - t0, 2),
+    }
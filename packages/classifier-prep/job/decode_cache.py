@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import Dataset
+from torchvision import datasets, transforms
+
+# Bump when the on-disk layout changes so old caches are rebuilt
+CACHE_VERSION = 2
+# Longest side kept, as a multiple of the cache size; longer images are scaled down to fit whole
+DEFAULT_MAX_ASPECT = 4.0
+
+IMAGES_FILE = "images.npy"
+SHAPES_FILE = "shapes.npy"
+LABELS_FILE = "labels.npy"
+INDEX_FILE = "index.json"
+
+
+def default_cache_size(image_size: int) -> int:
+    # the eval transform's Resize; CenterCrop(image_size) of it matches the ImageFolder path
+    return int(image_size * 1.14)
+
+
+def build_tensor_transforms(image_size: int) -> Tuple[transforms.Compose, transforms.Compose]:
+    """build_transforms() for CHW uint8 tensors cut from the cache (no PIL round trip)."""
+    # the cache already holds images resized to the eval size; Resize here only matters
+    # for the ones scaled further down to fit the canvas
+    train_tfms = transforms.Compose(
+        [
+            transforms.RandomResizedCrop(image_size, antialias=True),
+            transforms.RandomHorizontalFlip(),
+            transforms.ConvertImageDtype(torch.float32),
+            transforms.Normalize(mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)),
+        ]
+    )
+    eval_tfms = transforms.Compose(
+        [
+            transforms.Resize(default_cache_size(image_size), antialias=True),
+            transforms.CenterCrop(image_size),
+            transforms.ConvertImageDtype(torch.float32),
+            transforms.Normalize(mean=(0.485, 0.456, 0.406), std=(0.229, 0.224, 0.225)),
+        ]
+    )
+    return train_tfms, eval_tfms
+
+
+def canvas_shape(size: int, max_aspect: float) -> Tuple[int, int]:
+    """(height, width) of one cache slot: images are stored with their long side along the width."""
+    return size, int(round(size * max_aspect))
+
+
+def manifest_hash(folder: datasets.ImageFolder, size: int, max_aspect: float) -> str:
+    """Fingerprint of the source files (relative path, bytes, mtime), their labels and the cache geometry."""
+    h = hashlib.sha256()
+    geometry = {"version": CACHE_VERSION, "size": size, "max_aspect": max_aspect, "classes": folder.class_to_idx}
+    h.update(json.dumps(geometry, sort_keys=True).encode())
+    root = Path(folder.root)
+    for path, label in folder.samples:
+        st = os.stat(path)
+        h.update(f"{Path(path).relative_to(root)}\0{label}\0{st.st_size}\0{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()
+
+
+def _decode(path: str, size: int, max_aspect: float) -> Tuple[np.ndarray, bool]:
+    """
+    The whole image as RGB uint8, shorter side resized to `size` (less when
+    the long side would pass size * max_aspect), transposed when taller than
+    wide so it fits a canvas_shape() slot. Returns (pixels, transposed).
+    """
+    longest = canvas_shape(size, max_aspect)[1]
+    with Image.open(path) as img:
+        img = img.convert("RGB")
+        scale = min(size / min(img.size), longest / max(img.size))
+        width, height = max(1, round(img.width * scale)), max(1, round(img.height * scale))
+        pixels = np.asarray(img.resize((width, height), Image.BILINEAR))
+    transposed = height > width
+    return (pixels.transpose(1, 0, 2) if transposed else pixels), transposed
+
+
+def ensure_cache(
+    source_dir: str,
+    cache_dir: str,
+    size: int,
+    workers: int = 4,
+    max_aspect: float = DEFAULT_MAX_ASPECT,
+) -> Dict[str, object]:
+    """
+    Decode every image under `source_dir` (ImageFolder layout) once into
+    `cache_dir`: an (N, size, size * max_aspect, 3) uint8 .npy to memory-map
+    holding each image uncropped in the top-left of its slot, the stored
+    (height, width, transposed) of each, the labels and an index with the
+    class mapping and the source manifest hash. An existing cache whose
+    manifest hash matches is reused as is.
+    """
+    folder = datasets.ImageFolder(source_dir)
+    digest = manifest_hash(folder, size, max_aspect)
+    cache = Path(cache_dir)
+    index_path = cache / INDEX_FILE
+
+    if index_path.is_file():
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("manifest") == digest and (cache / IMAGES_FILE).is_file():
+            return {**index, "reused": True, "build_s": 0.0}
+
+    cache.mkdir(parents=True, exist_ok=True)
+    # the index is written last, so an interrupted build is never mistaken for a finished one
+    index_path.unlink(missing_ok=True)
+
+    t0 = time.perf_counter()
+    count = len(folder.samples)
+    slot_height, slot_width = canvas_shape(size, max_aspect)
+    images = np.lib.format.open_memmap(
+        cache / IMAGES_FILE, mode="w+", dtype=np.uint8, shape=(count, slot_height, slot_width, 3)
+    )
+    shapes = np.zeros((count, 3), dtype=np.int32)
+
+    def fill(i: int) -> None:
+        pixels, transposed = _decode(folder.samples[i][0], size, max_aspect)
+        images[i, : pixels.shape[0], : pixels.shape[1]] = pixels
+        shapes[i] = (pixels.shape[0], pixels.shape[1], transposed)
+
+    # PIL decodes and resizes outside the GIL
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(fill, range(count)))
+    images.flush()
+    del images
+    np.save(cache / SHAPES_FILE, shapes)
+    np.save(cache / LABELS_FILE, np.asarray(folder.targets, dtype=np.int64))
+
+    index = {
+        "version": CACHE_VERSION,
+        "manifest": digest,
+        "source_dir": str(source_dir),
+        "size": size,
+        "max_aspect": max_aspect,
+        "count": count,
+        "class_to_idx": folder.class_to_idx,
+    }
+    with open(index_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    return {**index, "reused": False, "build_s": time.perf_counter() - t0}
+
+
+class DecodedCacheDataset(Dataset):
+    """
+    Dataset over a cache written by ensure_cache. Each worker memory-maps the
+    image array on first access, so all workers share the same page-cache
+    pages; an item is a zero-copy CHW view of the image in its slot (transposed
+    back if it was stored on its side), handed to `transform` (tensor
+    transforms, see build_tensor_transforms).
+    """
+
+    def __init__(self, cache_dir: str, transform: Optional[Callable] = None) -> None:
+        self.cache_dir = Path(cache_dir)
+        with open(self.cache_dir / INDEX_FILE, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        self.class_to_idx: Dict[str, int] = index["class_to_idx"]
+        self.classes: List[str] = sorted(self.class_to_idx, key=self.class_to_idx.__getitem__)
+        self.targets: List[int] = np.load(self.cache_dir / LABELS_FILE).tolist()
+        self.shapes: List[List[int]] = np.load(self.cache_dir / SHAPES_FILE).tolist()
+        self.transform = transform
+        self._images: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def __getstate__(self) -> Dict[str, object]:
+        # workers map the file themselves instead of receiving a pickled copy
+        return {**self.__dict__, "_images": None}
+
+    def image(self, index: int) -> torch.Tensor:
+        if self._images is None:
+            self._images = np.load(self.cache_dir / IMAGES_FILE, mmap_mode="r")
+        with warnings.catch_warnings():
+            # read-only mapping; the transforms never write to their input
+            warnings.simplefilter("ignore", UserWarning)
+            height, width, transposed = self.shapes[index]
+            pixels = torch.from_numpy(self._images[index, :height, :width])
+        # HWC -> CHW, or WHC -> CHW for images stored on their side
+        return pixels.permute(2, 1, 0) if transposed else pixels.permute(2, 0, 1)
+
+    def __getitem__(self, index: int) -> Tuple[torch.Tensor, int]:
+        image = self.image(index)
+        if self.transform is not None:
+            image = self.transform(image)
+        return image, self.targets[index]
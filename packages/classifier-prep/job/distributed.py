@@ -0,0 +1,93 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import torch
+import torch.distributed as dist
+
+# torchrun's environment; a plain `python train.py` is a world of one
+RANK = int(os.environ.get("RANK", "0"))
+LOCAL_RANK = int(os.environ.get("LOCAL_RANK", "0"))
+WORLD_SIZE = int(os.environ.get("WORLD_SIZE", "1"))
+LOCAL_WORLD_SIZE = int(os.environ.get("LOCAL_WORLD_SIZE", str(WORLD_SIZE)))
+
+# where collectives put their tensors (nccl only reduces CUDA tensors)
+_device = torch.device("cpu")
+
+
+def enabled() -> bool:
+    return WORLD_SIZE > 1
+
+
+def is_main() -> bool:
+    return RANK == 0
+
+
+def init(backend: str, threads: int = 0) -> torch.device:
+    """
+    Join the process group set up by torchrun and return this rank's device:
+    CPU for gloo, cuda:LOCAL_RANK for nccl. CPU ranks split the machine's
+    cores between them (`threads` overrides), since torchrun otherwise pins
+    every rank to OMP_NUM_THREADS=1.
+    """
+    global _device
+    dist.init_process_group(backend=backend)
+    if backend == "nccl":
+        torch.cuda.set_device(LOCAL_RANK)
+        _device = torch.device("cuda", LOCAL_RANK)
+    else:
+        torch.set_num_threads(threads or max(1, (os.cpu_count() or 1) // LOCAL_WORLD_SIZE))
+    return _device
+
+
+def barrier() -> None:
+    if enabled():
+        dist.barrier()
+
+
+@contextmanager
+def local_main_first() -> Iterator[None]:
+    """
+    Let local rank 0 run the block (e.g. build a cache) before the other ranks
+    on its node. If it fails there, every rank still reaches the barrier and
+    learns of it, so the others raise instead of waiting forever.
+    """
+    if LOCAL_RANK != 0:
+        barrier()
+        (failures,) = all_reduce_sums(0.0)
+        if failures:
+            raise RuntimeError(f"local rank 0 failed {int(failures)} time(s) in a rank-0-first block; see its log")
+        yield
+        return
+
+    try:
+        yield
+    except BaseException:
+        barrier()
+        all_reduce_sums(1.0)
+        raise
+    barrier()
+    all_reduce_sums(0.0)
+
+
+def all_reduce_sums(*values: float) -> List[float]:
+    """Element-wise sums of `values` over all ranks (the values themselves in a world of one)."""
+    if not enabled():
+        return list(values)
+    totals = torch.tensor(values, dtype=torch.float64, device=_device)
+    dist.all_reduce(totals, op=dist.ReduceOp.SUM)
+    return totals.tolist()
+
+
+def all_reduce_min(value: float) -> float:
+    """Smallest `value` over all ranks, e.g. a setting every rank can afford."""
+    if not enabled():
+        return value
+    total = torch.tensor([value], dtype=torch.float64, device=_device)
+    dist.all_reduce(total, op=dist.ReduceOp.MIN)
+    return total.item()
+
+
+def cleanup() -> None:
+    if enabled() and dist.is_initialized():
+        dist.destroy_process_group()
@@ -0,0 +1,166 @@
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+from torch import nn
+from torch.utils.data import DataLoader, Dataset
+
+MODES = ("full", "linear-probe", "partial-finetune")
+
+FEATURES_FILE = "{split}_features.npy"
+LABELS_FILE = "{split}_labels.npy"
+
+
+def parse_mode(values: List[str]) -> Tuple[str, int]:
+    """`--mode` words to (mode, trainable blocks): "linear-probe" or "partial-finetune N"."""
+    mode, rest = values[0], values[1:]
+    if mode not in MODES:
+        raise ValueError(f"Unsupported mode '{mode}'. Expected one of {', '.join(MODES)}.")
+    if mode != "partial-finetune":
+        if rest:
+            raise ValueError(f"Mode '{mode}' takes no arguments, got {rest}.")
+        return mode, 0
+    if len(rest) != 1 or not rest[0].isdigit() or int(rest[0]) < 1:
+        raise ValueError("Mode 'partial-finetune' needs the number of trainable blocks, e.g. 'partial-finetune 2'.")
+    return mode, int(rest[0])
+
+
+def check_blocks(model: nn.Module, blocks: int) -> None:
+    # the tail is run as blocks -> norm -> forward_head, which is the ViT-family layout
+    trunk = getattr(model, "blocks", None)
+    if not isinstance(trunk, nn.Sequential) or not hasattr(model, "norm"):
+        raise ValueError(f"partial-finetune needs a ViT-style timm model with .blocks and .norm, got {type(model).__name__}.")
+    if blocks > len(trunk):
+        raise ValueError(f"partial-finetune {blocks}: the model only has {len(trunk)} blocks.")
+
+
+class HeadModel(nn.Module):
+    """
+    The trainable end of a timm model, fed with cached features: the classifier
+    alone (blocks=0, pooled embeddings) or the last `blocks` transformer blocks,
+    the final norm and the head (token maps entering those blocks). Parameters
+    are shared with `model`, so its state_dict is the full fine-tuned model.
+    """
+
+    def __init__(self, model: nn.Module, blocks: int = 0) -> None:
+        super().__init__()
+        self.model = model
+        self.blocks = blocks
+        for p in model.parameters():
+            p.requires_grad_(False)
+        for module in self.trainable_modules():
+            for p in module.parameters():
+                p.requires_grad_(True)
+
+    def trainable_modules(self) -> List[nn.Module]:
+        if not self.blocks:
+            return [self.model.get_classifier()]
+        return [*self.model.blocks[-self.blocks:], self.model.norm, self.model.get_classifier()]
+
+    def train(self, mode: bool = True) -> "HeadModel":
+        # frozen modules stay in eval mode (dropout, norm statistics)
+        self.training = mode
+        self.model.eval()
+        for module in self.trainable_modules():
+            module.train(mode)
+        return self
+
+    def forward(self, features: torch.Tensor) -> torch.Tensor:
+        if not self.blocks:
+            return self.model.get_classifier()(features)
+        x = self.model.blocks[-self.blocks:](features)
+        return self.model.forward_head(self.model.norm(x))
+
+
+class _StopForward(Exception):
+    pass
+
+
+@torch.no_grad()
+def extract(
+    model: nn.Module,
+    loader: DataLoader,
+    out_dir: Path,
+    split: str,
+    blocks: int,
+    device: torch.device,
+) -> Dict[str, object]:
+    """
+    Run the frozen part of `model` once over `loader` and store its output as
+    float16 in `out_dir`: pooled pre-logits embeddings (blocks=0) or the tokens
+    entering block -`blocks`. Returns sizes and timing for the event line.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    model.eval()
+    captured: List[torch.Tensor] = []
+    hook = None
+    if blocks:
+
+        def capture(module: nn.Module, inputs: Tuple[torch.Tensor, ...]) -> None:
+            captured.append(inputs[0])
+            # nothing after the frozen trunk is needed
+            raise _StopForward
+
+        hook = model.blocks[-blocks].register_forward_pre_hook(capture)
+
+    t0 = time.perf_counter()
+    features: Optional[np.ndarray] = None
+    labels = np.empty(len(loader.dataset), dtype=np.int64)
+    offset = 0
+    try:
+        for images, targets in loader:
+            images = images.to(device, non_blocking=True)
+            if blocks:
+                try:
+                    model.forward_features(images)
+                except _StopForward:
+                    pass
+                batch = captured.pop()
+            else:
+                batch = model.forward_head(model.forward_features(images), pre_logits=True)
+            batch = batch.to(torch.float16).cpu().numpy()
+            if features is None:
+                path = out_dir / FEATURES_FILE.format(split=split)
+                shape = (len(loader.dataset), *batch.shape[1:])
+                features = np.lib.format.open_memmap(path, mode="w+", dtype=np.float16, shape=shape)
+            features[offset : offset + len(batch)] = batch
+            labels[offset : offset + len(batch)] = targets.numpy()
+            offset += len(batch)
+    finally:
+        if hook is not None:
+            hook.remove()
+
+    shape = list(features.shape) if features is not None else []
+    if features is not None:
+        features.flush()
+        del features
+    np.save(out_dir / LABELS_FILE.format(split=split), labels)
+    return {
+        "split": split,
+        "examples": offset,
+        "shape": shape,
+        "bytes": int(np.prod(shape)) * 2 if shape else 0,
+        "extract_s": time.perf_counter() - t0,
+    }
+
+
+class EmbeddingDataset(Dataset):
+    """(float32 features, label) pairs from a split written by `extract`, read through a memory map."""
+
+    def __init__(self, out_dir: Path, split: str) -> None:
+        self.path = out_dir / FEATURES_FILE.format(split=split)
+        self.targets: List[int] = np.load(out_dir / LABELS_FILE.format(split=split)).tolist()
+        self._features: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def __getstate__(self) -> Dict[str, object]:
+        return {**self.__dict__, "_features": None}
+
+    def __getitem__(self, index: int) -> Tuple[torch.Tensor, int]:
+        if self._features is None:
+            self._features = np.load(self.path, mmap_mode="r")
+        return torch.from_numpy(self._features[index].astype(np.float32)), self.targets[index]
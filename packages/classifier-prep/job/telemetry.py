@@ -0,0 +1,138 @@
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import torch
+
+PHASES = ("data_wait", "forward", "backward", "optimizer")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process (DataLoader workers not included)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process right now (Linux; falls back to the peak elsewhere)."""
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def parse_window(spec: str) -> Tuple[int, int]:
+    """PROFILE_STEPS "start:count" (or just "count", from step 0) to (start, count)."""
+    start, _, count = spec.rpartition(":")
+    if not count.isdigit() or int(count) < 1 or (start and not start.isdigit()):
+        raise ValueError(f"Invalid profile window '{spec}'. Expected 'start:count', e.g. '10:5'.")
+    return int(start or 0), int(count)
+
+
+def make_profiler(spec: str, out_dir: str) -> torch.profiler.profile:
+    """torch.profiler recording training steps [start, start + count) into a TensorBoard trace under `out_dir`."""
+    start, count = parse_window(spec)
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    warmup = min(1, start)
+    return torch.profiler.profile(
+        activities=activities,
+        schedule=torch.profiler.schedule(wait=start - warmup, warmup=warmup, active=count, repeat=1),
+        on_trace_ready=torch.profiler.tensorboard_trace_handler(out_dir),
+        profile_memory=True,
+    )
+
+
+class Telemetry:
+    """
+    Where a training epoch's wall time goes: blocked on the DataLoader
+    iterator (plus the host-to-device copy), forward, backward and optimizer
+    step, with the rest (metric bookkeeping) as `other_s`. CUDA work is
+    synchronized at phase boundaries so it lands in the phase that queued it.
+    Every `log_every` steps the window since the last report is printed as a
+    `train_progress` event; `profiler` (if any) is stepped once per step.
+    """
+
+    def __init__(
+        self,
+        device: torch.device,
+        log_every: int = 0,
+        profiler: Optional[torch.profiler.profile] = None,
+        emit: bool = True,
+    ) -> None:
+        self.device = device
+        self.log_every = log_every
+        self.profiler = profiler
+        self.emit = emit
+        self.epoch = 0
+        self.global_step = 0
+        self._epoch = self._counters()
+        self._window = self._counters()
+
+    @staticmethod
+    def _counters() -> Dict[str, Any]:
+        return {"t0": time.perf_counter(), "steps": 0, "images": 0, **{f"{p}_s": 0.0 for p in PHASES}}
+
+    def _sync(self) -> None:
+        if self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+
+    def start_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+        if self.device.type == "cuda":
+            torch.cuda.reset_peak_memory_stats(self.device)
+        self._epoch = self._counters()
+        self._window = self._counters()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        self._sync()
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._sync()
+            elapsed = time.perf_counter() - t0
+            self._epoch[f"{name}_s"] += elapsed
+            self._window[f"{name}_s"] += elapsed
+
+    def end_step(self, images: int) -> None:
+        for counters in (self._epoch, self._window):
+            counters["steps"] += 1
+            counters["images"] += images
+        self.global_step += 1
+        if self.profiler is not None:
+            self.profiler.step()
+        if self.log_every and self._window["steps"] >= self.log_every:
+            if self.emit:
+                print(json.dumps({"event": "train_progress", "epoch": self.epoch, "step": self.global_step, **self._summary(self._window)}))
+            self._window = self._counters()
+
+    def _summary(self, counters: Dict[str, Any]) -> Dict[str, Any]:
+        wall = time.perf_counter() - counters["t0"]
+        phases = {f"{p}_s": round(counters[f"{p}_s"], 4) for p in PHASES}
+        summary = {
+            "steps": counters["steps"],
+            "images": counters["images"],
+            "wall_s": round(wall, 4),
+            "images_per_s": round(counters["images"] / wall, 2) if wall > 0 else 0.0,
+            **phases,
+            "other_s": round(max(0.0, wall - sum(counters[f"{p}_s"] for p in PHASES)), 4),
+            "data_wait_frac": round(counters["data_wait_s"] / wall, 4) if wall > 0 else 0.0,
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+        if self.device.type == "cuda":
+            summary["peak_cuda_mb"] = round(torch.cuda.max_memory_allocated(self.device) / (1024 * 1024), 1)
+        return summary
+
+    def epoch_summary(self) -> Dict[str, Any]:
+        """Totals for the epoch so far, for the epoch_end event and the metrics.json history."""
+        return self._summary(self._epoch)
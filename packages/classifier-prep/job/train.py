@@ -1,15 +1,31 @@
 import argparse
 import json
 import os
+import time
+from contextlib import nullcontext
 from pathlib import Path
 from typing import Tuple
 
 import timm
 import torch
 from torch import nn
-from torch.utils.data import DataLoader
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import DataLoader, Dataset, RandomSampler, SequentialSampler, Subset
+from torch.utils.data.distributed import DistributedSampler
 from torchvision import datasets, transforms
 
+import autotune
+import distributed
+from decode_cache import (
+    DEFAULT_MAX_ASPECT,
+    DecodedCacheDataset,
+    build_tensor_transforms,
+    default_cache_size,
+    ensure_cache,
+)
+from embeddings import EmbeddingDataset, HeadModel, check_blocks, extract, parse_mode
+from telemetry import Telemetry, make_profiler, parse_window
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Train an image classifier with timm on SageMaker.")
@@ -42,9 +58,57 @@ def parse_args() -> argparse.Namespace:
         default=os.environ.get("SM_MODEL_DIR", "/opt/ml/model"),
     )
     parser.add_argument("--seed", type=int, default=int(os.environ.get("SEED", "42")))
+    # Decode every image once into a memory-mapped array under this directory (unset: decode per epoch)
+    parser.add_argument("--decode-cache-dir", type=str, default=os.environ.get("DECODE_CACHE_DIR") or None)
+    # Shorter side images are resized to in the cache (0: the eval Resize, int(image_size * 1.14))
+    parser.add_argument("--decode-cache-size", type=int, default=int(os.environ.get("DECODE_CACHE_SIZE", "0")))
+    # Longest cached side as a multiple of the cache size; images are kept whole, scaled down past it
+    parser.add_argument(
+        "--decode-cache-max-aspect",
+        type=float,
+        default=float(os.environ.get("DECODE_CACHE_MAX_ASPECT", str(DEFAULT_MAX_ASPECT))),
+    )
+    # full | linear-probe | partial-finetune N (train the last N blocks and the head)
+    parser.add_argument("--mode", type=str, nargs="+", default=os.environ.get("TRAIN_MODE", "full").split())
+    # Where linear-probe / partial-finetune store the frozen backbone's float16 features
+    parser.add_argument("--embedding-dir", type=str, default=os.environ.get("EMBEDDING_DIR", "/tmp/classifier-embeddings"))
+    # Start from timm's pretrained weights (--no-pretrained: random init, e.g. offline benchmarks)
+    parser.add_argument(
+        "--pretrained",
+        action=argparse.BooleanOptionalAction,
+        default=os.environ.get("PRETRAINED", "1") != "0",
+    )
+    # Process-group backend when launched by torchrun (gloo: CPU data-parallel)
+    parser.add_argument("--dist-backend", type=str, default=os.environ.get("DIST_BACKEND", "gloo"))
+    # Intra-op threads per CPU rank (0: the node's cores split evenly between its ranks)
+    parser.add_argument("--threads-per-process", type=int, default=int(os.environ.get("THREADS_PER_PROCESS", "0")))
+    # Print a train_progress telemetry event every N training steps (0: per epoch only)
+    parser.add_argument("--log-every-steps", type=int, default=int(os.environ.get("LOG_EVERY_STEPS", "50")))
+    # torch.profiler window over training steps, "start:count" (unset: no profiling)
+    parser.add_argument("--profile-steps", type=str, default=os.environ.get("PROFILE_STEPS") or None)
+    parser.add_argument(
+        "--profile-dir",
+        type=str,
+        default=os.environ.get("PROFILE_DIR", "/opt/ml/output/data/profiler"),
+    )
+    # Pick the micro-batch and DataLoader workers by trial, accumulating gradients up to --batch-size
+    parser.add_argument(
+        "--auto-tune",
+        action=argparse.BooleanOptionalAction,
+        default=os.environ.get("AUTO_TUNE", "0") == "1",
+    )
+    # Memory the tuned micro-batch may use, in MB (0: 90% of the GPU, or this rank's share of 80% of free RAM)
+    parser.add_argument("--memory-budget-mb", type=float, default=float(os.environ.get("MEMORY_BUDGET_MB", "0")))
+    # Timed training steps per worker-count trial
+    parser.add_argument("--auto-tune-steps", type=int, default=int(os.environ.get("AUTO_TUNE_STEPS", "8")))
+    # metrics.json of an earlier run whose tuning is reused on matching hardware (default: the one in --model-dir)
+    parser.add_argument("--auto-tune-from", type=str, default=os.environ.get("AUTO_TUNE_FROM") or None)
     args, unknown = parser.parse_known_args()
     if args.command not in ("train",):
         raise ValueError(f"Unsupported command '{args.command}'. Expected 'train'.")
+    args.mode, args.trainable_blocks = parse_mode(args.mode)
+    if args.profile_steps:
+        parse_window(args.profile_steps)
     if unknown:
         print(f"Ignoring unrecognized CLI args: {unknown}")
     return args
@@ -84,22 +148,65 @@ def build_transforms(image_size: int) -> Tuple[transforms.Compose, transforms.Co
     return train_tfms, eval_tfms
 
 
-def make_loaders(args: argparse.Namespace) -> Tuple[DataLoader, DataLoader | None, dict]:
-    train_tfms, eval_tfms = build_transforms(args.image_size)
+def cached_dataset(source_dir: str, split: str, transform: transforms.Compose, args: argparse.Namespace) -> Dataset:
+    size = args.decode_cache_size or default_cache_size(args.image_size)
+    cache_dir = Path(args.decode_cache_dir) / split
+    # one build per node; the other ranks then find the cache and reuse it
+    with distributed.local_main_first():
+        info = ensure_cache(
+            source_dir, str(cache_dir), size, workers=args.num_workers, max_aspect=args.decode_cache_max_aspect
+        )
+    if distributed.is_main():
+        print(
+            json.dumps(
+                {
+                    "event": "decode_cache",
+                    "split": split,
+                    "cache_dir": str(cache_dir),
+                    "reused": info["reused"],
+                    "examples": info["count"],
+                    "size": size,
+                    "build_s": info["build_s"],
+                }
+            )
+        )
+    return DecodedCacheDataset(str(cache_dir), transform=transform)
+
 
-    train_ds = datasets.ImageFolder(args.train_dir, transform=train_tfms)
-    val_ds = datasets.ImageFolder(args.val_dir, transform=eval_tfms) if args.val_dir else None
+def make_datasets(args: argparse.Namespace, augment: bool = True) -> Tuple[Dataset, Dataset | None]:
+    cached = bool(args.decode_cache_dir)
+    train_tfms, eval_tfms = build_tensor_transforms(args.image_size) if cached else build_transforms(args.image_size)
+    if not augment:
+        train_tfms = eval_tfms
+    if cached:
+        train_ds = cached_dataset(args.train_dir, "train", train_tfms, args)
+        val_ds = cached_dataset(args.val_dir, "val", eval_tfms, args) if args.val_dir else None
+    else:
+        train_ds = datasets.ImageFolder(args.train_dir, transform=train_tfms)
+        val_ds = datasets.ImageFolder(args.val_dir, transform=eval_tfms) if args.val_dir else None
+    return train_ds, val_ds
+
+
+def make_loaders(args: argparse.Namespace, frozen: bool = False) -> Tuple[DataLoader, DataLoader | None, dict]:
+    """Image loaders; `frozen` ones feed feature extraction (eval transforms, no shuffling)."""
+    train_ds, val_ds = make_datasets(args, augment=not frozen)
 
     if val_ds and train_ds.class_to_idx != val_ds.class_to_idx:
         raise ValueError("Training and validation class mappings do not match.")
 
+    # each rank gets an equal share (padded by repeats), so they all run the same number of steps
+    train_sampler = DistributedSampler(train_ds, shuffle=not frozen, seed=args.seed) if distributed.enabled() else None
     train_loader = DataLoader(
         train_ds,
         batch_size=args.batch_size,
-        shuffle=True,
+        shuffle=train_sampler is None and not frozen,
+        sampler=train_sampler,
         num_workers=args.num_workers,
         pin_memory=True,
     )
+    if val_ds and distributed.enabled():
+        # strided shards without DistributedSampler's padding, so the all-reduced totals count each image once
+        val_ds = Subset(val_ds, range(distributed.RANK, len(val_ds), distributed.WORLD_SIZE))
     val_loader = (
         DataLoader(
             val_ds,
@@ -115,33 +222,113 @@ def make_loaders(args: argparse.Namespace) -> Tuple[DataLoader, DataLoader | Non
     return train_loader, val_loader, train_ds.class_to_idx
 
 
+def full_dataset(dataset: Dataset) -> Dataset:
+    """The dataset a rank's val shard was cut from."""
+    return dataset.dataset if isinstance(dataset, Subset) else dataset
+
+
+def with_batching(loader: DataLoader, batch_size: int, num_workers: int) -> DataLoader:
+    """`loader` over the same dataset and sampling, with a new batch size and worker count."""
+    sampler = loader.sampler
+    shuffle = isinstance(sampler, RandomSampler)
+    return DataLoader(
+        loader.dataset,
+        batch_size=batch_size,
+        shuffle=shuffle,
+        sampler=None if isinstance(sampler, (RandomSampler, SequentialSampler)) else sampler,
+        num_workers=num_workers,
+        pin_memory=loader.pin_memory,
+    )
+
+
+def embedding_loaders(
+    model: nn.Module,
+    train_loader: DataLoader,
+    val_loader: DataLoader | None,
+    args: argparse.Namespace,
+    device: torch.device,
+) -> Tuple[DataLoader, DataLoader | None]:
+    """
+    Run the frozen part of `model` once per split and return loaders over the
+    stored features. Distributed ranks extract and keep their own shard.
+    """
+    out_dir = Path(args.embedding_dir)
+    loaders = []
+    for split, loader in (("train", train_loader), ("val", val_loader)):
+        if loader is None:
+            loaders.append(None)
+            continue
+        name = f"{split}-rank{distributed.RANK}" if distributed.enabled() else split
+        info = extract(model, loader, out_dir, name, args.trainable_blocks, device)
+        print(json.dumps({"event": "embeddings", "mode": args.mode, "trainable_blocks": args.trainable_blocks, **info}))
+        loaders.append(
+            DataLoader(
+                EmbeddingDataset(out_dir, name),
+                batch_size=args.batch_size,
+                shuffle=split == "train",
+                # slicing a memory map; worker processes would only add overhead
+                num_workers=0,
+                pin_memory=True,
+            )
+        )
+    return loaders[0], loaders[1]
+
+
 def train_one_epoch(
     model: nn.Module,
     loader: DataLoader,
     optimizer: torch.optim.Optimizer,
     criterion: nn.Module,
     device: torch.device,
+    telemetry: Telemetry | None = None,
+    accumulation_steps: int = 1,
 ) -> Tuple[float, float]:
+    telemetry = telemetry or Telemetry(device, emit=False)
     model.train()
     running_loss = 0.0
     running_correct = 0
     running_total = 0
 
-    for images, labels in loader:
-        images = images.to(device, non_blocking=True)
-        labels = labels.to(device, non_blocking=True)
-
-        optimizer.zero_grad(set_to_none=True)
-        logits = model(images)
-        loss = criterion(logits, labels)
-        loss.backward()
-        optimizer.step()
+    num_batches = len(loader)
+    step = 0
+    batches = iter(loader)
+    while True:
+        with telemetry.phase("data_wait"):
+            batch = next(batches, None)
+            if batch is not None:
+                images = batch[0].to(device, non_blocking=True)
+                labels = batch[1].to(device, non_blocking=True)
+        if batch is None:
+            break
+
+        # micro-batches accumulate into one optimizer step; the last window may be shorter
+        window_start = step - step % accumulation_steps
+        window = min(accumulation_steps, num_batches - window_start)
+        steps_optimizer = step - window_start == window - 1
+        if step == window_start:
+            optimizer.zero_grad(set_to_none=True)
+        # DDP all-reduces gradients only on the micro-batch that completes the window
+        sync = model.no_sync() if isinstance(model, DistributedDataParallel) and not steps_optimizer else nullcontext()
+        with sync:
+            with telemetry.phase("forward"):
+                logits = model(images)
+                loss = criterion(logits, labels)
+            with telemetry.phase("backward"):
+                (loss / window).backward()
+        if steps_optimizer:
+            with telemetry.phase("optimizer"):
+                optimizer.step()
 
         running_loss += loss.item() * labels.size(0)
         preds = logits.argmax(dim=1)
         running_correct += (preds == labels).sum().item()
         running_total += labels.size(0)
+        telemetry.end_step(labels.size(0))
+        step += 1
 
+    running_loss, running_correct, running_total = distributed.all_reduce_sums(
+        running_loss, running_correct, running_total
+    )
     return running_loss / running_total, running_correct / running_total
 
 
@@ -152,6 +339,9 @@ def evaluate(
     criterion: nn.Module,
     device: torch.device,
 ) -> Tuple[float, float]:
+    if isinstance(model, DistributedDataParallel):
+        # shards differ in length; the wrapper's per-forward buffer sync would wait on the shorter ones
+        model = model.module
     model.eval()
     running_loss = 0.0
     running_correct = 0
@@ -169,13 +359,33 @@ def evaluate(
         running_correct += (preds == labels).sum().item()
         running_total += labels.size(0)
 
+    running_loss, running_correct, running_total = distributed.all_reduce_sums(
+        running_loss, running_correct, running_total
+    )
     return running_loss / running_total, running_correct / running_total
 
 
+def summarize_telemetry(history: list, args: argparse.Namespace) -> dict:
+    """Run-level throughput for metrics.json; the first epoch is left out of the rate when there are more."""
+    steady = history[1:] or history
+    train_s = sum(h["wall_s"] for h in history)
+    return {
+        "images_per_s": round(sum(h["images"] for h in steady) / max(1e-9, sum(h["wall_s"] for h in steady)), 2),
+        "train_s": round(train_s, 2),
+        "eval_s": round(sum(h["eval_s"] for h in history), 2),
+        "data_wait_frac": round(sum(h["data_wait_s"] for h in history) / max(1e-9, train_s), 4),
+        "peak_rss_mb": max((h["peak_rss_mb"] for h in history), default=0.0),
+        "profile_dir": args.profile_dir if args.profile_steps else None,
+    }
+
+
 def main() -> None:
     args = parse_args()
     set_seed(args.seed)
-    device = resolve_device()
+    if distributed.enabled():
+        device = distributed.init(args.dist_backend, args.threads_per_process)
+    else:
+        device = resolve_device()
 
     channel_env = {
         "SM_CHANNEL_TRAINING": os.environ.get("SM_CHANNEL_TRAINING"),
@@ -183,16 +393,17 @@ def main() -> None:
         "SM_CHANNEL_VALIDATION": os.environ.get("SM_CHANNEL_VALIDATION"),
         "SM_CHANNEL_VAL": os.environ.get("SM_CHANNEL_VAL"),
     }
-    print(
-        json.dumps(
-            {
-                "event": "channel_env",
-                "env": channel_env,
-                "resolved_train_dir": args.train_dir,
-                "resolved_val_dir": args.val_dir,
-            }
+    if distributed.is_main():
+        print(
+            json.dumps(
+                {
+                    "event": "channel_env",
+                    "env": channel_env,
+                    "resolved_train_dir": args.train_dir,
+                    "resolved_val_dir": args.val_dir,
+                }
+            )
         )
-    )
 
     model_dir = Path(args.model_dir)
     model_dir.mkdir(parents=True, exist_ok=True)
@@ -202,19 +413,22 @@ def main() -> None:
     if args.val_dir and not Path(args.val_dir).is_dir():
         raise FileNotFoundError(f"Validation directory does not exist: {args.val_dir}")
 
-    train_loader, val_loader, class_to_idx = make_loaders(args)
-    print(
-        json.dumps(
-            {
-                "event": "dataset_info",
-                "train_dir": args.train_dir,
-                "val_dir": args.val_dir,
-                "train_examples": len(train_loader.dataset),
-                "val_examples": len(val_loader.dataset) if val_loader is not None else 0,
-                "has_validation_loader": val_loader is not None,
-            }
+    train_loader, val_loader, class_to_idx = make_loaders(args, frozen=args.mode != "full")
+    if distributed.is_main():
+        print(
+            json.dumps(
+                {
+                    "event": "dataset_info",
+                    "train_dir": args.train_dir,
+                    "val_dir": args.val_dir,
+                    "train_examples": len(train_loader.dataset),
+                    "val_examples": len(full_dataset(val_loader.dataset)) if val_loader is not None else 0,
+                    "has_validation_loader": val_loader is not None,
+                    "world_size": distributed.WORLD_SIZE,
+                    "threads_per_process": torch.get_num_threads(),
+                }
+            )
         )
-    )
     inferred_classes = len(class_to_idx)
     num_classes = args.num_classes or inferred_classes
 
@@ -223,10 +437,35 @@ def main() -> None:
             f"num_classes ({num_classes}) does not match training classes ({inferred_classes})."
         )
 
-    model = timm.create_model(args.model_name, pretrained=True, num_classes=num_classes).to(device)
+    model = timm.create_model(args.model_name, pretrained=args.pretrained, num_classes=num_classes).to(device)
+    # the module the epochs train; HeadModel shares its parameters with `model`
+    train_model: nn.Module = model
+    if args.mode != "full":
+        if args.trainable_blocks:
+            check_blocks(model, args.trainable_blocks)
+        train_loader, val_loader = embedding_loaders(model, train_loader, val_loader, args, device)
+        train_model = HeadModel(model, args.trainable_blocks)
+
     criterion = nn.CrossEntropyLoss()
+    accumulation_steps = 1
+    tuning = None
+    if args.auto_tune:
+        previous = Path(args.auto_tune_from) if args.auto_tune_from else model_dir / "metrics.json"
+        tuning = autotune.tune(train_model, criterion, train_loader.dataset, num_classes, device, args, previous)
+        accumulation_steps = tuning["accumulation_steps"]
+        train_loader = with_batching(train_loader, tuning["micro_batch_size"], tuning["num_workers"])
+        if val_loader is not None:
+            val_loader = with_batching(val_loader, tuning["micro_batch_size"], tuning["num_workers"])
+        if distributed.is_main():
+            trials = ("batch_trials", "worker_trials", "hardware")
+            print(json.dumps({"event": "auto_tune", **{k: v for k, v in tuning.items() if k not in trials}}))
+
+    if distributed.enabled():
+        # broadcasts rank 0's initial weights, then averages gradients every step
+        train_model = DistributedDataParallel(train_model, device_ids=[device] if device.type == "cuda" else None)
+
     optimizer = torch.optim.AdamW(
-        model.parameters(),
+        [p for p in train_model.parameters() if p.requires_grad],
         lr=args.learning_rate,
         weight_decay=args.weight_decay,
     )
@@ -234,15 +473,32 @@ def main() -> None:
     best_score = float("-inf")
     history = []
 
+    # rank 0 alone traces, so the window isn't slowed down on every rank
+    profiler = make_profiler(args.profile_steps, args.profile_dir) if args.profile_steps and distributed.is_main() else None
+    telemetry = Telemetry(device, args.log_every_steps, profiler, emit=distributed.is_main())
+    if profiler is not None:
+        profiler.start()
+
     for epoch in range(args.epochs):
-        train_loss, train_acc = train_one_epoch(model, train_loader, optimizer, criterion, device)
+        if isinstance(train_loader.sampler, DistributedSampler):
+            train_loader.sampler.set_epoch(epoch)
+        telemetry.start_epoch(epoch + 1)
+        train_loss, train_acc = train_one_epoch(
+            train_model, train_loader, optimizer, criterion, device, telemetry, accumulation_steps
+        )
+        throughput = telemetry.epoch_summary()
+        if distributed.enabled():
+            (world_images,) = distributed.all_reduce_sums(throughput["images"])
+            throughput["world_images_per_s"] = round(world_images / throughput["wall_s"], 2)
 
+        eval_start = time.perf_counter()
         if val_loader is not None:
-            val_loss, val_acc = evaluate(model, val_loader, criterion, device)
+            val_loss, val_acc = evaluate(train_model, val_loader, criterion, device)
             score = val_acc
         else:
             val_loss, val_acc = float("nan"), float("nan")
             score = train_acc
+        throughput["eval_s"] = round(time.perf_counter() - eval_start, 4)
 
         epoch_summary = {
             "epoch": epoch + 1,
@@ -250,28 +506,40 @@ def main() -> None:
             "train_acc": train_acc,
             "val_loss": val_loss,
             "val_acc": val_acc,
+            **throughput,
         }
         history.append(epoch_summary)
+        # metrics are all-reduced, so every rank takes the same branch
         checkpoint_saved = score > best_score
         if checkpoint_saved:
             best_score = score
-            torch.save(model.state_dict(), model_dir / "model_best.pth")
-        print(
-            json.dumps(
-                {
-                    "event": "epoch_end",
-                    "epoch": epoch + 1,
-                    "train_loss": train_loss,
-                    "train_acc": train_acc,
-                    "val_loss": val_loss,
-                    "val_acc": val_acc,
-                    "score": score,
-                    "best_score": best_score,
-                    "checkpoint_saved": checkpoint_saved,
-                    "has_validation_loader": val_loader is not None,
-                }
+            if distributed.is_main():
+                torch.save(model.state_dict(), model_dir / "model_best.pth")
+        if distributed.is_main():
+            print(
+                json.dumps(
+                    {
+                        "event": "epoch_end",
+                        "epoch": epoch + 1,
+                        "train_loss": train_loss,
+                        "train_acc": train_acc,
+                        "val_loss": val_loss,
+                        "val_acc": val_acc,
+                        "score": score,
+                        "best_score": best_score,
+                        "checkpoint_saved": checkpoint_saved,
+                        "has_validation_loader": val_loader is not None,
+                        **throughput,
+                    }
+                )
             )
-        )
+
+    if profiler is not None:
+        profiler.stop()
+
+    if not distributed.is_main():
+        distributed.cleanup()
+        return
 
     torch.save(model.state_dict(), model_dir / "model_last.pth")
 
@@ -283,14 +551,20 @@ def main() -> None:
         "model_name": args.model_name,
         "num_classes": num_classes,
         "image_size": args.image_size,
+        "mode": args.mode,
+        "trainable_blocks": args.trainable_blocks,
+        "world_size": distributed.WORLD_SIZE,
         "best_score": best_score,
         "has_validation": val_loader is not None,
+        "telemetry": summarize_telemetry(history, args),
+        "auto_tune": tuning,
         "history": history,
     }
     with open(model_dir / "metrics.json", "w", encoding="utf-8") as f:
         json.dump(metadata, f, indent=2)
 
     print(f"Saved artifacts to {model_dir}")
+    distributed.cleanup()
 
 
 if __name__ == "__main__":
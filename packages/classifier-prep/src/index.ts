@@ -347,6 +347,9 @@ async function startTrainingJob(config: Config): Promise<void> {
       WEIGHT_DECAY: process.env.WEIGHT_DECAY ?? '0.01',
       IMAGE_SIZE: process.env.IMAGE_SIZE ?? '224',
       NUM_WORKERS: process.env.NUM_WORKERS ?? '4',
+      DECODE_CACHE_DIR: process.env.DECODE_CACHE_DIR ?? '',
+      TRAIN_MODE: process.env.TRAIN_MODE ?? 'full',
+      AUTO_TUNE: process.env.AUTO_TUNE ?? '0',
     },
   };
 
@@ -80,20 +80,23 @@ async function main({
       continue
     }
 
-    // run text_predict yolo...
-    // get boxes
+    // run text_predict yolo, crop and ocr every region in a single round trip.
+    // boxes come back sorted from top to bottom, which the ordering below relies on
     const fullScreen= Buffer.from(screen.image_data).toString('base64')
 
-    const textRegionsResp = await fetch('http://localhost:8000/predict_textregions', {
+    const ocrPageResp = await fetch('http://localhost:8000/ocr/page', {
       method: 'POST',
       headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ image_base64: fullScreen, conf: 0.1, imgsz: 1024 }),
+      // tall manual pages are cut into 1024px tiles instead of being squeezed into one
+      body: JSON.stringify({ image_base64: fullScreen, conf: 0.1, imgsz: 1024, tiled: true }),
     })
 
     const { detections } =
-      (await textRegionsResp.json()) as YoloPredictResponse
+      (await ocrPageResp.json()) as YoloPredictResponse
 
-    let detectionZones: {
+    // we have bounding boxes plus their accompanying text
+    //
+    const detectionZones: {
       rect: Rect,
       text_content?: string
     }[] = detections.map((d) => {
@@ -104,47 +107,10 @@ async function main({
           y: y1,
           width: x2 - x1,
           height: y2 - y1,
-        }
+        },
+        text_content: d.text,
       }
-    }).sort((a, b) => {
-      return a.rect.y - b.rect.y || a.rect.x - b.rect.x
-    }) // important.. sort from top to bottom.  need to keep the ordering on this across variants as well
-
-    const clipsResp = await fetch(
-      'http://localhost:4000/api/util/clips',
-      {
-        method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({
-          noScale: true,
-          rects: detectionZones.map(d => d.rect),
-          vw: -1,
-          vh: -1,
-          fullScreen: Buffer.from(screen.image_data).toString('base64'),
-        }),
-      },
-    )
-
-    const { clips } = (await clipsResp.json()) as { clips: string[] }
-
-    const ocrResp = await fetch('http://localhost:8000/ocr/batch', {
-      method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({
-        clips,
-      }),
     })
-
-    const { results } = (await ocrResp.json()) as {
-      results: Array<{text: string; score: number}>
-    }
-
-    // we have bounding boxes plus their accompanying text
-    //
-    detectionZones = detectionZones.map((d, i) => ({
-      ...d,
-      text_content: results[i].text
-    }))
     const detectionBoxes = detectionZones.map(d => d.rect)
 
     console.log('ocr results', detectionZones.map(d => d.text_content))
@@ -5,5 +5,6 @@ set -euo pipefail
 # export MODEL_WEIGHTS=./model_final.pth
 # export META_PATH=./metadata.json
 
-export PYTHONPATH="$PWD/src${PYTHONPATH:+:$PYTHONPATH}"
+# ../yolo-inference/src holds modules shared between the two servers
+export PYTHONPATH="$PWD/src:$PWD/../yolo-inference/src${PYTHONPATH:+:$PYTHONPATH}"
 exec uvicorn serve:app --host 127.0.0.1 --port 8000 --reload
\ No newline at end of file
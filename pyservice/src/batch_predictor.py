@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+import torch
+from detectron2.checkpoint import DetectionCheckpointer
+from detectron2.data import MetadataCatalog
+from detectron2.data import transforms as T
+from detectron2.modeling import build_model
+
+from metrics import stage
+
+# Threads running the resize transform ahead of the model
+DETECTRON_PREP_WORKERS = int(os.environ.get("DETECTRON_PREP_WORKERS", "4"))
+# Largest number of images per model([...]) call
+DETECTRON_MAX_BATCH_SIZE = int(os.environ.get("DETECTRON_MAX_BATCH_SIZE", "8"))
+
+# shared by every predictor, so evicted or reloaded models don't leave threads behind
+_prep_pool = ThreadPoolExecutor(max_workers=max(1, DETECTRON_PREP_WORKERS), thread_name_prefix="detectron-prep")
+
+
+class BatchPredictor:
+    """
+    DefaultPredictor that takes a list of images.
+
+    Same checkpoint loading, input format handling and ResizeShortestEdge
+    test-time transform as DefaultPredictor, but the resizes run on a shared
+    thread pool (PIL releases the GIL) and the model sees each chunk of up to
+    DETECTRON_MAX_BATCH_SIZE images in a single forward pass.
+    """
+
+    def __init__(
+        self,
+        cfg: Any,
+        max_batch_size: int = DETECTRON_MAX_BATCH_SIZE,
+    ) -> None:
+        self.cfg = cfg.clone()
+        self.model = build_model(self.cfg)
+        self.model.eval()
+        if len(cfg.DATASETS.TEST):
+            self.metadata = MetadataCatalog.get(cfg.DATASETS.TEST[0])
+
+        DetectionCheckpointer(self.model).load(cfg.MODEL.WEIGHTS)
+
+        self.aug = T.ResizeShortestEdge(
+            [cfg.INPUT.MIN_SIZE_TEST, cfg.INPUT.MIN_SIZE_TEST], cfg.INPUT.MAX_SIZE_TEST
+        )
+        self.input_format = cfg.INPUT.FORMAT
+        assert self.input_format in ["RGB", "BGR"], self.input_format
+        self.max_batch_size = max(1, int(max_batch_size))
+
+    def _prepare(self, original_image: np.ndarray) -> Dict[str, Any]:
+        # original_image is BGR (OpenCV convention), like DefaultPredictor's input
+        if self.input_format == "RGB":
+            original_image = original_image[:, :, ::-1]
+        height, width = original_image.shape[:2]
+        image = self.aug.get_transform(original_image).apply_image(original_image)
+        image = torch.as_tensor(image.astype("float32").transpose(2, 0, 1))
+        image = image.to(self.cfg.MODEL.DEVICE)
+        return {"image": image, "height": height, "width": width}
+
+    def __call__(self, original_images: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """One output dict per image, in input order."""
+        outputs: List[Dict[str, Any]] = []
+        with torch.no_grad():
+            with stage("preprocess", "detectron2"):
+                inputs = list(_prep_pool.map(self._prepare, original_images))
+            for start in range(0, len(inputs), self.max_batch_size):
+                with stage("forward", "detectron2"):
+                    outputs.extend(self.model(inputs[start:start + self.max_batch_size]))
+        return outputs
@@ -0,0 +1,164 @@
+import importlib
+import json
+import os
+import threading
+import time
+import traceback
+from dataclasses import asdict, dataclass
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+
+# -------------------------- config -------------------------- #
+
+# Seconds clients are told to wait while an engine is still loading
+ENGINE_RETRY_AFTER_S = int(os.environ.get("ENGINE_RETRY_AFTER_S", "5"))
+# Optional file the startup profile is written to once warmup finishes
+STARTUP_PROFILE_PATH = os.environ.get("STARTUP_PROFILE_PATH") or None
+
+
+@dataclass
+class EngineStatus:
+    # pending -> loading -> ready | failed (failed engines retry on the next request).
+    # ready means loaded once, i.e. loadable: a model pool may evict the model later,
+    # and the next request reloads it inline instead of answering 503.
+    state: str = "pending"
+    error: Optional[str] = None
+    import_s: float = 0.0
+    load_s: Optional[float] = None
+    attempts: int = 0
+
+
+class Engines:
+    """
+    Load state of the heavy inference engines (Detectron2, YOLO, PaddleOCR).
+
+    Each engine has a loader that does its own deferred imports (timed with
+    `import_module`) and loads its model. Loaders run on background threads,
+    so the server binds right away and one engine failing leaves the others
+    serving. Endpoints call `require` first: until the engine is ready it
+    answers 503 with Retry-After and starts loading every required engine
+    that nothing is loading yet.
+
+    An engine stays ready after the model pool evicts its model: ready means
+    the loader succeeded and can run again, not that the model is resident.
+    The request that finds it evicted pays the reload (see /health's
+    events under model_pool).
+    """
+
+    def __init__(self, started_at: Optional[float] = None) -> None:
+        self._lock = threading.Lock()
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._status: Dict[str, EngineStatus] = {}
+        self._warmup: List[str] = []
+        self._startup: Dict[str, Any] = {}
+        # time.perf_counter() when the process started importing the app
+        self._t0 = time.perf_counter() if started_at is None else started_at
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        self._loaders[name] = loader
+        self._status[name] = EngineStatus()
+
+    def import_module(self, engine: str, module: str) -> ModuleType:
+        """importlib.import_module, with the time charged to `engine`'s import_s."""
+        t0 = time.perf_counter()
+        mod = importlib.import_module(module)
+        elapsed = time.perf_counter() - t0
+        with self._lock:
+            self._status[engine].import_s += elapsed
+        return mod
+
+    # ---- loading ---- #
+
+    def _claim(self, name: str) -> bool:
+        with self._lock:
+            status = self._status[name]
+            if status.state in ("loading", "ready"):
+                return False
+            status.state = "loading"
+            status.error = None
+            status.attempts += 1
+            return True
+
+    def _load(self, name: str) -> None:
+        t0 = time.perf_counter()
+        try:
+            self._loaders[name]()
+        except Exception as e:
+            traceback.print_exc()
+            with self._lock:
+                self._status[name].state = "failed"
+                self._status[name].error = f"{type(e).__name__}: {e}"
+            return
+        with self._lock:
+            self._status[name].state = "ready"
+            self._status[name].load_s = time.perf_counter() - t0
+
+    def start(self, name: str) -> None:
+        if self._claim(name):
+            threading.Thread(target=self._load, args=(name,), name=f"engine-{name}", daemon=True).start()
+
+    def warmup(self, names: Iterable[str]) -> None:
+        """Load `names` one after another on a background thread, then report the startup profile."""
+        self._warmup = [n for n in names if n in self._loaders]
+        self._startup["app_start_s"] = time.perf_counter() - self._t0
+
+        def run() -> None:
+            t0 = time.perf_counter()
+            # one at a time: torch and paddle importing concurrently is asking for trouble
+            for name in self._warmup:
+                if self._claim(name):
+                    self._load(name)
+            self._startup["warmup_s"] = time.perf_counter() - t0
+            self._startup["ready_s"] = time.perf_counter() - self._t0
+            self._report()
+
+        threading.Thread(target=run, name="engine-warmup", daemon=True).start()
+
+    def mark(self, key: str, seconds: float) -> None:
+        self._startup[key] = seconds
+
+    # ---- gating ---- #
+
+    def require(self, *names: str) -> None:
+        with self._lock:
+            missing = [(name, self._status[name].state, self._status[name].error) for name in names]
+        missing = [m for m in missing if m[1] != "ready"]
+        if not missing:
+            return
+        # start every missing engine now, so a route needing several doesn't find them one 503 at a time
+        for name, state, _ in missing:
+            if state in ("pending", "failed"):
+                self.start(name)
+        name, state, error = missing[0]
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "error": "engine not ready",
+                "engine": name,
+                "state": state,
+                "last_error": error,
+                "not_ready": [m[0] for m in missing],
+            },
+            headers={"Retry-After": str(ENGINE_RETRY_AFTER_S)},
+        )
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": all(self._status[n].state == "ready" for n in self._warmup),
+                "warmup": list(self._warmup),
+                "engines": {name: asdict(s) for name, s in self._status.items()},
+                "startup": dict(self._startup),
+            }
+
+    def _report(self) -> None:
+        report = self.status()
+        print(json.dumps({"event": "startup_profile", **report}))
+        if STARTUP_PROFILE_PATH:
+            try:
+                with open(STARTUP_PROFILE_PATH, "w", encoding="utf-8") as f:
+                    json.dump(report, f, indent=2)
+            except OSError as e:
+                print(f"[warn] could not write startup profile: {e}")
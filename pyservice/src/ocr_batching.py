@@ -0,0 +1,79 @@
+import contextvars
+import math
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Sequence, Tuple, TypeVar
+
+import numpy as np
+
+from executor import model_lock
+
+# Threads decoding OCR clips ahead of the recognizer
+OCR_DECODE_WORKERS = int(os.environ.get("OCR_DECODE_WORKERS", "4"))
+# Padded pixels (after resizing to OCR_REC_HEIGHT) allowed in one recognizer batch
+OCR_BATCH_MAX_PIXELS = int(os.environ.get("OCR_BATCH_MAX_PIXELS", str(48 * 1280 * 32)))
+# Upper bound on clips per batch whatever their size
+OCR_MAX_BATCH_SIZE = int(os.environ.get("OCR_MAX_BATCH_SIZE", "32"))
+# Line height the PP-OCR recognizers resize clips to
+OCR_REC_HEIGHT = 48
+
+T = TypeVar("T")
+
+_decode_pool = ThreadPoolExecutor(max_workers=max(1, OCR_DECODE_WORKERS), thread_name_prefix="ocr-decode")
+
+
+def decode_clips(items: Sequence[T], decode: Callable[[T], np.ndarray]) -> List[np.ndarray]:
+    """`decode` over `items` on the decode pool (PIL releases the GIL), in input order."""
+    if len(items) <= 1:
+        return [decode(item) for item in items]
+    futures = [submit_decode(decode, item) for item in items]
+    return [f.result() for f in futures]
+
+
+def submit_decode(decode: Callable[[T], Any], item: T) -> "Future[Any]":
+    """One `decode(item)` on the decode pool, for callers that pipeline decoding themselves."""
+    # the copied context keeps the request's metrics labels
+    return _decode_pool.submit(contextvars.copy_context().run, decode, item)
+
+
+def padded_width(clip: np.ndarray) -> int:
+    height, width = clip.shape[:2]
+    return max(1, math.ceil(OCR_REC_HEIGHT * width / max(1, height)))
+
+
+def plan_batches(
+    clips: Sequence[np.ndarray],
+    max_pixels: int = OCR_BATCH_MAX_PIXELS,
+    max_batch: int = OCR_MAX_BATCH_SIZE,
+) -> List[List[int]]:
+    """
+    Indices of `clips` grouped into recognizer batches. Clips are sorted by
+    aspect ratio so each batch pads to a width close to its members', and a
+    batch closes once (size x widest member) would pass `max_pixels`, so wide
+    lines come in small batches and short words in large ones.
+    """
+    widths = [padded_width(c) for c in clips]
+    order = sorted(range(len(clips)), key=widths.__getitem__)
+    batches: List[List[int]] = []
+    batch: List[int] = []
+    for i in order:
+        # sorted ascending, so clip i is the widest in the batch
+        cost = (len(batch) + 1) * OCR_REC_HEIGHT * widths[i]
+        if batch and (cost > max_pixels or len(batch) >= max_batch):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def recognize(recognizer: Any, clips: Sequence[np.ndarray]) -> List[Tuple[str, float]]:
+    """(text, score) per clip, in input order, with batches planned by `plan_batches`."""
+    texts: List[Tuple[str, float]] = [("", 0.0)] * len(clips)
+    for batch in plan_batches(clips):
+        with model_lock(recognizer):
+            outs = recognizer.predict(input=[clips[i] for i in batch], batch_size=len(batch))
+        for i, o in zip(batch, outs):
+            texts[i] = (o.get("rec_text", ""), float(o.get("rec_score", 0.0)))
+    return texts
@@ -0,0 +1,98 @@
+from functools import lru_cache
+from typing import Sequence, Union
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+BOX_COLOR = (0, 255, 0)
+LABEL_FG = (255, 255, 255)
+LABEL_BG = (0, 0, 0)
+
+try:
+    _FONT = ImageFont.load_default()
+except Exception:
+    _FONT = None
+
+
+@lru_cache(maxsize=4096)
+def _glyph(label: str) -> np.ndarray:
+    """
+    Rasterized label tag (white text on black, 3px/2px padding). Labels carry
+    the score to two decimals, so this caches per (class, score bucket).
+    """
+    probe = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+    tw, th = probe.textbbox((0, 0), label, font=_FONT)[2:]
+    tag = Image.new("RGB", (tw + 7, th + 5), LABEL_BG)
+    ImageDraw.Draw(tag).text((3, 2), label, fill=LABEL_FG, font=_FONT)
+    glyph = np.asarray(tag)
+    glyph.setflags(write=False)
+    return glyph
+
+
+def _label(cls: int, score: float, names: Sequence[str]) -> str:
+    if names and 0 <= cls < len(names):
+        return f"{names[cls]} {score:.2f}"
+    return f"{cls} {score:.2f}"
+
+
+def draw_detections(
+    image: Union[Image.Image, np.ndarray],
+    boxes: Sequence[Sequence[float]],
+    scores: Sequence[float],
+    classes: Sequence[int],
+    names: Sequence[str],
+    min_score: float = 0.0,
+    line_w: int = 3,
+    in_place: bool = False,
+) -> Image.Image:
+    """
+    Box outlines and label tags over `image`.
+
+    Outlines are four slice assignments per box on the pixel array instead of
+    PIL draw calls, and label tags are blitted from a glyph cache. With
+    `in_place` and an HxWx3 uint8 array, the array itself is drawn on (no copy
+    of the page); PIL images are always copied.
+    """
+    if isinstance(image, np.ndarray) and in_place:
+        pixels = image
+    else:
+        pixels = np.array(image.convert("RGB") if isinstance(image, Image.Image) else image, dtype=np.uint8)
+    height, width = pixels.shape[:2]
+
+    if len(boxes):
+        xyxy = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        score_arr = np.asarray(scores, dtype=np.float64)
+        keep = score_arr >= min_score
+        cls_arr = np.asarray(classes, dtype=np.int64)[keep]
+        score_arr = score_arr[keep]
+        # inclusive pixel corners, as PIL's rectangle uses
+        px = xyxy[keep].astype(np.int64)
+        x1 = px[:, 0].clip(0, width - 1)
+        y1 = px[:, 1].clip(0, height - 1)
+        x2 = px[:, 2].clip(0, width - 1)
+        y2 = px[:, 3].clip(0, height - 1)
+        w = max(1, int(line_w))
+
+        color = np.array(BOX_COLOR, dtype=np.uint8)
+        for bx1, by1, bx2, by2 in zip(x1.tolist(), y1.tolist(), x2.tolist(), y2.tolist()):
+            if bx2 < bx1 or by2 < by1:
+                continue
+            pixels[by1:min(by1 + w, by2 + 1), bx1:bx2 + 1] = color
+            pixels[max(by2 - w + 1, by1):by2 + 1, bx1:bx2 + 1] = color
+            pixels[by1:by2 + 1, bx1:min(bx1 + w, bx2 + 1)] = color
+            pixels[by1:by2 + 1, max(bx2 - w + 1, bx1):bx2 + 1] = color
+
+        # tags after all outlines, so no outline crosses a label
+        for bx1, by1, cls, score in zip(px[:, 0].tolist(), px[:, 1].tolist(), cls_arr.tolist(), score_arr.tolist()):
+            glyph = _glyph(_label(int(cls), score, names))
+            gh, gw = glyph.shape[:2]
+            # tag sits above the box, clamped to the top edge
+            tx, ty = bx1, max(0, by1 - (gh - 1))
+            if tx >= width or ty >= height or tx + gw <= 0:
+                continue
+            sx = max(0, -tx)
+            tx = max(0, tx)
+            ph, pw = min(gh, height - ty), min(gw - sx, width - tx)
+            pixels[ty:ty + ph, tx:tx + pw] = glyph[:ph, sx:sx + pw]
+
+    return Image.fromarray(pixels)
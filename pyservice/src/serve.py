@@ -1,21 +1,35 @@
-import io, os, json
-from typing import List, Optional, Tuple, Dict, Any
+import asyncio, io, os, json, threading, time
+_IMPORT_T0 = time.perf_counter()
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
 
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from PIL import Image
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 
 import torch
-from detectron2.config import get_cfg
-from detectron2.engine import DefaultPredictor
-from detectron2.data import MetadataCatalog
+# detectron2, ultralytics and paddleocr are imported by their engine loaders,
+# off the startup path (see engines.py)
 
-import base64
 from pydantic import BaseModel, Field
 from fastapi.responses import StreamingResponse
-from ultralytics import YOLO
+
+from engines import Engines
+from ocr_batching import OCR_DECODE_WORKERS, decode_clips, recognize, submit_decode
+from overlay import draw_detections
+
+# shared with yolo-inference (run-server.sh puts ../yolo-inference/src on PYTHONPATH)
+from executor import executor_stats, get_executor, model_lock
+from metrics import install, json_response, stage, track_pool
+from model_pool import ModelPool
+from result_cache import ResultCache, image_digest, weights_signature
+from streaming import DuplexStreamingResponse, Frame, iter_frames, stream_format
+from tiling import TileParams, predict_tiled
+from transport import EncodedImage, image_request_body, parse_params, read_image_request
+from yolo_engine import YoloEngine, detection_dicts, record_speed
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
@@ -25,6 +39,18 @@ CFG_PATH      = os.environ.get("CFG_PATH", os.path.join(SCRIPT_DIR, "config.yaml
 META_PATH     = os.environ.get("META_PATH", os.path.join(SCRIPT_DIR,"metadata.json"))
 DEVICE        = os.environ.get("DEVICE")  # "cpu" | "mps" | "cuda" (if present)
 SCORE_THRESH  = float(os.environ.get("SCORE_THRESH", "0.5"))
+# engines loaded in the background at startup; the rest load on first request
+WARMUP_ENGINES = os.environ.get("WARMUP_ENGINES", "detectron2,textregions,interactive,ocr_rec")
+
+# Decoded screenshots kept so a /visualize_base64 right after /predict_base64 skips the decode
+DECODED_CACHE_SIZE = int(os.environ.get("DECODED_CACHE_SIZE", "4"))
+# Overlay encodings /visualize_base64 can return
+OVERLAY_FORMATS = {"png": ("PNG", "image/png"), "jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+# prefer mps on Apple Silicon if available; else CPU
+DETECTRON_DEVICE = DEVICE or ("mps" if torch.backends.mps.is_available() else "cpu")
+
+_engines = Engines(started_at=_IMPORT_T0)
 
 # ---------- load metadata (class names) ----------
 thing_classes: List[str] = []
@@ -36,34 +62,62 @@ if os.path.exists(META_PATH):
 else:
     print(f"[warn] {META_PATH} not found; class_names will be omitted")
 
-# ---------- build cfg & predictor ----------
-cfg = get_cfg()
-cfg.merge_from_file(CFG_PATH)
-cfg.MODEL.WEIGHTS = MODEL_WEIGHTS
+# every model below loads on first use and may be evicted past MODEL_POOL_MAX_MB
+_model_pool = ModelPool("pyservice")
 
-# choose device
-if DEVICE:
-    cfg.MODEL.DEVICE = DEVICE
-else:
-    # prefer mps on Apple Silicon if available; else CPU
-    cfg.MODEL.DEVICE = "mps" if torch.backends.mps.is_available() else "cpu"
-
-# runtime thresholds
-cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = SCORE_THRESH
-
-# instantiate predictor
-predictor = DefaultPredictor(cfg)
-
-# attach metadata (optional; only used for friendly class names)
-if thing_classes:
-    # Use a fixed name so later code can look it up if needed
-    ds_name = "inference_dataset"
-    try:
-        MetadataCatalog.get(ds_name).thing_classes = thing_classes
-    except Exception:
-        pass
+# Responses keyed by image bytes + model weights + params
+_result_cache = ResultCache()
 
-app = FastAPI(title="UI Inference Server")
+# ---------- build cfg & predictor ----------
+def _load_predictor():
+    detectron_config = _engines.import_module("detectron2", "detectron2.config")
+    detectron_data = _engines.import_module("detectron2", "detectron2.data")
+    batch_predictor = _engines.import_module("detectron2", "batch_predictor")
+
+    cfg = detectron_config.get_cfg()
+    cfg.merge_from_file(CFG_PATH)
+    cfg.MODEL.WEIGHTS = MODEL_WEIGHTS
+    cfg.MODEL.DEVICE = DETECTRON_DEVICE
+
+    # runtime thresholds
+    cfg.MODEL.ROI_HEADS.SCORE_THRESH_TEST = SCORE_THRESH
+
+    # attach metadata (optional; only used for friendly class names)
+    if thing_classes:
+        # Use a fixed name so later code can look it up if needed
+        ds_name = "inference_dataset"
+        try:
+            detectron_data.MetadataCatalog.get(ds_name).thing_classes = thing_classes
+        except Exception:
+            pass
+
+    # DefaultPredictor, but one forward pass per list of images
+    return batch_predictor.BatchPredictor(cfg)
+
+def _get_predictor():
+    return _model_pool.get("detectron2", _load_predictor, signature=weights_signature(MODEL_WEIGHTS))
+
+_engines.register("detectron2", _get_predictor)
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # engines load on a background thread; uvicorn binds without waiting for them
+    _engines.warmup(name.strip() for name in WARMUP_ENGINES.split(",") if name.strip())
+    yield
+
+app = FastAPI(title="UI Inference Server", lifespan=_lifespan)
+
+track_pool(_model_pool, lambda key: _yolo.label(key))
+install(
+    app,
+    "pyservice",
+    {
+        "model_pool": _model_pool.stats,
+        "executors": executor_stats,
+        "result_cache": _result_cache.stats,
+        "engines": _engines.status,
+    },
+)
 
 # CORS (handy if calling from your browser extension)
 # app.add_middleware(
@@ -73,46 +127,25 @@ app = FastAPI(title="UI Inference Server")
 #     allow_headers=["*"],
 # )
 
-def _draw_detections(
-    pil_img: Image.Image,
-    boxes: list,
-    scores: list,
-    classes: list,
-    names: list,
-    min_score: float = 0.0,
-    line_w: int = 3,
-) -> Image.Image:
-    img = pil_img.copy()
-    draw = ImageDraw.Draw(img)
-    try:
-        font = ImageFont.load_default()
-    except Exception:
-        font = None
-
-    for (x1, y1, x2, y2), s, c in zip(boxes, scores, classes):
-        if s < min_score:
-            continue
-        label = str(c)
-        if names and 0 <= c < len(names):
-            label = f"{names[c]} {s:.2f}"
-        else:
-            label = f"{label} {s:.2f}"
-
-        # box
-        draw.rectangle([x1, y1, x2, y2], outline=(0, 255, 0), width=line_w)
-
-        # text bg
-        tw, th = draw.textbbox((0, 0), label, font=font)[2:]
-        bx, by = int(x1), int(max(0, y1 - th - 4))
-        draw.rectangle([bx, by, bx + tw + 6, by + th + 4], fill=(0, 0, 0))
-        draw.text((bx + 3, by + 2), label, fill=(255, 255, 255), font=font)
-
-    return img
-
 @app.get("/health")
 def health():
-    dev = cfg.MODEL.DEVICE
-    return {"status": "ok", "device": dev, "score_thresh": SCORE_THRESH}
+    dev = DETECTRON_DEVICE
+    return {
+        "status": "ok",
+        "device": dev,
+        "score_thresh": SCORE_THRESH,
+        "loaded_models": sorted([k for k in _model_pool.keys() if not _yolo.owns(k)] + _yolo.loaded_names()),
+        "model_pool": _model_pool.stats(),
+        "executors": executor_stats(),
+        "result_cache": _result_cache.stats(),
+    }
+
+
+@app.get("/ready")
+def ready():
+    # 200 once every warmup engine is loaded, 503 until then; per-engine state either way
+    status = _engines.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
 
 
 @app.get("/labels")
@@ -120,83 +153,55 @@ def labels():
     return {"thing_classes": thing_classes}
 
 
-@app.post("/predict")
-async def predict(file: UploadFile = File(...)):
-    try:
-        img_bytes = await file.read()
-        image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        # Detectron2 expects BGR ndarray (OpenCV convention)
-        img = np.array(image)[:, :, ::-1]
-    except Exception as e:
-        raise HTTPException(400, f"Invalid image: {e}")
-
-    with torch.no_grad():
-        outputs = predictor(img)
-
-    instances = outputs.get("instances", None)
-    if instances is None or len(instances) == 0:
-        return JSONResponse(
-            {
-                "boxes": [],
-                "scores": [],
-                "classes": [],
-                "class_names": [],
-                "width": image.width,
-                "height": image.height,
-            }
-        )
-
-    inst_cpu = instances.to("cpu")
-    boxes  = inst_cpu.pred_boxes.tensor.numpy().tolist() if inst_cpu.has("pred_boxes") else []
-    scores = inst_cpu.scores.numpy().tolist() if inst_cpu.has("scores") else []
-    clses  = inst_cpu.pred_classes.numpy().tolist() if inst_cpu.has("pred_classes") else []
-    names  = [thing_classes[i] if 0 <= i < len(thing_classes) else str(i) for i in clses] if thing_classes else []
-
-    return JSONResponse(
-        {
-            "boxes": boxes,         # [x1, y1, x2, y2]
-            "scores": scores,       # confidence
-            "classes": clses,       # integer ids
-            "class_names": names,   # optional strings
-            "width": image.width,
-            "height": image.height,
-        }
-    )
-
 class ImagePayload(BaseModel):
   image_base64: str
 
-class YoloPayload(ImagePayload):
+class YoloParams(TileParams):
     conf: float = Field(0.25, ge=0.0, le=1.0)
     iou:  float = Field(0.45, ge=0.0, le=1.0)
     imgsz: int   = Field(640,  ge=64,  le=4096)
 
-@app.post("/predict_base64")
-async def predict_base64(payload: ImagePayload):
-    print("received predict request")
+class YoloPayload(ImagePayload, YoloParams):
+    pass
+
+_decoded_lock = threading.Lock()
+_decoded_images: "OrderedDict[str, Image.Image]" = OrderedDict()
+
+def _read_bytes(encoded: EncodedImage) -> bytes:
     try:
-        # decode base64 to bytes
-        img_bytes = base64.b64decode(payload.image_base64)
-        image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        img = np.array(image)[:, :, ::-1]  # BGR
+        # base64 is decoded leniently here, as it always was for these endpoints
+        return encoded.to_bytes(validate=False)
     except Exception as e:
-        raise HTTPException(400, f"Invalid base64 image: {e}")
-
-    with torch.no_grad():
-        outputs = predictor(img)
+        raise HTTPException(400, f"Invalid image: {e}")
 
+def _decode_image(digest: str, img_bytes: bytes) -> Image.Image:
+    with _decoded_lock:
+        image = _decoded_images.get(digest)
+        if image is not None:
+            _decoded_images.move_to_end(digest)
+            return image
+    try:
+        image = EncodedImage(img_bytes).to_pil()
+    except Exception as e:
+        raise HTTPException(400, f"Invalid image: {e}")
+    if DECODED_CACHE_SIZE > 0:
+        with _decoded_lock:
+            _decoded_images[digest] = image
+            while len(_decoded_images) > DECODED_CACHE_SIZE:
+                _decoded_images.popitem(last=False)
+    return image
+
+def _format_instances(image: Image.Image, outputs: Dict[str, Any]) -> Dict[str, Any]:
     instances = outputs.get("instances", None)
     if instances is None or len(instances) == 0:
-        return JSONResponse(
-            {
-                "boxes": [],
-                "scores": [],
-                "classes": [],
-                "class_names": [],
-                "width": image.width,
-                "height": image.height,
-            }
-        )
+        return {
+            "boxes": [],
+            "scores": [],
+            "classes": [],
+            "class_names": [],
+            "width": image.width,
+            "height": image.height,
+        }
 
     inst_cpu = instances.to("cpu")
     boxes  = inst_cpu.pred_boxes.tensor.numpy().tolist() if inst_cpu.has("pred_boxes") else []
@@ -204,47 +209,125 @@ async def predict_base64(payload: ImagePayload):
     clses  = inst_cpu.pred_classes.numpy().tolist() if inst_cpu.has("pred_classes") else []
     names  = [thing_classes[i] if 0 <= i < len(thing_classes) else str(i) for i in clses] if thing_classes else []
 
-    return JSONResponse(
-        {
-            "boxes": boxes,
-            "scores": scores,
-            "classes": clses,
-            "class_names": names,
-            "width": image.width,
-            "height": image.height,
-        }
-    )
-
-@app.post("/visualize_base64")
-async def visualize_base64(payload: ImagePayload, min_score: float = SCORE_THRESH, line_w: int = 3):
-    # decode base64 & run inference
-    try:
-        img_bytes = base64.b64decode(payload.image_base64)
-        image = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-    except Exception as e:
-        raise HTTPException(400, f"Invalid base64 image: {e}")
-    img = np.array(image)[:, :, ::-1]  # BGR
-    with torch.no_grad():
-        outputs = predictor(img)
-
-    instances = outputs.get("instances", None)
-    if instances is None or len(instances) == 0:
-        buf = io.BytesIO()
-        image.save(buf, format="PNG")
-        buf.seek(0)
-        return StreamingResponse(buf, media_type="image/png")
-
-    inst = instances.to("cpu")
-    boxes  = inst.pred_boxes.tensor.numpy().tolist() if inst.has("pred_boxes") else []
-    scores = inst.scores.numpy().tolist() if inst.has("scores") else []
-    clses  = inst.pred_classes.numpy().tolist() if inst.has("pred_classes") else []
-    names  = thing_classes if thing_classes else []
-
-    out_img = _draw_detections(image, boxes, scores, clses, names, min_score=min_score, line_w=line_w)
+    return {
+        "boxes": boxes,         # [x1, y1, x2, y2]
+        "scores": scores,       # confidence
+        "classes": clses,       # integer ids
+        "class_names": names,   # optional strings
+        "width": image.width,
+        "height": image.height,
+    }
+
+def _run_predict_many(encoded: List[EncodedImage], with_images: bool = False) -> List[Tuple[Optional[Image.Image], Dict[str, Any]]]:
+    """
+    (decoded image, detections) per input. Detections are cached by image hash,
+    weights and SCORE_THRESH, so repeat screenshots skip the forward pass; the
+    image is only decoded when the model has to run or `with_images` is set.
+    """
+    signature = weights_signature(MODEL_WEIGHTS)
+    cache_params = {"score_thresh": SCORE_THRESH}
+
+    results: List[Tuple[Optional[Image.Image], Optional[Dict[str, Any]]]] = []
+    misses: List[int] = []
+    digests: List[str] = []
+    for i, item in enumerate(encoded):
+        try:
+            with stage("base64_decode", "detectron2"):
+                img_bytes = _read_bytes(item)
+            digest = image_digest(img_bytes)
+            cached = _result_cache.get("detectron2", signature, digest, cache_params)
+            image = None
+            if cached is None or with_images:
+                with stage("image_decode", "detectron2"):
+                    image = _decode_image(digest, img_bytes)
+        except HTTPException as e:
+            if len(encoded) == 1:
+                raise
+            raise HTTPException(400, f"image {i}: {e.detail}")
+        results.append((image, cached))
+        digests.append(digest)
+        if cached is None:
+            misses.append(i)
+
+    if misses:
+        # Detectron2 expects BGR ndarrays (OpenCV convention)
+        outputs = _get_predictor()([np.asarray(results[i][0])[:, :, ::-1] for i in misses])
+        for i, out in zip(misses, outputs):
+            image = results[i][0]
+            with stage("postprocess", "detectron2"):
+                response = _format_instances(image, out)
+            _result_cache.put("detectron2", signature, digests[i], cache_params, response)
+            results[i] = (image, response)
+    return results
+
+def _run_predict(encoded: EncodedImage) -> Dict[str, Any]:
+    return _run_predict_many([encoded])[0][1]
+
+@app.post("/predict", openapi_extra=image_request_body(ImagePayload, "file"))
+async def predict(request: Request):
+    _engines.require("detectron2")
+    # multipart "file" upload, raw body, or JSON image_base64
+    images, _ = await read_image_request(request, "image_base64")
+    return json_response(await get_executor(DETECTRON_DEVICE).run_async(_run_predict, images[0]), "detectron2")
+
+@app.post("/predict_base64", openapi_extra=image_request_body(ImagePayload, "image_base64"))
+async def predict_base64(request: Request):
+    print("received predict request")
+    _engines.require("detectron2")
+    images, _ = await read_image_request(request, "image_base64")
+    return json_response(await get_executor(DETECTRON_DEVICE).run_async(_run_predict, images[0]), "detectron2")
+
+class BatchPayload(BaseModel):
+    images: List[str]  # list of raw base64
+
+def _run_predict_batch(encoded: List[EncodedImage]) -> Dict[str, Any]:
+    return {"results": [response for _, response in _run_predict_many(encoded)]}
+
+@app.post("/predict/batch", openapi_extra=image_request_body(BatchPayload, "images", many=True))
+async def predict_batch(request: Request):
+    _engines.require("detectron2")
+    # JSON {"images": [...]}, or repeated "images"/"file" uploads
+    images, _ = await read_image_request(request, "images", many=True)
+    return json_response(await get_executor(DETECTRON_DEVICE).run_async(_run_predict_batch, images), "detectron2")
+
+@app.post("/visualize_base64", openapi_extra=image_request_body(ImagePayload, "image_base64"))
+async def visualize_base64(
+    request: Request,
+    min_score: float = SCORE_THRESH,
+    line_w: int = 3,
+    format: str = "png",
+    quality: int = 80,
+):
+    _engines.require("detectron2")
+    if format not in OVERLAY_FORMATS:
+        raise HTTPException(400, f"format must be one of {sorted(OVERLAY_FORMATS)}")
+    if not 1 <= quality <= 100:
+        raise HTTPException(400, "quality must be between 1 and 100")
+    # decode & run inference (or reuse the detections of an earlier predict)
+    images, _ = await read_image_request(request, "image_base64")
+    buf = await get_executor(DETECTRON_DEVICE).run_async(_run_visualize, images[0], min_score, line_w, format, quality)
+    return StreamingResponse(buf, media_type=OVERLAY_FORMATS[format][1])
+
+def _run_visualize(encoded: EncodedImage, min_score: float, line_w: int, fmt: str = "png", quality: int = 80) -> io.BytesIO:
+    image, detections = _run_predict_many([encoded], with_images=True)[0]
+    names = thing_classes if thing_classes else []
+
+    out_img = image
+    if detections["boxes"]:
+        # the decoded image may be shared with the cache, so draw on a copy
+        out_img = draw_detections(
+            image, detections["boxes"], detections["scores"], detections["classes"], names,
+            min_score=min_score, line_w=line_w,
+        )
+    pil_format = OVERLAY_FORMATS[fmt][0]
     buf = io.BytesIO()
-    out_img.save(buf, format="PNG")
+    if pil_format == "PNG":
+        out_img.save(buf, format=pil_format)
+    else:
+        # lossy overlays are a fraction of the PNG size
+        out_img.save(buf, format=pil_format, quality=quality)
     buf.seek(0)
-    return StreamingResponse(buf, media_type="image/png")
+    return buf
 
 
 
@@ -252,188 +335,202 @@ async def visualize_base64(payload: ImagePayload, min_score: float = SCORE_THRES
 
 YOLO_MODEL_TEXT_PATH = os.path.join(SCRIPT_DIR, "yolo/text/textregion.pt")
 YOLO_MODEL_INTERACTIVE_PATH = os.path.join(SCRIPT_DIR, "yolo/interactive/interactive.pt")
+YOLO_MODEL_PATHS = {
+  "textregions": YOLO_MODEL_TEXT_PATH,
+  "interactive": YOLO_MODEL_INTERACTIVE_PATH,
+}
 YOLO_CONF = 0.25
 YOLO_IOU = 0.45
 YOLO_IMGSZ = 640
-yolo_text_model = None
-text_names = {}
-yolo_interactive_model = None
-interactive_names = {}
+
+# shared with yolo-inference; engines whose weights have the same contents share one model
+_yolo = YoloEngine(_model_pool)
 
 def _device():
-  return "mps" if torch.backends.mps.is_available() else "cpu"
+  return _yolo.device
+
+def _load_yolo(engine: str, path: str):
+  _engines.import_module(engine, "ultralytics")
+  model = _yolo.load(path)
+  print(f"yolo {engine} names", getattr(model, "names", None))
+  return model
+
+def _yolo_model(engine: str):
+  path = YOLO_MODEL_PATHS[engine]
+  return _yolo.model(engine, path, load=lambda: _load_yolo(engine, path))
 
 def setup_text_yolo():
-    global yolo_text_model, text_names
-    yolo_text_model = YOLO(YOLO_MODEL_TEXT_PATH)
-    mn = getattr(yolo_text_model, "names", None)
-    text_names = mn
-    print("yolo text names", mn)
-    dummy = np.zeros((640, 640, 3), dtype=np.uint8)
-    yolo_text_model.predict(source=dummy, imgsz=640, conf=0.25, iou=0.45,
-      device=_device(), verbose=False)
+  return _yolo_model("textregions")
 
 def setup_interactive_yolo():
-    global yolo_interactive_model, interactive_names
-    yolo_interactive_model = YOLO(YOLO_MODEL_INTERACTIVE_PATH)
-    mn = getattr(yolo_interactive_model, "names", None)
-    interactive_names = mn
-    print("yolo interactive names", mn)
-    dummy = np.zeros((640, 640, 3), dtype=np.uint8)
-    yolo_interactive_model.predict(source=dummy, imgsz=640, conf=0.25, iou=0.45,
-      device=_device(), verbose=False)
+  return _yolo_model("interactive")
+
+_engines.register("textregions", setup_text_yolo)
+_engines.register("interactive", setup_interactive_yolo)
 
 #--------- end yolo setup -------------
 
-@app.post('/predict_textregions')
-async def predict_textregions(payload: YoloPayload) -> Dict[str, Any]:
-  global yolo_text_model, text_names
-  if yolo_text_model is None:
-    setup_text_yolo()
-
-  conf = float(payload.conf)
-  iou = float(payload.iou)
-  imgsz = int(payload.imgsz)
-
-  if (not 0.0 <= conf <= 1.0 and 0.0 <= iou <= 1.0):
-    raise HTTPException(status_code=400, detail="bad conf or iou (0. - 1.)")
-
-  image_b64 = payload.image_base64
-  img_bytes = base64.b64decode(image_b64, validate=True)
-  img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-
-  width, height = img.size
-
-  results = yolo_text_model.predict(
-    source=img,
-    imgsz=imgsz,
-    conf=conf,
-    iou=iou,
-    device=_device(),
-    verbose=False
-  )
-  r = results[0]
-  detections: List[Dict[str, Any]] = []
-  if getattr(r, "boxes", None) is None:
-    return { "width": width, "height": height, "detections": detections }
-
-  # [[x1,y1,x2,y2]]
-  xyxy = r.boxes.xyxy.cpu().tolist()
-  confs = r.boxes.conf.cpu().tolist()
-  classes = [int(x) for x in r.boxes.cls.cpu().tolist()]
-
-  for (x1,y1,x2,y2), conf, cls in zip(xyxy, confs, classes):
-    label = text_names[cls]
-    detections.append({
-      "box": [float(x1), float(y1), float(x2), float(y2)],
-      "conf": float(conf),
-      "label": label
-    })
-  return { "width": width, "height": height, "detections": detections }
-
-
-@app.post('/predict_interactive')
-async def predict_interactive(payload: YoloPayload) -> Dict[str, Any]:
-  global yolo_interactive_model, interactive_names
-  if yolo_interactive_model is None:
-    setup_interactive_yolo()
-
-  conf = float(payload.conf)
-  iou = float(payload.iou)
-  imgsz = int(payload.imgsz)
-
-  if (not 0.0 <= conf <= 1.0 and 0.0 <= iou <= 1.0):
-    raise HTTPException(status_code=400, detail="bad conf or iou (0. - 1.)")
-
-  image_b64 = payload.image_base64
-  img_bytes = base64.b64decode(image_b64, validate=True)
-  img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-
-  width, height = img.size
-
-  results = yolo_interactive_model.predict(
-    source=img,
-    imgsz=imgsz,
-    conf=conf,
-    iou=iou,
-    device=_device(),
-    verbose=False
-  )
-  r = results[0]
-  detections: List[Dict[str, Any]] = []
-  if getattr(r, "boxes", None) is None:
-    return { "width": width, "height": height, "detections": detections }
-
-  # [[x1,y1,x2,y2]]
-  xyxy = r.boxes.xyxy.cpu().tolist()
-  confs = r.boxes.conf.cpu().tolist()
-  classes = [int(x) for x in r.boxes.cls.cpu().tolist()]
-
-  for (x1,y1,x2,y2), conf, cls in zip(xyxy, confs, classes):
-    label = interactive_names[cls]
-    detections.append({
-      "box": [float(x1), float(y1), float(x2), float(y2)],
-      "conf": float(conf),
-      "label": label
-    })
-  return { "width": width, "height": height, "detections": detections }
+class YoloBatchPayload(BatchPayload, YoloParams):
+  pass
+
+def _run_yolo(engine: str, encoded: List[EncodedImage], payload: YoloParams) -> List[Dict[str, Any]]:
+  """
+  {width, height, detections} per image. Responses are cached by image hash,
+  weights and params; the misses go through the model in one predict call.
+  """
+  signature = weights_signature(YOLO_MODEL_PATHS[engine])
+  cache_params = payload.model_dump()
+
+  responses: List[Optional[Dict[str, Any]]] = []
+  misses: List[Tuple[int, str, Image.Image]] = []
+  for i, item in enumerate(encoded):
+    try:
+      with stage("base64_decode", engine):
+        img_bytes = item.to_bytes()
+      digest = image_digest(img_bytes)
+      cached = _result_cache.get(engine, signature, digest, cache_params)
+      img = None
+      if cached is None:
+        with stage("image_decode", engine):
+          img = EncodedImage(img_bytes).to_pil()
+    except Exception as e:
+      raise HTTPException(status_code=400, detail=f"Invalid image: {e}" if len(encoded) == 1 else f"image {i}: Invalid image: {e}")
+    responses.append(cached)
+    if cached is None:
+      misses.append((i, digest, img))
+  if not misses:
+    return responses
+
+  model = _yolo_model(engine)
+  conf, iou, imgsz = float(payload.conf), float(payload.iou), int(payload.imgsz)
+  images = [img for _, _, img in misses]
+  if payload.tiled:
+    # native-resolution tiles for tall pages, stitched back in page coordinates
+    lists = []
+    for img in images:
+      with stage("forward", engine), model_lock(model):
+        tiled = predict_tiled(model, img, imgsz, conf, iou, _device(),
+          overlap=payload.tile_overlap, merge=payload.tile_merge)
+      lists.append(tuple(a.tolist() for a in tiled))
+  else:
+    lists = _yolo.predict(model, images, imgsz, conf, iou, name=engine)
+
+  for (i, digest, img), (xyxy, confs, classes) in zip(misses, lists):
+    with stage("format", engine):
+      response = {
+        "width": img.width,
+        "height": img.height,
+        "detections": detection_dicts(xyxy, confs, classes, model.names),
+      }
+    _result_cache.put(engine, signature, digest, cache_params, response)
+    responses[i] = response
+  return responses
+
+async def _predict_yolo(engine: str, request: Request, many: bool = False):
+  _engines.require(engine)
+  images, raw_params = await read_image_request(request, "images" if many else "image_base64", many=many)
+  params = parse_params(YoloParams, raw_params)
+  responses = await get_executor(_device()).run_async(_run_yolo, engine, images, params)
+  return json_response({"results": responses} if many else responses[0], engine)
+
+@app.post('/predict_textregions', openapi_extra=image_request_body(YoloPayload, "image_base64"))
+async def predict_textregions(request: Request) -> Dict[str, Any]:
+  return await _predict_yolo("textregions", request)
+
+@app.post('/predict_textregions/batch', openapi_extra=image_request_body(YoloBatchPayload, "images", many=True))
+async def predict_textregions_batch(request: Request) -> Dict[str, Any]:
+  return await _predict_yolo("textregions", request, many=True)
+
+@app.post('/predict_interactive', openapi_extra=image_request_body(YoloPayload, "image_base64"))
+async def predict_interactive(request: Request) -> Dict[str, Any]:
+  return await _predict_yolo("interactive", request)
+
+@app.post('/predict_interactive/batch', openapi_extra=image_request_body(YoloBatchPayload, "images", many=True))
+async def predict_interactive_batch(request: Request) -> Dict[str, Any]:
+  return await _predict_yolo("interactive", request, many=True)
 
 
 #------ big file stew: PaddleOCR ----------
 
-from paddleocr import TextRecognition
-_rec = TextRecognition(
-    model_name="latin_PP-OCRv5_mobile_rec"  # or "PP-OCRv5_server_rec"
-)
+OCR_REC_MODEL = "latin_PP-OCRv5_mobile_rec"  # or "PP-OCRv5_server_rec"
+
+def _load_recognizer():
+    paddleocr = _engines.import_module("ocr_rec", "paddleocr")
+    return paddleocr.TextRecognition(model_name=OCR_REC_MODEL)
+
+def _recognizer():
+    # footprint comes from RSS growth; paddle models aren't torch modules
+    return _model_pool.get("ocr_rec", _load_recognizer, signature=OCR_REC_MODEL)
+
+_engines.register("ocr_rec", _recognizer)
 
 class OCRReq(BaseModel):
     image_b64: str  # raw base64, no 'data:image/...;base64,' prefix
 class OCRReqBatch(BaseModel):
     clips: List[str] # list of raw base64
 
-def _b64_to_np_rgb(b64: str) -> np.ndarray:
+def _to_np_rgb(encoded: EncodedImage) -> np.ndarray:
     try:
-        raw = base64.b64decode(b64, validate=True)
+        with stage("base64_decode", "ocr_rec"):
+            raw = encoded.to_bytes(validate=True)
     except Exception:
         try:
-            raw = base64.b64decode(b64)
+            raw = encoded.to_bytes(validate=False)
         except Exception as e:
             print("invalid base64")
             raise HTTPException(status_code=400, detail=f"Invalid base64: {e}")
     try:
-        img = Image.open(io.BytesIO(raw)).convert("RGB")
+        with stage("image_decode", "ocr_rec"):
+            img = Image.open(io.BytesIO(raw)).convert("RGB")
+            return np.array(img)
     except Exception as e:
         print("cannot decode image")
         raise HTTPException(status_code=400, detail=f"Image decode error: {e}")
-    return np.array(img)
 
-@app.post('/ocr/batch')
-def ocr_endpoint_multi(payload: OCRReqBatch):
-  print(len(payload.clips))
+@app.post('/ocr/batch', openapi_extra=image_request_body(OCRReqBatch, "clips", many=True))
+async def ocr_endpoint_multi(request: Request):
+  _engines.require("ocr_rec")
+  encoded, _ = await read_image_request(request, "clips", many=True)
+  print(len(encoded))
+  return json_response(await get_executor("cpu").run_async(_run_ocr_batch, encoded), "ocr_rec")
+
+def _run_ocr_batch(encoded: List[EncodedImage]):
   try:
-      clips = [_b64_to_np_rgb(b64) for b64 in payload.clips]
+      clips = decode_clips(encoded, _to_np_rgb)
       print("clips", len(clips))
 
-      outs = _rec.predict(input=clips, batch_size=min(32, max(1, len(clips))))
-      print("batch prediction len: ", len(outs))
+      # batched by aspect ratio under a pixel budget; results come back in request order
+      with stage("forward", "ocr_rec"):
+          texts = recognize(_recognizer(), clips)
+      print("batch prediction len: ", len(texts))
       results = []
-      for o in outs:
+      for text, score in texts:
           results.append({
-              "text": o.get("rec_text", ""),
-              "score": float(o.get("rec_score", 0.0))
+              "text": text,
+              "score": score
           })
       return { "results": results }
 
+  except HTTPException:
+      raise
   except Exception as e:
       raise HTTPException(status_code=500)
 
-@app.post('/ocr')
-def ocr_endpoint(payload: OCRReq):
-    img_np = _b64_to_np_rgb(payload.image_b64)
+@app.post('/ocr', openapi_extra=image_request_body(OCRReq, "image_b64"))
+async def ocr_endpoint(request: Request):
+    _engines.require("ocr_rec")
+    encoded, _ = await read_image_request(request, "image_b64")
+    return json_response(await get_executor("cpu").run_async(_run_ocr, encoded[0]), "ocr_rec")
+
+def _run_ocr(encoded: EncodedImage):
+    img_np = _to_np_rgb(encoded)
 
     try:
         # TextRecognition supports numpy ndarrays as input and returns a list of results
-        out = _rec.predict(input=img_np, batch_size=1)
+        with stage("forward", "ocr_rec"):
+            recognizer = _recognizer()
+            with model_lock(recognizer):
+                out = recognizer.predict(input=img_np, batch_size=1)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR error: {e}")
 
@@ -448,4 +545,218 @@ def ocr_endpoint(payload: OCRReq):
     return {"text": text, "score": score}
 
 
-#---------- end big file stew: PaddleOCR --------
\ No newline at end of file
+def _run_ocr_page(encoded: EncodedImage, payload: YoloParams) -> Dict[str, Any]:
+    yolo_text_model = setup_text_yolo()
+    text_names = yolo_text_model.names
+
+    try:
+        with stage("image_decode", "textregions"):
+            image = encoded.to_pil()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    # decoded once; every clip below is a view into this array
+    pixels = np.asarray(image)
+    height, width = pixels.shape[:2]
+
+    if payload.tiled:
+        with stage("forward", "textregions"), model_lock(yolo_text_model):
+            xyxy, confs, classes = predict_tiled(
+                yolo_text_model, image, int(payload.imgsz), float(payload.conf), float(payload.iou), _device(),
+                overlap=payload.tile_overlap, merge=payload.tile_merge,
+            )
+        if len(xyxy) == 0:
+            return {"width": width, "height": height, "detections": []}
+    else:
+        with model_lock(yolo_text_model):
+            results = yolo_text_model.predict(
+                source=image,
+                imgsz=int(payload.imgsz),
+                conf=float(payload.conf),
+                iou=float(payload.iou),
+                device=_device(),
+                verbose=False,
+            )
+        record_speed(results, "textregions")
+        r = results[0]
+        if getattr(r, "boxes", None) is None or len(r.boxes) == 0:
+            return {"width": width, "height": height, "detections": []}
+
+        # x1, y1, x2, y2, conf, cls in one device->host copy
+        data = r.boxes.data.cpu().numpy()
+        xyxy, confs, classes = data[:, :4], data[:, 4], data[:, 5].astype(int)
+
+    # top to bottom, then left to right (same order data-prep relies on)
+    order = np.lexsort((xyxy[:, 0], xyxy[:, 1]))
+    xyxy, confs, classes = xyxy[order], confs[order], classes[order]
+
+    px = np.rint(xyxy).astype(int)
+    px[:, [0, 2]] = px[:, [0, 2]].clip(0, width)
+    px[:, [1, 3]] = px[:, [1, 3]].clip(0, height)
+    valid = (px[:, 2] > px[:, 0]) & (px[:, 3] > px[:, 1])
+    clips = [pixels[y1:y2, x1:x2] for x1, y1, x2, y2 in px[valid]]
+
+    texts = [("", 0.0)] * len(px)
+    if clips:
+        with stage("forward", "ocr_rec"):
+            recognized = recognize(_recognizer(), clips)
+        for i, res in zip(np.flatnonzero(valid), recognized):
+            texts[i] = res
+
+    detections: List[Dict[str, Any]] = []
+    for box, c, cls, (text, score) in zip(xyxy.tolist(), confs.tolist(), classes.tolist(), texts):
+        detections.append({
+            "box": box,
+            "conf": c,
+            "label": text_names[cls],
+            "text": text,
+            "score": score,
+        })
+    return {"width": width, "height": height, "detections": detections}
+
+@app.post('/ocr/page', openapi_extra=image_request_body(YoloPayload, "image_base64"))
+async def ocr_page(request: Request) -> Dict[str, Any]:
+    _engines.require("textregions", "ocr_rec")
+    encoded, raw_params = await read_image_request(request, "image_base64")
+    params = parse_params(YoloParams, raw_params)
+    # text-region detection, in-memory cropping and recognition in one pass
+    return json_response(await get_executor(_device()).run_async(_run_ocr_page, encoded[0], params), "textregions")
+
+
+#---------- streaming OCR --------
+
+# Clips recognized per chunk of /ocr/stream
+OCR_STREAM_CHUNK = int(os.environ.get("OCR_STREAM_CHUNK", "64"))
+# Decoded pixels a chunk may hold before it is recognized early
+OCR_STREAM_MAX_PIXELS = int(os.environ.get("OCR_STREAM_MAX_PIXELS", str(16 * 1024 * 1024)))
+
+class OCRStreamParams(BaseModel):
+    chunk_size: int = Field(OCR_STREAM_CHUNK, ge=1, le=1024)
+    max_pixels: int = Field(OCR_STREAM_MAX_PIXELS, ge=1)
+
+def _decode_clip_timed(encoded: EncodedImage) -> Tuple[np.ndarray, float]:
+    t0 = time.perf_counter()
+    clip = _to_np_rgb(encoded)
+    return clip, time.perf_counter() - t0
+
+def _recognize_chunk(clips: List[np.ndarray]) -> Tuple[List[Tuple[str, float]], float]:
+    t0 = time.perf_counter()
+    with stage("forward", "ocr_rec"):
+        texts = recognize(_recognizer(), clips)
+    return texts, time.perf_counter() - t0
+
+async def _list_frames(encoded: List[EncodedImage]) -> AsyncIterator[Frame]:
+    for index, clip in enumerate(encoded):
+        yield index, clip, None
+
+async def _stream_ocr(frames: AsyncIterator[Frame], params: OCRStreamParams) -> AsyncIterator[bytes]:
+    """
+    NDJSON `{"index", "id", "text", "score"}` per clip (or `"error"`), in input
+    order, plus a `{"chunk", ...}` timing record after each chunk. A chunk is
+    recognized once it holds `chunk_size` clips or `max_pixels` decoded pixels;
+    the body is read no faster than that, so memory stays bounded.
+    """
+    executor = get_executor("cpu")
+    # decodes running ahead of the chunk being filled
+    ahead: Deque[Tuple[int, Any, Optional[asyncio.Future], Optional[str]]] = deque()
+    max_ahead = max(1, OCR_DECODE_WORKERS)
+    chunk: List[Tuple[int, Any, Optional[np.ndarray], Optional[str]]] = []
+    chunk_pixels = 0
+    chunk_decode_s = 0.0
+    chunk_index = 0
+
+    async def take() -> None:
+        nonlocal chunk_pixels, chunk_decode_s
+        index, rec_id, future, error = ahead.popleft()
+        clip = None
+        if future is not None:
+            try:
+                clip, decode_s = await future
+                chunk_pixels += clip.shape[0] * clip.shape[1]
+                chunk_decode_s += decode_s
+            except HTTPException as e:
+                error = str(e.detail)
+            except Exception as e:
+                error = f"Invalid image: {e}"
+        chunk.append((index, rec_id, clip, error))
+
+    async def flush() -> List[bytes]:
+        nonlocal chunk, chunk_pixels, chunk_decode_s, chunk_index
+        clips = [clip for _, _, clip, _ in chunk if clip is not None]
+        texts: List[Tuple[str, float]] = []
+        recognize_s = 0.0
+        chunk_error = None
+        if clips:
+            try:
+                # wait out a busy executor rather than failing the rest of the stream
+                texts, recognize_s = await executor.run_async(_recognize_chunk, clips, wait=True)
+            except HTTPException as e:
+                chunk_error = e.detail
+            except Exception as e:
+                chunk_error = f"OCR error: {e}"
+
+        lines: List[bytes] = []
+        text_iter = iter(texts)
+        for index, rec_id, clip, error in chunk:
+            if clip is None:
+                record = {"index": index, "id": rec_id, "error": error}
+            elif chunk_error is not None:
+                record = {"index": index, "id": rec_id, "error": chunk_error}
+            else:
+                text, score = next(text_iter)
+                record = {"index": index, "id": rec_id, "text": text, "score": score}
+            lines.append(json.dumps(record).encode("utf-8") + b"\n")
+        timing = {
+            "chunk": chunk_index,
+            "clips": len(chunk),
+            "pixels": chunk_pixels,
+            "decode_s": round(chunk_decode_s, 4),
+            "recognize_s": round(recognize_s, 4),
+        }
+        lines.append(json.dumps(timing).encode("utf-8") + b"\n")
+        chunk, chunk_pixels, chunk_decode_s = [], 0, 0.0
+        chunk_index += 1
+        return lines
+
+    index = 0
+    async for rec_id, clip, error in frames:
+        future = asyncio.wrap_future(submit_decode(_decode_clip_timed, clip)) if clip is not None else None
+        ahead.append((index, rec_id, future, error))
+        index += 1
+        if len(ahead) > max_ahead:
+            await take()
+            if len(chunk) >= params.chunk_size or chunk_pixels >= params.max_pixels:
+                for line in await flush():
+                    yield line
+
+    while ahead:
+        await take()
+        if len(chunk) >= params.chunk_size or chunk_pixels >= params.max_pixels:
+            for line in await flush():
+                yield line
+    if chunk:
+        for line in await flush():
+            yield line
+
+@app.post('/ocr/stream', openapi_extra=image_request_body(OCRReqBatch, "clips", many=True))
+async def ocr_stream(request: Request) -> DuplexStreamingResponse:
+    """
+    /ocr/batch for arbitrarily many clips. The body is the same JSON `{"clips": [...]}`,
+    or NDJSON `{"image_b64": ..., "id": ...}` lines / length-prefixed binary frames
+    that are read as they are processed. Tunables go in the query string.
+    """
+    _engines.require("ocr_rec")
+    params = parse_params(OCRStreamParams, dict(request.query_params))
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type == "application/json" or content_type == "multipart/form-data":
+        encoded, _ = await read_image_request(request, "clips", many=True)
+        frames = _list_frames(encoded)
+    else:
+        frames = iter_frames(request, stream_format(request), field="image_b64")
+    return DuplexStreamingResponse(_stream_ocr(frames, params), media_type="application/x-ndjson")
+
+
+#---------- end big file stew: PaddleOCR --------
+
+# serve.py itself, minus the engines (which load in the background)
+_engines.mark("module_import_s", time.perf_counter() - _IMPORT_T0)
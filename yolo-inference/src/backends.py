@@ -0,0 +1,119 @@
+import os
+import shutil
+from typing import Any, Dict
+
+import torch
+from ultralytics import YOLO
+
+# -------------------------- backends -------------------------- #
+
+# "torch": the .pt through eager PyTorch (original behavior)
+# "onnx": exported .onnx (dynamic shapes) run by onnxruntime on CPU
+# "torchscript": exported .torchscript run on CPU; traced at a fixed imgsz
+BACKENDS = ("torch", "onnx", "torchscript")
+
+_EXPORT_SUFFIX = {"onnx": ".onnx", "torchscript": ".torchscript"}
+
+DEFAULT_EXPORT_IMGSZ = 640
+
+
+def registry_entry(model_name: str, entry: Any) -> Dict[str, Any]:
+    """Normalize a MODEL_REGISTRY value: a bare path, or a dict with options."""
+    if isinstance(entry, str):
+        entry = {"path": entry}
+    backend = entry.get("backend", "torch")
+    if backend not in BACKENDS:
+        raise ValueError(f"model {model_name}: unknown backend {backend!r}, expected one of {BACKENDS}")
+    return {
+        "path": entry["path"],
+        "backend": backend,
+        # intra-op threads for the optimized graph; 0 keeps the library default
+        "threads": int(entry.get("threads", 0)),
+        "imgsz": int(entry.get("imgsz", DEFAULT_EXPORT_IMGSZ)),
+    }
+
+
+def exported_path(entry: Dict[str, Any]) -> str:
+    if entry["backend"] == "torch":
+        return entry["path"]
+    stem = os.path.splitext(entry["path"])[0]
+    if entry["backend"] == "torchscript":
+        # a traced graph only runs at its export size, so each size gets its own file
+        stem = f"{stem}.{entry['imgsz']}"
+    return stem + _EXPORT_SUFFIX[entry["backend"]]
+
+
+def model_variant(entry: Dict[str, Any]) -> str:
+    """
+    What, besides the weights, makes a loaded model distinct: entries on the
+    same .pt share one model only when their backend settings match too.
+    """
+    if entry["backend"] == "torch":
+        return "torch"
+    return f"{entry['backend']}-imgsz{entry['imgsz']}-threads{entry['threads']}"
+
+
+def ensure_exported(entry: Dict[str, Any]) -> str:
+    """
+    Path of the weights to load for the entry's backend. Optimized graphs are
+    exported next to the .pt on first use, and re-exported when the .pt is newer.
+    """
+    backend = entry["backend"]
+    target = exported_path(entry)
+    if backend == "torch":
+        return target
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(entry["path"]):
+        return target
+
+    exported = YOLO(entry["path"]).export(
+        format=backend,
+        imgsz=entry["imgsz"],
+        # a dynamic onnx graph serves every imgsz and batch size
+        dynamic=backend == "onnx",
+        device="cpu",
+        verbose=False,
+    )
+    if os.path.abspath(str(exported)) != os.path.abspath(target):
+        shutil.move(str(exported), target)
+    return target
+
+
+def load_model(entry: Dict[str, Any]) -> YOLO:
+    return YOLO(ensure_exported(entry), task="detect")
+
+
+def model_device(entry: Dict[str, Any], default: str) -> str:
+    # exported graphs are for our CPU-only boxes
+    return default if entry["backend"] == "torch" else "cpu"
+
+
+def tune_threads(model: YOLO, entry: Dict[str, Any]) -> None:
+    """
+    Apply the entry's intra-op thread count. Must run after the first predict,
+    once ultralytics has built its inference backend.
+    """
+    threads = entry["threads"]
+    if threads <= 0:
+        return
+
+    if entry["backend"] in ("torch", "torchscript"):
+        # process-wide setting; the last loaded entry wins
+        torch.set_num_threads(threads)
+        return
+
+    backend = getattr(getattr(model, "predictor", None), "model", None)
+    session = getattr(backend, "session", None)
+    if session is None:
+        return
+
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    backend.session = ort.InferenceSession(
+        exported_path(entry),
+        sess_options=options,
+        providers=session.get_providers(),
+    )
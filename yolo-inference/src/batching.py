@@ -0,0 +1,112 @@
+import asyncio
+import os
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set
+
+from executor import InferenceExecutor
+
+# -------------------------- config -------------------------- #
+
+# Flush a batch as soon as it holds this many images...
+BATCH_MAX_SIZE = int(os.environ.get("YOLO_BATCH_MAX_SIZE", "8"))
+# ...or once the oldest queued request has waited this long.
+BATCH_MAX_WAIT_MS = float(os.environ.get("YOLO_BATCH_MAX_WAIT_MS", "5"))
+
+
+@dataclass
+class _Pending:
+    item: Any
+    future: asyncio.Future
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests that share a key and runs them as one batch.
+
+    `run_batch(key, items)` is called off the event loop (on `executor` when
+    given) and must return one result per item, in the same order. Anything it
+    raises is re-raised in every request of that batch.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[Hashable, List[Any]], List[Any]],
+        max_batch_size: int = BATCH_MAX_SIZE,
+        max_wait_ms: float = BATCH_MAX_WAIT_MS,
+        executor: Optional[InferenceExecutor] = None,
+    ) -> None:
+        self._run_batch = run_batch
+        self._executor = executor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self._queues: Dict[Hashable, List[_Pending]] = {}
+        self._timers: Dict[Hashable, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._batch_sizes: Counter = Counter()
+        self._in_flight = 0
+
+    async def submit(self, key: Hashable, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        queue = self._queues.setdefault(key, [])
+        queue.append(_Pending(item=item, future=future))
+
+        if len(queue) >= self.max_batch_size:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.max_wait_ms / 1000.0, self._flush, key)
+
+        return await future
+
+    def _flush(self, key: Hashable) -> None:
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._queues.pop(key, [])
+        # drop requests whose client already went away
+        batch = [p for p in batch if not p.future.done()]
+        if not batch:
+            return
+
+        task = asyncio.get_running_loop().create_task(self._dispatch(key, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, key: Hashable, batch: List[_Pending]) -> None:
+        self._batch_sizes[len(batch)] += 1
+        self._in_flight += len(batch)
+        items = [p.item for p in batch]
+        try:
+            if self._executor is not None:
+                results = await self._executor.run_async(self._run_batch, key, items)
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(None, self._run_batch, key, items)
+        except Exception as e:
+            for p in batch:
+                if not p.future.done():
+                    p.future.set_exception(e)
+            return
+        finally:
+            self._in_flight -= len(batch)
+
+        for p, result in zip(batch, results):
+            if not p.future.done():
+                p.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        queue_depth = {"/".join(str(k) for k in _as_tuple(key)): len(q) for key, q in self._queues.items()}
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "queued": sum(queue_depth.values()),
+            "queue_depth": queue_depth,
+            "in_flight": self._in_flight,
+            "batches": sum(self._batch_sizes.values()),
+            "batch_size_histogram": {str(size): n for size, n in sorted(self._batch_sizes.items())},
+        }
+
+
+def _as_tuple(key: Hashable) -> tuple:
+    return key if isinstance(key, tuple) else (key,)
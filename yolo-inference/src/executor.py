@@ -0,0 +1,134 @@
+import asyncio
+import contextvars
+import os
+import threading
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from fastapi import HTTPException
+
+# -------------------------- config -------------------------- #
+
+# Calls allowed to run at once on a device (a model serves one of them at a time, see model_lock)...
+MAX_CONCURRENCY = int(os.environ.get("INFERENCE_MAX_CONCURRENCY", "2"))
+# ...and how many more may wait for a worker before we answer 503.
+MAX_QUEUE = int(os.environ.get("INFERENCE_MAX_QUEUE", "16"))
+RETRY_AFTER_S = int(os.environ.get("INFERENCE_RETRY_AFTER_S", "1"))
+
+
+class InferenceExecutor:
+    """
+    Bounded thread pool for blocking work (image decoding, forward passes).
+
+    At most `max_workers` calls run at once and at most `max_queue` more wait
+    for a worker. Submitting beyond that raises a 503 instead of queueing
+    unboundedly.
+    """
+
+    def __init__(self, name: str, max_workers: int = MAX_CONCURRENCY, max_queue: int = MAX_QUEUE) -> None:
+        self.name = name
+        self.max_workers = max(1, int(max_workers))
+        self.max_queue = max(0, int(max_queue))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"infer-{name}")
+        self._slots = threading.BoundedSemaphore(self.max_workers + self.max_queue)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+
+    def submit(self, fn: Callable[..., Any], *args: Any) -> Future:
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            raise HTTPException(
+                status_code=503,
+                detail={"error": "inference queue full", "executor": self.name},
+                headers={"Retry-After": str(RETRY_AFTER_S)},
+            )
+        return self._start(fn, *args)
+
+    def _start(self, fn: Callable[..., Any], *args: Any) -> Future:
+        # caller already holds a slot
+        with self._lock:
+            self._pending += 1
+        try:
+            # carry contextvars (e.g. the request metrics labels) into the worker
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _future: Any) -> None:
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Sync entry point, for `def` endpoints and scripts."""
+        return self.submit(fn, *args).result()
+
+    async def run_async(self, fn: Callable[..., Any], *args: Any, wait: bool = False) -> Any:
+        """
+        Async entry point. With `wait=True` a full queue is waited out instead of
+        rejected (used by long-lived streams that must not fail mid-way).
+        """
+        if not wait:
+            return await asyncio.wrap_future(self.submit(fn, *args))
+
+        acquire = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            # the slot is still handed to us eventually; give it straight back
+            acquire.add_done_callback(lambda _: self._slots.release())
+            raise
+        return await asyncio.wrap_future(self._start(fn, *args))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending
+            rejected = self._rejected
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "pending": pending,
+            "rejected": rejected,
+        }
+
+
+# One executor per device, so a slow cpu job never queues behind gpu work
+_executors: Dict[str, InferenceExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(device: str) -> InferenceExecutor:
+    with _executors_lock:
+        if device not in _executors:
+            _executors[device] = InferenceExecutor(device)
+        return _executors[device]
+
+
+# Loaded model -> the lock its calls take; entries go with the model
+_model_locks: "weakref.WeakKeyDictionary[Any, threading.Lock]" = weakref.WeakKeyDictionary()
+_model_locks_lock = threading.Lock()
+
+
+def model_lock(model: Any) -> threading.Lock:
+    """
+    Lock to hold around every call into `model`. Predictors such as
+    ultralytics' YOLO and PaddleOCR keep per-call state and are not
+    thread-safe, while an executor runs several workers per device; other
+    requests' decoding and formatting still overlap the locked call.
+    """
+    with _model_locks_lock:
+        lock = _model_locks.get(model)
+        if lock is None:
+            lock = _model_locks[model] = threading.Lock()
+        return lock
+
+
+def executor_stats() -> Dict[str, Any]:
+    with _executors_lock:
+        return {device: ex.stats() for device, ex in _executors.items()}
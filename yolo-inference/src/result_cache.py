@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+# -------------------------- config -------------------------- #
+
+# In-memory budget for cached responses
+RESULT_CACHE_MAX_MB = float(os.environ.get("RESULT_CACHE_MAX_MB", "256"))
+# Optional directory that entries evicted from memory spill to
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR") or None
+RESULT_CACHE_DISK_MAX_MB = float(os.environ.get("RESULT_CACHE_DISK_MAX_MB", "2048"))
+
+
+def image_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def weights_signature(path: str) -> str:
+    """Cheap fingerprint of a weights file; changes whenever the file is replaced."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return "missing"
+    return f"{st.st_size}-{st.st_mtime_ns}"
+
+
+class ResultCache:
+    """
+    LRU cache of JSON-serializable inference responses, bounded by bytes.
+
+    Entries are keyed by the image digest, the model name, the model's weights
+    signature and the inference parameters. When a model is seen with a new
+    weights signature every entry of that model is dropped. With a spill
+    directory, entries evicted from memory are written to disk and promoted
+    back on the next hit.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = int(RESULT_CACHE_MAX_MB * 1024 * 1024),
+        spill_dir: Optional[str] = RESULT_CACHE_DIR,
+        disk_max_bytes: int = int(RESULT_CACHE_DISK_MAX_MB * 1024 * 1024),
+    ) -> None:
+        self.max_bytes = max(0, int(max_bytes))
+        self.spill_dir = spill_dir
+        self.disk_max_bytes = max(0, int(disk_max_bytes))
+        self._lock = threading.Lock()
+        # key -> (model_name, encoded response)
+        self._mem: "OrderedDict[str, Tuple[str, bytes]]" = OrderedDict()
+        self._mem_bytes = 0
+        # key -> (model_name, file size)
+        self._disk: "OrderedDict[str, Tuple[str, int]]" = OrderedDict()
+        self._disk_bytes = 0
+        self._signatures: Dict[str, str] = {}
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        if self.spill_dir:
+            self._index_spill_dir()
+
+    # ---- keys ---- #
+
+    @staticmethod
+    def make_key(model_name: str, signature: str, digest: str, params: Dict[str, Any]) -> str:
+        raw = json.dumps([model_name, signature, digest, params], sort_keys=True, default=str)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _check_signature(self, model_name: str, signature: str) -> None:
+        # caller holds the lock
+        previous = self._signatures.get(model_name)
+        if previous is not None and previous != signature:
+            self._drop_model(model_name)
+            self._counters["invalidations"] += 1
+        self._signatures[model_name] = signature
+
+    # ---- public api ---- #
+
+    def get(self, model_name: str, signature: str, digest: str, params: Dict[str, Any]) -> Optional[Any]:
+        key = self.make_key(model_name, signature, digest, params)
+        with self._lock:
+            self._check_signature(model_name, signature)
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+                self._counters["hits"] += 1
+                return json.loads(entry[1])
+
+            encoded = self._read_spilled(key)
+            if encoded is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._insert(key, model_name, encoded)
+            return json.loads(encoded)
+
+    def put(self, model_name: str, signature: str, digest: str, params: Dict[str, Any], value: Any) -> None:
+        key = self.make_key(model_name, signature, digest, params)
+        encoded = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        with self._lock:
+            self._check_signature(model_name, signature)
+            self._insert(key, model_name, encoded)
+
+    def invalidate_model(self, model_name: str) -> None:
+        with self._lock:
+            self._drop_model(model_name)
+            self._signatures.pop(model_name, None)
+            self._counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["disk_hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "hit_rate": (self._counters["hits"] + self._counters["disk_hits"]) / lookups if lookups else 0.0,
+                "entries": len(self._mem),
+                "bytes": self._mem_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "spill_dir": self.spill_dir,
+            }
+
+    # ---- memory tier (caller holds the lock) ---- #
+
+    def _insert(self, key: str, model_name: str, encoded: bytes) -> None:
+        if len(encoded) > self.max_bytes:
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= len(old[1])
+        self._mem[key] = (model_name, encoded)
+        self._mem_bytes += len(encoded)
+        while self._mem_bytes > self.max_bytes and self._mem:
+            old_key, (old_model, old_encoded) = self._mem.popitem(last=False)
+            self._mem_bytes -= len(old_encoded)
+            self._counters["evictions"] += 1
+            self._spill(old_key, old_model, old_encoded)
+
+    def _drop_model(self, model_name: str) -> None:
+        for key in [k for k, (m, _) in self._mem.items() if m == model_name]:
+            self._mem_bytes -= len(self._mem.pop(key)[1])
+        for key in [k for k, (m, _) in self._disk.items() if m == model_name]:
+            self._remove_spilled(key)
+
+    # ---- disk tier (caller holds the lock) ---- #
+
+    def _spill_path(self, key: str, model_name: str) -> str:
+        return os.path.join(self.spill_dir, model_name, f"{key}.json")
+
+    def _index_spill_dir(self) -> None:
+        found = []
+        for model_name in os.listdir(self.spill_dir) if os.path.isdir(self.spill_dir) else []:
+            model_dir = os.path.join(self.spill_dir, model_name)
+            if not os.path.isdir(model_dir):
+                continue
+            for fname in os.listdir(model_dir):
+                if fname.endswith(".json"):
+                    st = os.stat(os.path.join(model_dir, fname))
+                    found.append((st.st_mtime, fname[: -len(".json")], model_name, st.st_size))
+        for _, key, model_name, size in sorted(found):
+            self._disk[key] = (model_name, size)
+            self._disk_bytes += size
+
+    def _spill(self, key: str, model_name: str, encoded: bytes) -> None:
+        if not self.spill_dir or len(encoded) > self.disk_max_bytes:
+            return
+        path = self._spill_path(key, model_name)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(encoded)
+        except OSError:
+            return
+        self._disk[key] = (model_name, len(encoded))
+        self._disk_bytes += len(encoded)
+        while self._disk_bytes > self.disk_max_bytes and self._disk:
+            self._remove_spilled(next(iter(self._disk)))
+
+    def _read_spilled(self, key: str) -> Optional[bytes]:
+        entry = self._disk.get(key)
+        if entry is None:
+            return None
+        try:
+            with open(self._spill_path(key, entry[0]), "rb") as f:
+                encoded = f.read()
+        except OSError:
+            encoded = None
+        # promoted back to memory (or gone); either way not on disk anymore
+        self._remove_spilled(key)
+        return encoded
+
+    def _remove_spilled(self, key: str) -> None:
+        model_name, size = self._disk.pop(key)
+        self._disk_bytes -= size
+        try:
+            os.remove(self._spill_path(key, model_name))
+        except OSError:
+            pass
@@ -1,15 +1,25 @@
-import base64
-import io
+import asyncio
+import json
 import os
-from typing import Any, Dict, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple, Union
 
-import numpy as np
 from PIL import Image
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel, Field
 from ultralytics import YOLO
 
-import torch
+from backends import load_model, model_device, model_variant, registry_entry, tune_threads
+from batching import BATCH_MAX_SIZE, MicroBatcher
+from executor import executor_stats, get_executor, model_lock
+from metrics import install, json_response, stage, track_pool
+from model_pool import ModelPool
+from result_cache import ResultCache, image_digest, weights_signature
+from streaming import DuplexStreamingResponse, iter_frames, stream_format
+from tiling import TileParams, predict_tiled
+from transport import EncodedImage, image_request_body, parse_params, read_image_request
+from yolo_engine import YoloEngine, default_device, detection_dicts, detection_lists, record_speed
 
 # -------------------------- config -------------------------- #
 
@@ -17,36 +27,37 @@ SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # Map semantic names -> model file paths.
 # Edit these to match your on-disk layout.
-MODEL_REGISTRY: Dict[str, str] = {
+# An entry may also be a dict to run an exported graph on CPU, e.g.
+#   {"path": ".../best.pt", "backend": "onnx", "threads": 4, "imgsz": 640}
+# (see backends.py for the options)
+MODEL_REGISTRY: Dict[str, Union[str, Dict[str, Any]]] = {
   "textregions": os.path.join(SCRIPT_DIR, "../models/text/best.pt"),
   "interactive": os.path.join(SCRIPT_DIR, "../models/interactive/best.pt"),
   "service_manuals": os.path.join(SCRIPT_DIR, "../models/service_manuals/best.pt"),
 }
 
-# Cache loaded YOLO models + names
-_model_cache: Dict[str, YOLO] = {}
-_names_cache: Dict[str, Dict[int, str]] = {}
+# Threads decoding images of /yolo_predictions/stream ahead of the model
+STREAM_DECODE_WORKERS = int(os.environ.get("STREAM_DECODE_WORKERS", "4"))
+
+# Loaded YOLO models, bounded by MODEL_POOL_MAX_MB
+_model_pool: ModelPool[YOLO] = ModelPool("yolo")
+# Registry names whose weights have the same contents share one loaded model
+_engine = YoloEngine(_model_pool)
+
+# Responses keyed by image bytes + model weights + params
+_result_cache = ResultCache()
 
 def _device() -> str:
-    # Keep parity with your existing behavior
-    if torch.backends.mps.is_available():
-        return "mps"
-    # ultralytics will use cuda if available when device=0 or "cuda",
-    # but we keep this explicit and stable:
-    return "cuda" if torch.cuda.is_available() else "cpu"
-
-
-def _warmup(model: YOLO) -> None:
-    # Optional: helps avoid first-request latency spikes
-    dummy = np.zeros((640, 640, 3), dtype=np.uint8)
-    model.predict(
-        source=dummy,
-        imgsz=640,
-        conf=0.25,
-        iou=0.45,
-        device=_device(),
-        verbose=False,
-    )
+    # mps, then cuda, then cpu; probed once per process
+    return default_device()
+
+
+def _registry_entry(model_name: str) -> Dict[str, Any]:
+    try:
+        return registry_entry(model_name, MODEL_REGISTRY[model_name])
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail={"error": "bad model registry entry", "exc": str(e)})
+
 
 def _get_model(model_name: str) -> YOLO:
     if model_name not in MODEL_REGISTRY:
@@ -59,11 +70,8 @@ def _get_model(model_name: str) -> YOLO:
             },
         )
 
-    # Return cached model if already loaded
-    if model_name in _model_cache:
-        return _model_cache[model_name]
-
-    path = MODEL_REGISTRY[model_name]
+    entry = _registry_entry(model_name)
+    path = entry["path"]
     if not os.path.exists(path):
         raise HTTPException(
             status_code=500,
@@ -73,14 +81,20 @@ def _get_model(model_name: str) -> YOLO:
                 "path": path,
             },
         )
+    # Pooled model is reused while its weights file is unchanged
+    return _engine.model(model_name, path, variant=model_variant(entry), load=lambda: _load_model(model_name, entry))
+
+
+def _model_signature(entry: Dict[str, Any]) -> str:
+    return f"{entry['backend']}:{weights_signature(entry['path'])}"
 
+
+def _load_model(model_name: str, entry: Dict[str, Any]) -> YOLO:
+    path = entry["path"]
     try:
-        m = YOLO(path)
-        # names is usually dict[int,str] in ultralytics
-        names = getattr(m, "names", None) or {}
-        _model_cache[model_name] = m
-        _names_cache[model_name] = names
-        _warmup(m)
+        m = load_model(entry)
+        _engine.warmup(m, entry["imgsz"], model_device(entry, _device()))
+        tune_threads(m, entry)
         return m
     except HTTPException:
         raise
@@ -90,15 +104,55 @@ def _get_model(model_name: str) -> YOLO:
             detail={"error": "failed to load model", "model_name": model_name, "path": path, "exc": str(e)},
         )
 
+def _model_imgsz(entry: Dict[str, Any], imgsz: int) -> int:
+    # traced graphs only run at the size they were exported with
+    return entry["imgsz"] if entry["backend"] == "torchscript" else imgsz
+
+
+def _predict_batch(key: Tuple[str, int, float, float], images: List[Image.Image]) -> List[Any]:
+    model_name, imgsz, conf, iou = key
+    model = _get_model(model_name)
+    entry = _registry_entry(model_name)
+    try:
+        with model_lock(model):
+            results = model.predict(
+                source=images,
+                imgsz=_model_imgsz(entry, imgsz),
+                conf=conf,
+                iou=iou,
+                device=model_device(entry, _device()),
+                verbose=False,
+            )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"YOLO predict error: {e}")
+    record_speed(results, model_name)
+    return results
+
+
+# Requests with the same (model_name, imgsz, conf, iou) share one predict call
+_batcher = MicroBatcher(_predict_batch, executor=get_executor(_device()))
+
 # -------------------------- api -------------------------- #
 
 app = FastAPI(title="YOLO Inference Server")
 
+track_pool(_model_pool, _engine.label)
+install(
+    app,
+    "yolo-inference",
+    {
+        "model_pool": _model_pool.stats,
+        "batching": _batcher.stats,
+        "executors": executor_stats,
+        "result_cache": _result_cache.stats,
+    },
+)
+
 
 class ImagePayload(BaseModel):
     image_base64: str
 
-class YoloPayload(ImagePayload):
+class YoloParams(BaseModel):
     # required model name
     model_name: str = Field(..., min_length=1)
 
@@ -107,6 +161,23 @@ class YoloPayload(ImagePayload):
     iou: float = Field(0.45, ge=0.0, le=1.0)
     imgsz: int = Field(640, ge=64, le=4096)
 
+class YoloTileParams(YoloParams, TileParams):
+    pass
+
+class YoloPayload(ImagePayload, YoloTileParams):
+    pass
+
+
+def _registry_backends() -> Dict[str, Any]:
+    # a bad entry is reported in place rather than failing the whole health check
+    backends: Dict[str, Any] = {}
+    for name in sorted(MODEL_REGISTRY):
+        try:
+            backends[name] = registry_entry(name, MODEL_REGISTRY[name])["backend"]
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            backends[name] = {"error": "bad model registry entry", "exc": str(e)}
+    return backends
+
 
 @app.get("/health")
 def health() -> Dict[str, Any]:
@@ -114,62 +185,197 @@ def health() -> Dict[str, Any]:
         "status": "ok",
         "device": _device(),
         "available_models": sorted(MODEL_REGISTRY.keys()),
-        "loaded_models": sorted(_model_cache.keys()),
+        "loaded_models": _engine.loaded_names(),
+        "backends": _registry_backends(),
+        "model_pool": _model_pool.stats(),
+        "batching": _batcher.stats(),
+        "executors": executor_stats(),
+        "result_cache": _result_cache.stats(),
     }
 
-@app.post("/yolo_predictions")
-async def yolo_predictions(payload: YoloPayload) -> Dict[str, Any]:
-    # validate params
-    conf = float(payload.conf)
-    iou = float(payload.iou)
-    imgsz = int(payload.imgsz)
+def _prepare_yolo(
+    image: EncodedImage, params: YoloParams
+) -> Tuple[Optional[Dict[str, Any]], Optional[Image.Image], str, str]:
+    """Returns (cached response, decoded image, image digest, weights signature)."""
+    # load (or fail on unknown model) before queueing for a batch
+    _get_model(params.model_name)
+    signature = _model_signature(_registry_entry(params.model_name))
 
-    if not (0.0 <= conf <= 1.0 and 0.0 <= iou <= 1.0):
-        raise HTTPException(status_code=400, detail="bad conf or iou (0. - 1.)")
+    try:
+        with stage("base64_decode", params.model_name):
+            img_bytes = image.to_bytes()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+
+    digest = image_digest(img_bytes)
+    cached = _result_cache.get(params.model_name, signature, digest, _cache_params(params))
+    if cached is not None:
+        return cached, None, digest, signature
 
-    # decode base64 image
+    # decode image (raw bytes or base64)
     try:
-        img_bytes = base64.b64decode(payload.image_base64, validate=True)
-        img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+        with stage("image_decode", params.model_name):
+            img = EncodedImage(img_bytes).to_pil()
     except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Invalid base64 image: {e}")
+        raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+    return None, img, digest, signature
 
-    width, height = img.size
 
-    model = _get_model(payload.model_name)
-    names = _names_cache.get(payload.model_name, {}) or {}
+def _cache_params(params: YoloParams) -> Dict[str, Any]:
+    cache_params: Dict[str, Any] = {"conf": params.conf, "iou": params.iou, "imgsz": params.imgsz}
+    if getattr(params, "tiled", False):
+        cache_params.update(tiled=True, tile_overlap=params.tile_overlap, tile_merge=params.tile_merge)
+    return cache_params
+
+
+def _format_detections(r: Any, names: Dict[int, str], width: int, height: int) -> Dict[str, Any]:
+    xyxy, confs, classes = detection_lists(r)
+    return _detections_response(xyxy, confs, classes, names, width, height)
+
+
+def _detections_response(
+    xyxy: List[List[float]], confs: List[float], classes: List[int], names: Dict[int, str], width: int, height: int
+) -> Dict[str, Any]:
+    return {"imgWidth": width, "imgHeight": height, "detections": detection_dicts(xyxy, confs, classes, names)}
+
 
+def _predict_tiled(img: Image.Image, params: YoloTileParams) -> Dict[str, Any]:
+    model = _get_model(params.model_name)
+    entry = _registry_entry(params.model_name)
     try:
-        results = model.predict(
-            source=img,
-            imgsz=imgsz,
-            conf=conf,
-            iou=iou,
-            device=_device(),
-            verbose=False,
-        )
+        # tiling, the tiles' forward passes and the seam merge
+        with stage("forward", params.model_name), model_lock(model):
+            xyxy, confs, classes = predict_tiled(
+                model,
+                img,
+                imgsz=_model_imgsz(entry, int(params.imgsz)),
+                conf=float(params.conf),
+                iou=float(params.iou),
+                device=model_device(entry, _device()),
+                overlap=params.tile_overlap,
+                merge=params.tile_merge,
+            )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"YOLO predict error: {e}")
+    names = getattr(model, "names", None) or {}
+    with stage("format", params.model_name):
+        return _detections_response(xyxy.tolist(), confs.tolist(), classes.tolist(), names, *img.size)
 
-    r = results[0]
-    detections: List[Dict[str, Any]] = []
-
-    if getattr(r, "boxes", None) is None:
-        return {"imgWidth": width, "imgHeight": height, "detections": detections}
-
-    # [[x1,y1,x2,y2]]
-    xyxy = r.boxes.xyxy.cpu().tolist()
-    confs = r.boxes.conf.cpu().tolist()
-    classes = [int(x) for x in r.boxes.cls.cpu().tolist()]
-
-    for (x1, y1, x2, y2), c, cls in zip(xyxy, confs, classes):
-        label = names.get(cls, str(cls))
-        detections.append(
-            {
-                "box": [float(x1), float(y1), float(x2), float(y2)],
-                "conf": float(c),
-                "label": label,
-            }
-        )
 
-    return {"imgWidth": width, "imgHeight": height, "detections": detections}
+@app.post("/yolo_predictions", openapi_extra=image_request_body(YoloPayload, "image_base64"))
+async def yolo_predictions(request: Request) -> Dict[str, Any]:
+    images, raw_params = await read_image_request(request, "image_base64")
+    params = parse_params(YoloTileParams, raw_params)
+
+    # validate params
+    conf = float(params.conf)
+    iou = float(params.iou)
+    imgsz = int(params.imgsz)
+
+    if not (0.0 <= conf <= 1.0 and 0.0 <= iou <= 1.0):
+        raise HTTPException(status_code=400, detail="bad conf or iou (0. - 1.)")
+
+    cached, img, digest, signature = await get_executor(_device()).run_async(_prepare_yolo, images[0], params)
+    if cached is not None:
+        return json_response(cached, params.model_name)
+
+    width, height = img.size
+
+    if params.tiled:
+        # the tiles are already a batch; skip the micro-batcher
+        response = await get_executor(_device()).run_async(_predict_tiled, img, params)
+    else:
+        r = await _batcher.submit((params.model_name, imgsz, conf, iou), img)
+        # names is usually dict[int,str] in ultralytics
+        with stage("format", params.model_name):
+            response = _format_detections(r, getattr(r, "names", None) or {}, width, height)
+    _result_cache.put(params.model_name, signature, digest, _cache_params(params), response)
+    return json_response(response, params.model_name)
+
+
+# -------------------------- streaming -------------------------- #
+
+_decode_pool = ThreadPoolExecutor(max_workers=STREAM_DECODE_WORKERS, thread_name_prefix="stream-decode")
+
+
+class YoloStreamParams(YoloParams):
+    batch_size: int = Field(BATCH_MAX_SIZE, ge=1, le=64)
+
+
+def _decode_frame(image: EncodedImage) -> Image.Image:
+    return image.to_pil()
+
+
+async def _stream_predictions(request: Request, fmt: str, params: YoloStreamParams) -> AsyncIterator[bytes]:
+    loop = asyncio.get_running_loop()
+    executor = get_executor(_device())
+    key = (params.model_name, int(params.imgsz), float(params.conf), float(params.iou))
+
+    # decoded images waiting for the model; at most two batches are held at once
+    pending: Deque[Tuple[int, Any, Optional[asyncio.Future], Optional[str]]] = deque()
+    max_pending = 2 * params.batch_size
+
+    async def run_batch(batch: List[Tuple[int, Any, Optional[asyncio.Future], Optional[str]]]) -> List[bytes]:
+        decoded: List[Tuple[int, Any, Optional[Image.Image], Optional[str]]] = []
+        for index, rec_id, future, error in batch:
+            img = None
+            if future is not None:
+                try:
+                    img = await future
+                except Exception as e:
+                    error = f"Invalid image: {e}"
+            decoded.append((index, rec_id, img, error))
+
+        images = [img for _, _, img, _ in decoded if img is not None]
+        results: List[Any] = []
+        batch_error = None
+        if images:
+            try:
+                # wait out a busy executor rather than failing the rest of the stream
+                results = await executor.run_async(_predict_batch, key, images, wait=True)
+            except HTTPException as e:
+                batch_error = e.detail
+            except Exception as e:
+                batch_error = str(e)
+
+        lines: List[bytes] = []
+        result_iter = iter(results)
+        for index, rec_id, img, error in decoded:
+            if img is None:
+                record = {"index": index, "id": rec_id, "error": error}
+            elif batch_error is not None:
+                record = {"index": index, "id": rec_id, "error": batch_error}
+            else:
+                r = next(result_iter)
+                record = {"index": index, "id": rec_id, **_format_detections(r, getattr(r, "names", None) or {}, *img.size)}
+            lines.append(json.dumps(record).encode("utf-8") + b"\n")
+        return lines
+
+    index = 0
+    async for rec_id, image, error in iter_frames(request, fmt):
+        decoded = loop.run_in_executor(_decode_pool, _decode_frame, image) if image is not None else None
+        pending.append((index, rec_id, decoded, error))
+        index += 1
+        if len(pending) >= max_pending:
+            batch = [pending.popleft() for _ in range(params.batch_size)]
+            for line in await run_batch(batch):
+                yield line
+
+    while pending:
+        batch = [pending.popleft() for _ in range(min(params.batch_size, len(pending)))]
+        for line in await run_batch(batch):
+            yield line
+
+
+@app.post("/yolo_predictions/stream")
+async def yolo_predictions_stream(request: Request) -> DuplexStreamingResponse:
+    """
+    Bulk inference over a stream of images in one request. Tunables go in the
+    query string; the body is NDJSON lines or length-prefixed binary frames.
+    One NDJSON record per image is streamed back as soon as its batch is done.
+    """
+    fmt = stream_format(request)
+    params = parse_params(YoloStreamParams, dict(request.query_params))
+    # fail fast (before the response starts) on an unknown or broken model
+    await get_executor(_device()).run_async(_get_model, params.model_name, wait=True)
+    return DuplexStreamingResponse(_stream_predictions(request, fmt, params), media_type="application/x-ndjson")
@@ -0,0 +1,119 @@
+import json
+import os
+from typing import Any, AsyncIterator, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+
+from transport import EncodedImage
+
+# -------------------------- config -------------------------- #
+
+# Largest single image (or NDJSON line) accepted in a stream
+STREAM_MAX_FRAME_MB = float(os.environ.get("STREAM_MAX_FRAME_MB", "64"))
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/ndjson")
+BINARY_TYPES = ("application/octet-stream",)
+
+# (record id, image) or (record id, error message)
+Frame = Tuple[Any, Optional[EncodedImage], Optional[str]]
+
+
+def stream_format(request: Request) -> str:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in NDJSON_TYPES:
+        return "ndjson"
+    if content_type in BINARY_TYPES:
+        return "binary"
+    raise HTTPException(
+        status_code=415,
+        detail="expected application/x-ndjson lines or application/octet-stream length-prefixed frames",
+    )
+
+
+async def iter_frames(request: Request, fmt: str, field: str = "image_base64") -> AsyncIterator[Frame]:
+    """
+    Yield images from the request body as they arrive, without buffering the
+    whole upload.
+
+    - ndjson: one JSON object per line, `{"image_base64": "...", "id": optional}`
+    - binary: repeated frames of a 4-byte big-endian length followed by the image bytes
+
+    Records default to their position in the stream as id. A frame over the
+    size limit ends the stream with an error record.
+    """
+    max_frame = int(STREAM_MAX_FRAME_MB * 1024 * 1024)
+    buf = bytearray()
+    # buf[:start] is consumed; buf[start:scanned] is known to hold no newline
+    start = scanned = 0
+    index = 0
+
+    try:
+        async for chunk in request.stream():
+            # drop consumed bytes once per chunk rather than once per record
+            del buf[:start]
+            scanned -= start
+            start = 0
+            buf += chunk
+            while True:
+                if fmt == "ndjson":
+                    # only search the bytes appended since the last scan, so a long line stays linear
+                    end = buf.find(b"\n", scanned)
+                    if end < 0:
+                        scanned = len(buf)
+                        if len(buf) - start > max_frame:
+                            yield index, None, f"line {index} exceeds {STREAM_MAX_FRAME_MB} MB"
+                            return
+                        break
+                    line = bytes(buf[start:end])
+                    start = scanned = end + 1
+                    if line.strip():
+                        yield _parse_line(line, index, field)
+                        index += 1
+                else:
+                    if len(buf) - start < 4:
+                        break
+                    size = int.from_bytes(buf[start : start + 4], "big")
+                    if size > max_frame:
+                        yield index, None, f"frame {index} of {size} bytes exceeds {STREAM_MAX_FRAME_MB} MB"
+                        return
+                    if len(buf) - start < 4 + size:
+                        break
+                    data = bytes(buf[start + 4 : start + 4 + size])
+                    start += 4 + size
+                    yield index, EncodedImage(data), None
+                    index += 1
+    except ClientDisconnect:
+        return
+
+    rest = buf[start:]
+    if fmt == "ndjson" and rest.strip():
+        yield _parse_line(bytes(rest), index, field)
+    elif fmt == "binary" and rest:
+        yield index, None, f"truncated frame ({len(rest)} trailing bytes)"
+
+
+def _parse_line(line: bytes, index: int, field: str) -> Frame:
+    try:
+        record = json.loads(line)
+    except Exception as e:
+        return index, None, f"invalid JSON line: {e}"
+    if not isinstance(record, dict) or not isinstance(record.get(field), str):
+        return index, None, f"line is missing {field}"
+    return record.get("id", index), EncodedImage(record[field]), None
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body generator keeps reading the request stream.
+
+    The stock response listens for disconnects on `receive` while sending,
+    which would swallow request body chunks the generator still needs; here
+    disconnects surface through `request.stream()` instead.
+    """
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
@@ -0,0 +1,217 @@
+import os
+from typing import Any, List, Literal, Tuple
+
+import numpy as np
+from PIL import Image
+from pydantic import BaseModel, Field
+
+# -------------------------- config -------------------------- #
+
+# Fraction of a tile shared with its neighbour
+TILE_OVERLAP = float(os.environ.get("TILE_OVERLAP", "0.2"))
+# Tiles per predict call; bounds memory however tall the page is
+TILE_MAX_BATCH = int(os.environ.get("TILE_MAX_BATCH", "16"))
+# Intersection over the smaller box above which detections from neighbouring tiles are merged
+TILE_MERGE_THRESHOLD = float(os.environ.get("TILE_MERGE_THRESHOLD", "0.5"))
+
+# (boxes xyxy [n, 4], confidences [n], class ids [n]) in page pixels
+Detections = Tuple[np.ndarray, np.ndarray, np.ndarray]
+
+
+class TileParams(BaseModel):
+    # split the page into overlapping imgsz x imgsz tiles instead of downsampling it whole
+    tiled: bool = False
+    tile_overlap: float = Field(TILE_OVERLAP, ge=0.0, le=0.9)
+    # "nms" keeps the best box of each duplicate group, "wbf" averages them weighted by confidence
+    tile_merge: Literal["nms", "wbf"] = "nms"
+
+
+def _starts(length: int, tile: int, stride: int) -> List[int]:
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    # last tile flush with the far edge
+    starts.append(length - tile)
+    return starts
+
+
+def tile_offsets(width: int, height: int, tile: int, overlap: float) -> np.ndarray:
+    """Top-left corners (x, y) of the tiles covering a width x height page, row by row."""
+    stride = max(1, int(tile * (1.0 - overlap)))
+    xs = _starts(width, tile, stride)
+    ys = _starts(height, tile, stride)
+    return np.array([(x, y) for y in ys for x in xs], dtype=np.int64)
+
+
+def tile_rects(offsets: np.ndarray, tile: int, width: int, height: int) -> np.ndarray:
+    """Page-space (x1, y1, x2, y2) of each tile; edge tiles are cut short by the page."""
+    rects = np.concatenate([offsets, offsets + tile], axis=1).astype(np.float32)
+    rects[:, 2] = np.minimum(rects[:, 2], width)
+    rects[:, 3] = np.minimum(rects[:, 3], height)
+    return rects
+
+
+def _intersect(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Element-wise (broadcast) intersection rectangles of xyxy boxes; x2 < x1 or y2 < y1 when empty."""
+    return np.stack(
+        [
+            np.maximum(a[..., 0], b[..., 0]),
+            np.maximum(a[..., 1], b[..., 1]),
+            np.minimum(a[..., 2], b[..., 2]),
+            np.minimum(a[..., 3], b[..., 3]),
+        ],
+        axis=-1,
+    )
+
+
+def _area(boxes: np.ndarray) -> np.ndarray:
+    return np.clip(boxes[..., 2] - boxes[..., 0], 0, None) * np.clip(boxes[..., 3] - boxes[..., 1], 0, None)
+
+
+def _overlap_ratio(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """
+    Intersection over the smaller box. Unlike IoU this stays high between a
+    full box and the slice of it a neighbouring tile cut at the seam.
+    """
+    inter = _area(_intersect(box, boxes))
+    return inter / np.maximum(np.minimum(_area(box), _area(boxes)), 1e-9)
+
+
+def clipped_at_seam(xyxy: np.ndarray, rects: np.ndarray, width: int, height: int, tol: float = 1.0) -> np.ndarray:
+    """
+    Boxes touching an edge of their tile that is not the page edge: the tile
+    only saw part of the object, so the box is a fragment of it.
+    """
+    return (
+        ((xyxy[:, 0] - rects[:, 0] <= tol) & (rects[:, 0] > 0))
+        | ((xyxy[:, 1] - rects[:, 1] <= tol) & (rects[:, 1] > 0))
+        | ((rects[:, 2] - xyxy[:, 2] <= tol) & (rects[:, 2] < width))
+        | ((rects[:, 3] - xyxy[:, 3] <= tol) & (rects[:, 3] < height))
+    )
+
+
+def merge_detections(
+    xyxy: np.ndarray,
+    confs: np.ndarray,
+    classes: np.ndarray,
+    tiles: np.ndarray,
+    rects: np.ndarray,
+    width: int,
+    height: int,
+    method: str = "nms",
+    threshold: float = TILE_MERGE_THRESHOLD,
+) -> Detections:
+    """
+    Greedy, class-aware merge of the duplicates tiling creates, highest
+    confidence first. `tiles` is the tile index of each box and `rects` the
+    tiles' page rectangles. Two boxes are duplicates only when they come from
+    different tiles, their intersection lies in those tiles' shared overlap
+    strip and it covers `threshold` of the smaller box; boxes from one tile
+    (nested regions, a button in its container) are the model's own output
+    and are never merged.
+
+    A group keeps its best box that its tile saw whole ("wbf": the
+    confidence-weighted mean of those); a group made only of fragments cut at
+    seams becomes their union.
+    """
+    if len(xyxy) == 0:
+        return xyxy, confs, classes
+
+    order = np.argsort(-confs, kind="stable")
+    xyxy, confs, classes, tiles = xyxy[order], confs[order], classes[order], tiles[order]
+    box_rects = rects[tiles]
+    fragment = clipped_at_seam(xyxy, box_rects, width, height)
+    merged = np.zeros(len(xyxy), dtype=bool)
+
+    out_boxes: List[np.ndarray] = []
+    out_confs: List[float] = []
+    out_classes: List[int] = []
+    for i in range(len(xyxy)):
+        if merged[i]:
+            continue
+        group = ~merged & (classes == classes[i]) & (tiles != tiles[i])
+        # overlap strip of tile i with each other box's tile, and how much of the pair's intersection is in it
+        strips = _intersect(box_rects[i], box_rects)
+        inter = _intersect(xyxy[i], xyxy)
+        inter_area = _area(inter)
+        in_strip = _area(_intersect(inter, strips))
+        group &= (inter_area > 0) & (in_strip >= 0.5 * inter_area)
+        group &= _overlap_ratio(xyxy[i], xyxy) >= threshold
+        group[i] = True
+        merged |= group
+
+        whole = group & ~fragment
+        if whole.any():
+            if method == "wbf":
+                weights = confs[whole]
+                out_boxes.append((xyxy[whole] * weights[:, None]).sum(axis=0) / weights.sum())
+            else:
+                # sorted by confidence, so the first whole box is the best one
+                out_boxes.append(xyxy[np.flatnonzero(whole)[0]])
+        else:
+            pieces = xyxy[group]
+            out_boxes.append(np.concatenate([pieces[:, :2].min(axis=0), pieces[:, 2:].max(axis=0)]))
+        out_confs.append(float(confs[i]))
+        out_classes.append(int(classes[i]))
+
+    return (
+        np.stack(out_boxes).astype(np.float32),
+        np.array(out_confs, dtype=np.float32),
+        np.array(out_classes, dtype=np.int64),
+    )
+
+
+def predict_tiled(
+    model: Any,
+    image: Image.Image,
+    imgsz: int,
+    conf: float,
+    iou: float,
+    device: str,
+    overlap: float = TILE_OVERLAP,
+    merge: str = "nms",
+    max_batch: int = TILE_MAX_BATCH,
+) -> Detections:
+    """
+    Run an ultralytics model over overlapping imgsz x imgsz tiles of `image`
+    at native resolution, in batches of `max_batch`, and return the merged
+    detections in page coordinates.
+    """
+    # ultralytics takes ndarrays as BGR
+    pixels = np.asarray(image.convert("RGB"))[:, :, ::-1]
+    height, width = pixels.shape[:2]
+    offsets = tile_offsets(width, height, imgsz, overlap)
+
+    boxes: List[np.ndarray] = []
+    confs: List[np.ndarray] = []
+    classes: List[np.ndarray] = []
+    tiles: List[np.ndarray] = []
+    for start in range(0, len(offsets), max(1, max_batch)):
+        chunk = offsets[start:start + max_batch]
+        crops = [np.ascontiguousarray(pixels[y:y + imgsz, x:x + imgsz]) for x, y in chunk]
+        results = model.predict(source=crops, imgsz=imgsz, conf=conf, iou=iou, device=device, verbose=False)
+        for index, (x, y), r in zip(range(start, start + len(chunk)), chunk, results):
+            if getattr(r, "boxes", None) is None or len(r.boxes) == 0:
+                continue
+            # x1, y1, x2, y2, conf, cls
+            data = r.boxes.data.cpu().numpy()
+            boxes.append(data[:, :4] + np.array([x, y, x, y], dtype=data.dtype))
+            confs.append(data[:, 4])
+            classes.append(data[:, 5].astype(np.int64))
+            tiles.append(np.full(len(data), index, dtype=np.int64))
+
+    if not boxes:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    if len(offsets) == 1:
+        # nothing to stitch; keep the model's own output
+        return boxes[0], confs[0], classes[0]
+    return merge_detections(
+        np.concatenate(boxes),
+        np.concatenate(confs),
+        np.concatenate(classes),
+        np.concatenate(tiles),
+        tile_rects(offsets, imgsz, width, height),
+        width,
+        height,
+        method=merge,
+    )
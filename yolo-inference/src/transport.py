@@ -0,0 +1,142 @@
+import base64
+import io
+from dataclasses import dataclass
+from typing import Any, Dict, List, Sequence, Tuple, Type, TypeVar, Union
+
+from PIL import Image
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import UploadFile
+
+# Every image endpoint accepts the same three transports:
+# - application/json: the image inlined as base64 next to the tunables (original API)
+# - application/octet-stream or image/*: the raw file as the body, tunables as query params
+# - multipart/form-data: the file as an upload, tunables as form fields or query params
+
+M = TypeVar("M", bound=BaseModel)
+
+
+@dataclass
+class EncodedImage:
+    """An image as it arrived: raw file bytes, or base64 text still to be decoded."""
+
+    data: Union[bytes, str]
+
+    def to_bytes(self, validate: bool = True) -> bytes:
+        if isinstance(self.data, bytes):
+            return self.data
+        return base64.b64decode(self.data, validate=validate)
+
+    def to_pil(self, validate: bool = True) -> Image.Image:
+        return Image.open(io.BytesIO(self.to_bytes(validate=validate))).convert("RGB")
+
+
+def _content_type(request: Request) -> str:
+    return request.headers.get("content-type", "").split(";")[0].strip().lower()
+
+
+async def read_image_request(
+    request: Request,
+    field: str,
+    many: bool = False,
+    required: bool = True,
+    aliases: Sequence[str] = ("file",),
+) -> Tuple[List[EncodedImage], Dict[str, Any]]:
+    """
+    Pull the image(s) in `field` and the remaining parameters out of a request,
+    whichever transport it used. Images are returned still encoded so that the
+    caller can decode them off the event loop. Multipart uploads may also use
+    one of `aliases` as the field name.
+
+    Starlette caches the parsed body, so this can be called again with another
+    field when an endpoint accepts alternative image fields.
+    """
+    content_type = _content_type(request)
+    params: Dict[str, Any] = dict(request.query_params)
+
+    if content_type == "application/json" or content_type.endswith("+json"):
+        try:
+            body = await request.json()
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+        if not isinstance(body, dict):
+            raise HTTPException(status_code=400, detail="JSON body must be an object")
+        body = dict(body)
+        value = body.pop(field, None)
+        params.update(body)
+        if value is None:
+            if not required:
+                return [], params
+            raise HTTPException(status_code=400, detail=f"missing {field}")
+        values = value if many and isinstance(value, list) else [value]
+        if not all(isinstance(v, str) for v in values):
+            raise HTTPException(status_code=400, detail=f"{field} must be base64 string(s)")
+        return [EncodedImage(v) for v in values], params
+
+    if content_type == "multipart/form-data":
+        form = await request.form()
+        names = (field, *aliases)
+        uploads = next((form.getlist(name) for name in names if form.getlist(name)), [])
+        if not many:
+            uploads = uploads[:1]
+        images: List[EncodedImage] = []
+        for item in uploads:
+            if isinstance(item, UploadFile):
+                images.append(EncodedImage(await item.read()))
+            else:
+                # a base64 string sent as a plain form field
+                images.append(EncodedImage(item))
+        for key, value in form.multi_items():
+            if key not in names and not isinstance(value, UploadFile):
+                params[key] = value
+        if not images:
+            if not required:
+                return [], params
+            raise HTTPException(status_code=400, detail=f"missing {field} upload")
+        return images, params
+
+    if content_type == "application/octet-stream" or content_type.startswith("image/"):
+        body = await request.body()
+        if not body:
+            if not required:
+                return [], params
+            raise HTTPException(status_code=400, detail="empty request body")
+        return [EncodedImage(body)], params
+
+    raise HTTPException(
+        status_code=415,
+        detail="expected application/json, multipart/form-data, application/octet-stream or image/*",
+    )
+
+
+def parse_params(model: Type[M], params: Dict[str, Any]) -> M:
+    # query and form values arrive as strings; pydantic coerces them
+    try:
+        return model.model_validate(params)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
+def image_request_body(model: Type[BaseModel], field: str, many: bool = False) -> Dict[str, Any]:
+    """`openapi_extra` documenting the transports accepted by read_image_request."""
+    binary = {"type": "string", "format": "binary"}
+    params_schema = model.model_json_schema()
+    form_schema = {
+        "type": "object",
+        "properties": {
+            **params_schema.get("properties", {}),
+            field: {"type": "array", "items": binary} if many else binary,
+        },
+        "required": [field],
+    }
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {"schema": params_schema},
+                "multipart/form-data": {"schema": form_schema},
+                "application/octet-stream": {"schema": binary},
+            },
+        }
+    }
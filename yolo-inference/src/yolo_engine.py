@@ -0,0 +1,166 @@
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from PIL import Image
+
+from executor import model_lock
+from metrics import observe
+from model_pool import ModelPool
+from result_cache import weights_signature
+
+# Shared by yolo-inference and pyservice: device resolution, model loading
+# deduplicated by weights content, batched predict and response conversion.
+
+Source = Union[Image.Image, np.ndarray]
+# ([[x1, y1, x2, y2]], [conf], [class id]) as plain Python lists
+DetectionLists = Tuple[List[List[float]], List[float], List[int]]
+
+
+@lru_cache(maxsize=1)
+def default_device() -> str:
+    """Resolved once per process; probing mps/cuda on every request is not free."""
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+_hash_lock = threading.Lock()
+# path -> (weights_signature, content hash)
+_hashes: Dict[str, Tuple[str, str]] = {}
+
+
+def weights_hash(path: str) -> str:
+    """Content hash of a weights file, recomputed only when its size or mtime changes."""
+    signature = weights_signature(path)
+    with _hash_lock:
+        cached = _hashes.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    digest = h.hexdigest()
+    with _hash_lock:
+        _hashes[path] = (signature, digest)
+    return digest
+
+
+def detection_lists(r: Any) -> DetectionLists:
+    """Boxes, confidences and class ids of one ultralytics result, converted in bulk."""
+    boxes = getattr(r, "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return [], [], []
+    # x1, y1, x2, y2, conf, cls; float64 so tolist() yields Python floats directly
+    data = boxes.data.cpu().numpy().astype(np.float64)
+    return data[:, :4].tolist(), data[:, 4].tolist(), data[:, 5].astype(np.int64).tolist()
+
+
+def record_speed(results: Sequence[Any], model_name: Optional[str] = None) -> None:
+    """The per-image preprocess / inference / postprocess times ultralytics measured, as metric stages."""
+    for r in results:
+        speed = getattr(r, "speed", None) or {}
+        for stage, key in (("preprocess", "preprocess"), ("forward", "inference"), ("postprocess", "postprocess")):
+            if speed.get(key) is not None:
+                observe(stage, speed[key] / 1000.0, model_name)
+
+
+def detection_dicts(
+    xyxy: List[List[float]], confs: List[float], classes: List[int], names: Dict[int, str]
+) -> List[Dict[str, Any]]:
+    return [
+        {"box": box, "conf": c, "label": names.get(cls, str(cls))}
+        for box, c, cls in zip(xyxy, confs, classes)
+    ]
+
+
+class YoloEngine:
+    """
+    YOLO models loaded through a ModelPool, keyed by the content hash of their
+    weights (plus a variant: the backend and its export settings), so several names
+    pointing at the same file share one loaded model. When a name's weights
+    file changes, the model it pointed at is dropped unless another name still
+    uses it.
+    """
+
+    def __init__(self, pool: ModelPool, device: Optional[str] = None, warmup_imgsz: int = 640) -> None:
+        self.pool = pool
+        self.device = device or default_device()
+        self.warmup_imgsz = warmup_imgsz
+        self._lock = threading.Lock()
+        # name -> pool key
+        self._aliases: Dict[str, str] = {}
+
+    def model(
+        self,
+        name: str,
+        path: str,
+        variant: str = "torch",
+        load: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        """
+        The loaded model for `path`. `load` replaces the default load + warmup
+        (e.g. to export another backend); it is only called on a miss.
+        """
+        key = f"{variant}:{weights_hash(path)}"
+        with self._lock:
+            previous = self._aliases.get(name)
+            self._aliases[name] = key
+            stale = previous is not None and previous != key and previous not in self._aliases.values()
+        if stale:
+            self.pool.evict(previous, reason="weights changed")
+        return self.pool.get(key, load or (lambda: self.load(path)), signature=key)
+
+    def owns(self, key: str) -> bool:
+        """Whether a pool key holds one of this engine's models."""
+        with self._lock:
+            return key in self._aliases.values()
+
+    def label(self, key: str) -> str:
+        """The names sharing pool key `key` ("a+b"), or the key itself."""
+        with self._lock:
+            names = sorted(name for name, k in self._aliases.items() if k == key)
+        return "+".join(names) or key
+
+    def loaded_names(self) -> List[str]:
+        resident = set(self.pool.keys())
+        with self._lock:
+            return sorted(name for name, key in self._aliases.items() if key in resident)
+
+    def load(self, path: str) -> Any:
+        """A freshly loaded and warmed-up model, bypassing the pool."""
+        from ultralytics import YOLO
+
+        model = YOLO(path)
+        self.warmup(model)
+        return model
+
+    def warmup(self, model: Any, imgsz: Optional[int] = None, device: Optional[str] = None) -> None:
+        # helps avoid first-request latency spikes
+        size = imgsz or self.warmup_imgsz
+        dummy = np.zeros((size, size, 3), dtype=np.uint8)
+        with model_lock(model):
+            model.predict(source=dummy, imgsz=size, conf=0.25, iou=0.45, device=device or self.device, verbose=False)
+
+    def predict(
+        self,
+        model: Any,
+        sources: Union[Source, Sequence[Source]],
+        imgsz: int,
+        conf: float,
+        iou: float,
+        device: Optional[str] = None,
+        name: Optional[str] = None,
+    ) -> List[DetectionLists]:
+        """One predict call over a single image or a batch; detection lists per image."""
+        batch = list(sources) if isinstance(sources, (list, tuple)) else [sources]
+        with model_lock(model):
+            results = model.predict(
+                source=batch, imgsz=imgsz, conf=conf, iou=iou, device=device or self.device, verbose=False
+            )
+        record_speed(results, name)
+        return [detection_lists(r) for r in results]
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from tiling import predict_tiled, tile_offsets  # noqa: E402
+
+IMGSZ = 640
+WIDTH, HEIGHT = 640, 2000
+OVERLAP = 0.2
+
+# x1, y1, x2, y2, conf, cls in page pixels
+PAGE_BOXES = np.array(
+    [
+        [50, 100, 300, 200, 0.9, 0],  # inside tile 0 only
+        [50, 550, 300, 600, 0.8, 1],  # whole in tiles 0 and 1 (their overlap strip)
+        [350, 600, 600, 700, 0.7, 0],  # cut at tile 0's bottom edge, whole in tile 1
+        [50, 1900, 300, 1950, 0.6, 2],  # inside the last tile only
+    ],
+    dtype=np.float32,
+)
+
+
+class _Boxes:
+    def __init__(self, data: np.ndarray) -> None:
+        self.data = self
+        self._data = data
+
+    def cpu(self) -> "_Boxes":
+        return self
+
+    def numpy(self) -> np.ndarray:
+        return self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class _Result:
+    def __init__(self, data: np.ndarray) -> None:
+        self.boxes = _Boxes(data)
+
+
+class _TileModel:
+    """Reports `boxes` clipped to each tile, in tile coordinates, as a detector would."""
+
+    def __init__(self, boxes: np.ndarray = PAGE_BOXES) -> None:
+        self.boxes = boxes
+        self.offsets = [tuple(o) for o in tile_offsets(WIDTH, HEIGHT, IMGSZ, OVERLAP)]
+        self.calls = 0
+        self.seen = 0
+
+    def predict(self, source, imgsz, conf, iou, device, verbose):
+        self.calls += 1
+        results = []
+        for crop in source:
+            assert crop.shape == (IMGSZ, IMGSZ, 3)
+            x, y = self.offsets[self.seen]
+            self.seen += 1
+            rows = []
+            for x1, y1, x2, y2, score, cls in self.boxes:
+                cx1, cy1 = max(x1, x) - x, max(y1, y) - y
+                cx2, cy2 = min(x2, x + IMGSZ) - x, min(y2, y + IMGSZ) - y
+                if cx2 > cx1 and cy2 > cy1:
+                    # the same object scores a little differently in each tile
+                    rows.append([cx1, cy1, cx2, cy2, score - 0.01 * self.seen, cls])
+            results.append(_Result(np.array(rows, dtype=np.float32).reshape(-1, 6)))
+        return results
+
+
+def _sorted(xyxy: np.ndarray) -> np.ndarray:
+    return xyxy[np.lexsort((xyxy[:, 0], xyxy[:, 1]))]
+
+
+def test_predict_tiled_merges_duplicates_across_tiles():
+    model = _TileModel()
+    page = Image.new("RGB", (WIDTH, HEIGHT), "white")
+    for merge in ("nms", "wbf"):
+        model.seen = 0
+        xyxy, confs, classes = predict_tiled(
+            model, page, IMGSZ, 0.25, 0.45, "cpu", overlap=OVERLAP, merge=merge, max_batch=2
+        )
+        assert len(model.offsets) > 2
+        assert model.seen == len(model.offsets)
+        np.testing.assert_allclose(_sorted(xyxy), _sorted(PAGE_BOXES[:, :4]))
+        assert len(confs) == len(classes) == len(PAGE_BOXES)
+        assert sorted(classes.tolist()) == sorted(PAGE_BOXES[:, 5].astype(int).tolist())
+    # tiles go through the model in batches of max_batch
+    assert model.calls == 2 * -(-len(model.offsets) // 2)
+
+
+def test_predict_tiled_without_detections():
+    model = _TileModel(PAGE_BOXES[:0])
+    page = Image.new("RGB", (WIDTH, HEIGHT), "white")
+    xyxy, confs, classes = predict_tiled(model, page, IMGSZ, 0.25, 0.45, "cpu", overlap=OVERLAP)
+    assert xyxy.shape == (0, 4) and len(confs) == 0 and len(classes) == 0